@@ -10,6 +10,12 @@ Replaces auto-approve-memory.sh for cross-platform compatibility
 
 import json
 import sys
+import time
+
+try:
+    import kumiho_metrics
+except ImportError:  # metrics are optional; never block approvals
+    kumiho_metrics = None
 
 
 def main() -> None:
@@ -39,4 +45,11 @@ def main() -> None:
 
 
 if __name__ == "__main__":
-    main()
+    started = time.monotonic()
+    outcome = "error"
+    try:
+        main()
+        outcome = "ok"
+    finally:
+        if kumiho_metrics is not None:
+            kumiho_metrics.record_hook("auto-approve-memory", started, outcome)
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""Startup benchmark for run_kumiho_mcp.py against local stand-ins.
+
+Runs the launcher end to end with a mock control plane and a stub
+``kumiho.mcp_server`` in a throwaway runtime home, and reports how long it
+takes until the server process starts (time-to-exec) and until the first
+JSON-RPC response arrives.  ``cold`` runs start from an empty runtime home
+(no discovery, DNS or config caches; only the pre-provisioned venv is kept),
+``warm`` runs reuse whatever the previous launch left behind.
+
+Usage (from kumiho-claude/ or repo root):
+    python kumiho-claude/scripts/bench_startup.py --runs 20
+    python kumiho-claude/scripts/bench_startup.py --runs 20 --update-baseline
+
+Results are compared with ``bench_startup_baseline.json``; the exit code is 1
+when a p50 or p95 regresses by more than the threshold.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import venv
+from pathlib import Path
+
+import run_kumiho_mcp as bootstrap
+from mock_control_plane import MockControlPlane
+
+BASELINE_FILE = Path(__file__).resolve().with_name("bench_startup_baseline.json")
+DEFAULT_THRESHOLD = 0.25
+# Differences below this are scheduler noise, whatever the ratio says.
+NOISE_FLOOR_MS = 15.0
+STUB_PACKAGE_SPEC = "kumiho-bench-stub==0"
+RUN_TIMEOUT = 60.0
+METRICS = ("time_to_exec_ms", "time_to_first_response_ms")
+SCENARIOS = ("cold", "warm")
+
+STUB_SERVER = '''\
+"""Benchmark stand-in for kumiho.mcp_server: answers every request at once."""
+import json
+import os
+import sys
+import time
+
+_STARTED = time.time()
+
+
+def main():
+    marker = os.environ.get("KUMIHO_BENCH_EXEC_FILE")
+    if marker:
+        record = {"started": _STARTED, "endpoint": os.environ.get("KUMIHO_SERVER_ENDPOINT", "")}
+        with open(marker, "w", encoding="utf-8") as handle:
+            handle.write(json.dumps(record))
+    delay = float(os.environ.get("KUMIHO_BENCH_STUB_IMPORT_MS") or 0) / 1000
+    if delay:
+        time.sleep(delay)
+    for line in sys.stdin:
+        try:
+            message = json.loads(line)
+        except ValueError:
+            continue
+        if "id" not in message:
+            continue
+        result = {"protocolVersion": "2024-11-05", "serverInfo": {"name": "kumiho-bench-stub"}, "capabilities": {}}
+        sys.stdout.write(json.dumps({"jsonrpc": "2.0", "id": message["id"], "result": result}) + "\\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+INITIALIZE = {
+    "jsonrpc": "2.0",
+    "id": 1,
+    "method": "initialize",
+    "params": {"protocolVersion": "2024-11-05", "capabilities": {}, "clientInfo": {"name": "bench", "version": "0"}},
+}
+
+
+def _fake_jwt(subject: str = "bench") -> str:
+    def _segment(body: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(body).encode("utf-8")).decode("ascii").rstrip("=")
+
+    claims = {"sub": subject, "exp": int(time.time()) + 24 * 60 * 60}
+    return f"{_segment({'alg': 'none', 'typ': 'JWT'})}.{_segment(claims)}.bench"
+
+
+class _Sandbox:
+    """Throwaway HOME, plugin root and runtime home for one benchmark session."""
+
+    def __init__(self, root: Path, control_plane_url: str, stub_import_ms: float, extra_env: dict[str, str]) -> None:
+        self.root = root
+        self.home = root / "home"
+        self.plugin_root = root / "plugin"
+        self.runtime_home = root / "runtime"
+        self.exec_file = root / "exec-at"
+        self.env = {key: value for key, value in os.environ.items() if not key.startswith(("KUMIHO_", "CLAUDE_"))}
+        self.env.update(
+            {
+                "HOME": str(self.home),
+                "USERPROFILE": str(self.home),
+                "APPDATA": str(self.home / "AppData" / "Roaming"),
+                "LOCALAPPDATA": str(self.home / "AppData" / "Local"),
+                "XDG_CONFIG_HOME": str(self.home / ".config"),
+                "CLAUDE_PLUGIN_ROOT": str(self.plugin_root),
+                "KUMIHO_CLAUDE_HOME": str(self.runtime_home),
+                "KUMIHO_CONFIG_DIR": str(self.home / ".kumiho"),
+                "KUMIHO_CLAUDE_PACKAGE_SPEC": STUB_PACKAGE_SPEC,
+                "KUMIHO_CLAUDE_LOCKFILE": "",
+                "KUMIHO_CONTROL_PLANE_URL": control_plane_url,
+                "KUMIHO_AUTH_TOKEN": _fake_jwt(),
+                "KUMIHO_BENCH_EXEC_FILE": str(self.exec_file),
+                "KUMIHO_BENCH_STUB_IMPORT_MS": str(stub_import_ms),
+            }
+        )
+        self.env.update(extra_env)
+
+    def provision(self) -> None:
+        """Create a real venv holding the stub server and register it as the active runtime.
+
+        The launcher's own manifest and pointer helpers are used so it takes
+        the same verified fast path as a provisioned production runtime.
+        """
+        self.plugin_root.mkdir(parents=True)
+        saved = dict(os.environ)
+        os.environ.update(self.env)
+        try:
+            install_key = bootstrap._runtime_install_key()
+            slot = bootstrap._runtime_slot(install_key)
+            venv.create(slot / "venv", with_pip=False)
+            python_path = bootstrap._venv_python(slot / "venv")
+            site = bootstrap._venv_site_packages(slot / "venv")[0]
+            (site / "kumiho").mkdir()
+            (site / "kumiho" / "__init__.py").write_text("", encoding="utf-8")
+            (site / "kumiho" / "mcp_server.py").write_text(STUB_SERVER, encoding="utf-8")
+            (site / "kumiho_memory").mkdir()
+            (site / "kumiho_memory" / "__init__.py").write_text("", encoding="utf-8")
+            for name in ("kumiho", "kumiho_memory"):
+                dist_info = site / f"{name}-0.0.0.dist-info"
+                dist_info.mkdir()
+                (dist_info / "METADATA").write_text(f"Metadata-Version: 2.1\nName: {name}\nVersion: 0.0.0\n")
+                (dist_info / "RECORD").write_text(f"{name}/__init__.py,,\n", encoding="utf-8")
+            (slot / bootstrap.MARKER_FILE).write_text(install_key, encoding="utf-8")
+            bootstrap._write_install_manifest(slot / bootstrap.INSTALL_MANIFEST_FILE, python_path, install_key)
+            bootstrap._activate_runtime_slot(slot, install_key)
+        finally:
+            os.environ.clear()
+            os.environ.update(saved)
+
+    def reset_caches(self) -> None:
+        """Drop everything a launch caches, keeping only the provisioned runtime."""
+        keep = {bootstrap.RUNTIMES_DIR, bootstrap.RUNTIME_POINTER_FILE}
+        for entry in self.runtime_home.iterdir():
+            if entry.name in keep:
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry)
+            else:
+                entry.unlink()
+        shutil.rmtree(self.home, ignore_errors=True)
+        self.home.mkdir()
+
+    def exec_record(self) -> dict:
+        """What the stub server saw when it started: start time and resolved endpoint."""
+        return json.loads(self.exec_file.read_text(encoding="utf-8"))
+
+
+def _read_first_line(stream, sink: list[float]) -> None:
+    if stream.readline():
+        sink.append(time.monotonic())
+    # Keep draining so the stub never blocks on a full pipe.
+    for _ in stream:
+        pass
+
+
+def _launch_once(sandbox: _Sandbox, launcher: Path) -> dict[str, float]:
+    try:
+        sandbox.exec_file.unlink()
+    except FileNotFoundError:
+        pass
+    started_wall = time.time()
+    started = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, str(launcher)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=sandbox.env,
+        cwd=str(sandbox.root),
+    )
+    responded: list[float] = []
+    reader = threading.Thread(target=_read_first_line, args=(proc.stdout, responded), daemon=True)
+    reader.start()
+    stderr_chunks: list[bytes] = []
+    drainer = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+    drainer.start()
+    try:
+        proc.stdin.write((json.dumps(INITIALIZE) + "\n").encode("utf-8"))
+        proc.stdin.flush()
+        deadline = time.monotonic() + RUN_TIMEOUT
+        while not responded and time.monotonic() < deadline and proc.poll() is None:
+            time.sleep(0.002)
+        proc.stdin.close()
+        proc.wait(timeout=RUN_TIMEOUT)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+    reader.join(timeout=5)
+    drainer.join(timeout=5)
+    if not responded or not sandbox.exec_file.exists():
+        detail = b"".join(stderr_chunks).decode("utf-8", "replace").strip().splitlines()[-10:]
+        raise RuntimeError("launch produced no JSON-RPC response:\n  " + "\n  ".join(detail))
+    exec_at = float(sandbox.exec_record()["started"])
+    return {
+        "time_to_exec_ms": (exec_at - started_wall) * 1000,
+        "time_to_first_response_ms": (responded[0] - started) * 1000,
+    }
+
+
+def _summarize(samples: list[dict[str, float]]) -> dict[str, dict[str, float]]:
+    summary: dict[str, dict[str, float]] = {}
+    for metric in METRICS:
+        values = [sample[metric] for sample in samples]
+        summary[metric] = {
+            "p50": round(bootstrap._percentile(values, 50), 1),
+            "p95": round(bootstrap._percentile(values, 95), 1),
+            "max": round(max(values), 1),
+        }
+    return summary
+
+
+def _compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions: list[str] = []
+    for scenario, metrics in results.items():
+        for metric, stats in metrics.items():
+            reference = baseline.get("results", {}).get(scenario, {}).get(metric, {})
+            for stat in ("p50", "p95"):
+                before = reference.get(stat)
+                if not isinstance(before, (int, float)):
+                    continue
+                after = stats[stat]
+                if after - before > max(before * threshold, NOISE_FLOOR_MS):
+                    regressions.append(
+                        f"{scenario} {metric} {stat}: {after:.1f}ms vs baseline {before:.1f}ms "
+                        f"(+{(after / before - 1) * 100 if before else float('inf'):.0f}%)"
+                    )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark run_kumiho_mcp.py startup against local stand-ins.")
+    parser.add_argument("--runs", type=int, default=10, help="Launches per scenario (default: 10)")
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append", help="Limit to a scenario (repeatable)")
+    parser.add_argument(
+        "--discovery-latency-ms",
+        type=float,
+        default=0.0,
+        help="Delay the mock control plane adds to every discovery response",
+    )
+    parser.add_argument(
+        "--stub-import-ms",
+        type=float,
+        default=0.0,
+        help="Delay the stub server adds before answering, to mimic heavy imports",
+    )
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Extra launcher environment, e.g. KUMIHO_CLAUDE_PROXY=1 (repeatable)",
+    )
+    parser.add_argument("--baseline", default=str(BASELINE_FILE), help="Baseline JSON to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=None,
+        help=f"Allowed slowdown ratio before failing (default: baseline's, else {DEFAULT_THRESHOLD})",
+    )
+    parser.add_argument("--update-baseline", action="store_true", help="Write these results as the new baseline")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    extra_env: dict[str, str] = {}
+    for item in args.env:
+        key, sep, value = item.partition("=")
+        if not sep or not key:
+            parser.error(f"--env expects KEY=VALUE, got {item!r}")
+        extra_env[key] = value
+
+    launcher = Path(bootstrap.__file__).resolve()
+    scenarios = args.scenario or list(SCENARIOS)
+    results: dict[str, dict] = {}
+
+    # A listening socket so endpoint probes against the mock region succeed.
+    grpc_listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    grpc_listener.bind(("127.0.0.1", 0))
+    grpc_listener.listen(64)
+    authority = f"127.0.0.1:{grpc_listener.getsockname()[1]}"
+
+    with tempfile.TemporaryDirectory(prefix="kumiho-bench-") as tmp, MockControlPlane(
+        authority, latency=args.discovery_latency_ms / 1000
+    ) as plane:
+        sandbox = _Sandbox(Path(tmp), plane.url, args.stub_import_ms, extra_env)
+        sandbox.provision()
+        for scenario in scenarios:
+            samples: list[dict[str, float]] = []
+            try:
+                if scenario == "warm":
+                    sandbox.reset_caches()
+                    _launch_once(sandbox, launcher)  # primes the caches; not timed
+                before = plane.request_count()
+                for _ in range(max(1, args.runs)):
+                    if scenario == "cold":
+                        sandbox.reset_caches()
+                    samples.append(_launch_once(sandbox, launcher))
+            except RuntimeError as exc:
+                print(f"FAIL: {scenario} launch: {exc}", file=sys.stderr)
+                return 2
+            results[scenario] = _summarize(samples)
+            results[scenario]["discovery_requests"] = plane.request_count() - before
+    grpc_listener.close()
+
+    metrics_only = {scenario: {m: body[m] for m in METRICS} for scenario, body in results.items()}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"Startup over {args.runs} launch(es) per scenario:")
+        print(f"{'scenario':<8} {'metric':<27} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+        for scenario, body in results.items():
+            for metric in METRICS:
+                stats = body[metric]
+                print(f"{scenario:<8} {metric:<27} {stats['p50']:>9.1f} {stats['p95']:>9.1f} {stats['max']:>9.1f}")
+            print(f"{scenario:<8} {'discovery requests':<27} {body['discovery_requests']:>9}")
+
+    baseline_path = Path(args.baseline).expanduser()
+    baseline = bootstrap._read_state_json(baseline_path)
+    threshold = args.threshold if args.threshold is not None else float(baseline.get("threshold", DEFAULT_THRESHOLD))
+
+    if args.update_baseline:
+        body = {
+            "threshold": threshold,
+            "runs": args.runs,
+            "platform": sys.platform,
+            "python": ".".join(map(str, sys.version_info[:2])),
+            "results": {**baseline.get("results", {}), **metrics_only},
+        }
+        baseline_path.write_text(json.dumps(body, indent=2) + "\n", encoding="utf-8")
+        print(f"Wrote baseline to {baseline_path}.")
+        return 0
+
+    if not baseline:
+        print(f"No baseline at {baseline_path}; pass --update-baseline to record one.")
+        return 0
+    regressions = _compare(metrics_only, baseline, threshold)
+    if regressions:
+        print(f"FAIL: startup regressed beyond {threshold:.0%} of baseline:", file=sys.stderr)
+        for line in regressions:
+            print(f"  {line}", file=sys.stderr)
+        return 1
+    print(f"PASS: within {threshold:.0%} of baseline ({baseline_path.name})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
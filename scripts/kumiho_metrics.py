@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""Local metrics store shared by the launcher and the plugin hooks.
+
+Every process buffers counters and histograms in a ``Recorder`` and appends
+them as one JSON line to ``metrics.jsonl`` in the runtime home.  Appends are
+a single ``write`` on an ``O_APPEND`` descriptor, so concurrent launchers,
+proxies and hooks never interleave or lose each other's samples.  The
+exporter sums every line (plus the folded totals in ``metrics-totals.json``)
+and renders OpenMetrics text.
+
+Usage:
+    python kumiho_metrics.py                     # print OpenMetrics text
+    python kumiho_metrics.py --output node.prom  # write for a textfile collector
+    python kumiho_metrics.py --serve 9464        # serve on 127.0.0.1:9464/metrics
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+
+try:
+    import msvcrt
+except ImportError:  # POSIX
+    msvcrt = None  # type: ignore[assignment]
+
+METRICS_FILE = "metrics.jsonl"
+TOTALS_FILE = "metrics-totals.json"
+LOCK_FILE = "metrics.lock"
+# Fold the append log into the totals file once it grows past this.
+COMPACT_BYTES = 256 * 1024
+# Stop appending past this if compaction cannot keep up (e.g. no file locking).
+MAX_LOG_BYTES = 64 * COMPACT_BYTES
+# Seconds; shared by every histogram so lines from any process can be summed.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "kumiho_claude_launches": "Launcher runs by outcome.",
+    "kumiho_claude_launch_phase_seconds": "Time spent in each launcher startup phase.",
+    "kumiho_claude_discovery_attempts": "Control-plane discovery requests by result.",
+    "kumiho_claude_discovery_seconds": "Control-plane discovery request latency.",
+    "kumiho_claude_installs": "Runtime venv installs by source and result.",
+    "kumiho_claude_install_seconds": "Runtime venv install duration.",
+    "kumiho_claude_hook_runs": "Plugin hook executions by outcome.",
+    "kumiho_claude_hook_seconds": "Plugin hook execution time.",
+    "kumiho_claude_tool_calls": "MCP tool calls relayed by the proxy, by tool and result.",
+    "kumiho_claude_tool_call_seconds": "MCP tool call latency seen by the proxy.",
+    "kumiho_claude_tool_bytes": "JSON-RPC payload bytes relayed by the proxy.",
+}
+
+
+def state_dir() -> Path:
+    """Mirror of ``run_kumiho_mcp._state_dir`` (the hooks cannot import it)."""
+    override = os.getenv("KUMIHO_CLAUDE_HOME", "").strip()
+    if override:
+        return Path(override).expanduser()
+    if os.name == "nt":
+        base = os.getenv("LOCALAPPDATA", str(Path.home() / "AppData" / "Local"))
+        return Path(base) / "kumiho-claude"
+    xdg = os.getenv("XDG_CACHE_HOME", "").strip()
+    if xdg:
+        return Path(xdg) / "kumiho-claude"
+    return Path.home() / ".cache" / "kumiho-claude"
+
+
+def _series_key(name: str, labels: dict[str, str]) -> str:
+    return json.dumps([name, sorted((key, str(value)) for key, value in labels.items())], separators=(",", ":"))
+
+
+class Recorder:
+    """Buffer metrics in memory and append them in one line on ``flush``."""
+
+    def __init__(self) -> None:
+        self._counters: dict[str, float] = {}
+        self._histograms: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = _series_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        key = _series_key(name, labels)
+        with self._lock:
+            hist = self._histograms.setdefault(key, {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0})
+            index = next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))
+            hist["buckets"][index] += 1
+            hist["sum"] += seconds
+            hist["count"] += 1
+
+    def flush(self) -> None:
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            histograms, self._histograms = self._histograms, {}
+        if not counters and not histograms:
+            return
+        line = json.dumps({"t": round(time.time(), 3), "c": counters, "h": histograms}, separators=(",", ":"))
+        try:
+            path = state_dir() / METRICS_FILE
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                size = os.fstat(fd).st_size
+                if size < MAX_LOG_BYTES:
+                    os.write(fd, (line + "\n").encode("utf-8"))
+            finally:
+                os.close(fd)
+            if size >= COMPACT_BYTES:
+                compact()
+            if size >= MAX_LOG_BYTES:
+                print(f"[kumiho-claude] Dropped metrics: {path} is over {MAX_LOG_BYTES} bytes.", file=sys.stderr)
+        except Exception as exc:
+            print(f"[kumiho-claude] Could not write metrics: {exc}", file=sys.stderr)
+
+
+def record_hook(hook: str, started: float, outcome: str = "ok") -> None:
+    """Count one hook run; never raises, hooks must not fail on metrics."""
+    try:
+        recorder = Recorder()
+        recorder.inc("kumiho_claude_hook_runs", hook=hook, outcome=outcome)
+        recorder.observe("kumiho_claude_hook_seconds", time.monotonic() - started, hook=hook)
+        recorder.flush()
+    except Exception:
+        pass
+
+
+def _merge(totals: dict, record: dict) -> None:
+    counters = totals.setdefault("c", {})
+    for key, value in (record.get("c") or {}).items():
+        if isinstance(value, (int, float)):
+            counters[key] = counters.get(key, 0) + value
+    histograms = totals.setdefault("h", {})
+    for key, hist in (record.get("h") or {}).items():
+        if not isinstance(hist, dict) or len(hist.get("buckets") or []) != len(BUCKETS) + 1:
+            continue
+        into = histograms.setdefault(key, {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0})
+        into["buckets"] = [a + b for a, b in zip(into["buckets"], hist["buckets"])]
+        into["sum"] += hist.get("sum", 0.0)
+        into["count"] += hist.get("count", 0)
+
+
+def _read_lines(path: Path, totals: dict) -> None:
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            for raw in handle:
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    continue  # a torn final line from a crashed writer
+                if isinstance(record, dict):
+                    _merge(totals, record)
+    except OSError:
+        pass
+
+
+def _read_totals(path: Path) -> dict:
+    try:
+        totals = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return totals if isinstance(totals, dict) else {}
+
+
+def _lock(handle, *, shared: bool, blocking: bool) -> bool:
+    """Lock *handle* with ``flock`` or, on Windows, ``msvcrt``.
+
+    ``msvcrt`` has no shared locks, so readers take the exclusive one there.
+    Returns False if the lock is busy (non-blocking) or cannot be taken.
+    """
+    try:
+        if fcntl is not None:
+            mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            fcntl.flock(handle.fileno(), mode if blocking else mode | fcntl.LOCK_NB)
+        elif msvcrt is not None:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        else:
+            return False
+    except OSError:
+        return False
+    return True
+
+
+def compact() -> None:
+    """Fold the append log into the totals file.
+
+    The log is renamed aside first so writers start a fresh file.  The new
+    totals name the files they absorbed and replace the old totals
+    atomically, so a crash before the folded files are removed cannot count
+    them twice.  Skipped when another process holds the lock, or where no
+    file locking is available (``Recorder.flush`` then caps the log size).
+    """
+    import tempfile
+
+    directory = state_dir()
+    with (directory / LOCK_FILE).open("a+b") as lock:
+        if not _lock(lock, shared=False, blocking=False):
+            return
+        folding = directory / f"{METRICS_FILE}.{os.getpid()}-{time.time_ns()}.folding"
+        # On Windows the rename fails while a writer has the log open; retry next time.
+        with contextlib.suppress(OSError):
+            os.replace(directory / METRICS_FILE, folding)
+        totals = _read_totals(directory / TOTALS_FILE)
+        already = set(totals.get("folded") or [])
+        pending = [path for path in sorted(directory.glob(f"{METRICS_FILE}.*.folding")) if path.name not in already]
+        if pending:
+            # Let a writer that opened the old file before the rename finish.
+            time.sleep(0.05)
+            for path in pending:
+                _read_lines(path, totals)
+            totals["folded"] = [path.name for path in pending]
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=".metrics-", suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                json.dump(totals, handle, separators=(",", ":"))
+            os.replace(tmp, directory / TOTALS_FILE)
+        for path in directory.glob(f"{METRICS_FILE}.*.folding"):
+            with contextlib.suppress(OSError):
+                path.unlink()
+
+
+def collect() -> dict:
+    """Sum the totals, any files mid-fold and the live log.
+
+    Holds the compaction lock shared so a concurrent fold cannot make a
+    counter dip (log renamed, totals not yet replaced) or count twice.
+    """
+    directory = state_dir()
+    try:
+        lock = (directory / LOCK_FILE).open("a+b")
+    except OSError:
+        lock = None
+    try:
+        if lock is not None:
+            _lock(lock, shared=True, blocking=True)
+        totals = _read_totals(directory / TOTALS_FILE)
+        already = set(totals.get("folded") or [])
+        for path in sorted(directory.glob(f"{METRICS_FILE}.*.folding")):
+            if path.name not in already:
+                _read_lines(path, totals)
+        _read_lines(directory / METRICS_FILE, totals)
+    finally:
+        if lock is not None:
+            lock.close()
+    return totals
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: list, extra: tuple[str, str] | None = None) -> str:
+    pairs = [*labels, *([extra] if extra else [])]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _format_number(value: float) -> str:
+    return repr(round(float(value), 6)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render_openmetrics(totals: dict | None = None) -> str:
+    totals = collect() if totals is None else totals
+    families: dict[str, list[str]] = {}
+    kinds: dict[str, str] = {}
+    for key, value in sorted((totals.get("c") or {}).items()):
+        name, labels = json.loads(key)
+        kinds[name] = "counter"
+        families.setdefault(name, []).append(f"{name}_total{_format_labels(labels)} {_format_number(value)}")
+    for key, hist in sorted((totals.get("h") or {}).items()):
+        name, labels = json.loads(key)
+        kinds[name] = "histogram"
+        lines = families.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip([*BUCKETS, float("inf")], hist["buckets"]):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', le))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(hist['sum'])}")
+        lines.append(f"{name}_count{_format_labels(labels)} {hist['count']}")
+    out: list[str] = []
+    for name in sorted(families):
+        out.append(f"# TYPE {name} {kinds[name]}")
+        if name in HELP:
+            out.append(f"# HELP {name} {HELP[name]}")
+        out.extend(families[name])
+    out.append("# EOF")
+    return "\n".join(out) + "\n"
+
+
+def serve(port: int) -> None:
+    """Serve ``/metrics`` on localhost until interrupted."""
+    import http.server
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802 - http.server API
+            if self.path.split("?", 1)[0] not in {"/metrics", "/"}:
+                self.send_error(404)
+                return
+            body = render_openmetrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: object) -> None:  # noqa: A002 - http.server API
+            return
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"[kumiho-claude] Serving metrics on http://127.0.0.1:{port}/metrics", file=sys.stderr)
+    with contextlib.suppress(KeyboardInterrupt):
+        server.serve_forever()
+
+
+def main(argv: list[str] | None = None, prog: str | None = None) -> int:
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(prog=prog, description="Export kumiho-claude metrics in OpenMetrics format.")
+    parser.add_argument("--output", help="Write the exposition to this file (atomically) instead of stdout.")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="Serve /metrics on 127.0.0.1:PORT until interrupted.")
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.serve)
+        return 0
+
+    text = render_openmetrics()
+    if args.output:
+        target = Path(args.output).expanduser()
+        fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(text)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, target)
+        return 0
+    sys.stdout.write(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
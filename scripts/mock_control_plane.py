@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""Local stand-in for the control plane's ``/api/discovery/tenant`` endpoint.
+
+Used by ``bench_startup.py`` and ``test_discovery_faults.py`` so launcher
+timings never depend on the real control plane.  Faults (latency, HTTP
+errors, connection resets, truncated bodies, malformed routing) can be
+injected per request or per bearer token.  It can also be run on its own
+and pointed at by hand:
+
+    python kumiho-claude/scripts/mock_control_plane.py --port 8787 --grpc-authority 127.0.0.1:8443
+    python kumiho-claude/scripts/mock_control_plane.py --fault status:503
+    KUMIHO_CONTROL_PLANE_URL=http://127.0.0.1:8787 python kumiho-claude/scripts/run_kumiho_mcp.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import collections
+import http.server
+import json
+import socket
+import struct
+import sys
+import threading
+import time
+from typing import NamedTuple
+
+DISCOVERY_PATH = "/api/discovery/tenant"
+FAULT_KINDS = ("ok", "status", "reset", "truncate", "invalid_json", "no_region", "no_target")
+
+
+class Fault(NamedTuple):
+    """How to answer one discovery request.
+
+    ``kind`` is one of :data:`FAULT_KINDS`; ``status`` applies to
+    ``"status"``; ``latency`` (seconds) is slept before answering, so a
+    latency beyond the client's timeout behaves like a hung control plane.
+    """
+
+    kind: str = "ok"
+    status: int = 200
+    latency: float = 0.0
+
+
+def parse_fault(text: str) -> Fault:
+    """Parse ``KIND[:STATUS][@LATENCY_MS]``, e.g. ``status:503`` or ``ok@2500``."""
+    spec, _, latency_text = text.partition("@")
+    kind, _, status_text = spec.partition(":")
+    if kind not in FAULT_KINDS:
+        raise ValueError(f"unknown fault kind {kind!r}; expected one of {', '.join(FAULT_KINDS)}")
+    status = int(status_text) if status_text else (500 if kind == "status" else 200)
+    latency = float(latency_text) / 1000 if latency_text else 0.0
+    return Fault(kind, status, latency)
+
+
+class MockControlPlane:
+    """Threaded HTTP server answering discovery with a fixed region.
+
+    Every request is recorded in :attr:`requests` as a dict with the bearer
+    token, tenant hint, applied fault and arrival time, so callers can
+    assert on traffic.  Faults queued with :meth:`inject` are consumed one
+    per request (token-specific queues first); once they run out,
+    :attr:`default_fault` applies.
+    """
+
+    def __init__(
+        self,
+        grpc_authority: str,
+        *,
+        latency: float = 0.0,
+        default_fault: Fault | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.grpc_authority = grpc_authority
+        self.latency = latency
+        self.default_fault = default_fault or Fault()
+        self.requests: list[dict] = []
+        self._faults: dict[str | None, collections.deque] = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> MockControlPlane:
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-control-plane", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> MockControlPlane:
+        return self.start()
+
+    def __exit__(self, *_exc) -> None:
+        self.stop()
+
+    def request_count(self) -> int:
+        with self._lock:
+            return len(self.requests)
+
+    def inject(self, *faults: Fault, token: str | None = None) -> None:
+        """Queue *faults* for the next requests, or only for those bearing *token*."""
+        with self._lock:
+            self._faults[token].extend(faults)
+
+    def reset(self, default_fault: Fault | None = None) -> None:
+        """Drop queued faults and recorded requests between scenarios."""
+        with self._lock:
+            self._faults.clear()
+            self.requests.clear()
+            self.default_fault = default_fault or Fault()
+
+    def _next_fault(self, token: str) -> Fault:
+        with self._lock:
+            for key in (token, None):
+                queued = self._faults.get(key)
+                if queued:
+                    return queued.popleft()
+            return self.default_fault
+
+    def region(self) -> dict:
+        return {
+            "region_code": "mock",
+            "server_url": f"https://{self.grpc_authority}",
+            "grpc_authority": self.grpc_authority,
+        }
+
+    def _record(self, entry: dict) -> None:
+        with self._lock:
+            self.requests.append(entry)
+
+    def _handler_class(self) -> type:
+        plane = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:  # noqa: N802 - http.server naming
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    payload = json.loads(raw.decode("utf-8") or "{}")
+                except ValueError:
+                    payload = {}
+                authorization = self.headers.get("Authorization", "")
+                token = authorization[7:] if authorization.startswith("Bearer ") else authorization
+                fault = plane._next_fault(token)
+                plane._record(
+                    {
+                        "path": self.path,
+                        "authorization": authorization,
+                        "tenant_hint": payload.get("tenant_hint") if isinstance(payload, dict) else None,
+                        "fault": fault.kind,
+                        "at": time.monotonic(),
+                    }
+                )
+                delay = plane.latency + fault.latency
+                if delay:
+                    time.sleep(delay)
+                if self.path.rstrip("/") != DISCOVERY_PATH:
+                    self._reply(404, {"error": "not found"})
+                    return
+                self._answer(fault)
+
+            def _answer(self, fault: Fault) -> None:
+                region = plane.region()
+                if fault.kind == "status":
+                    self._reply(fault.status, {"error": f"injected {fault.status}"})
+                elif fault.kind == "reset":
+                    # SO_LINGER with a zero timeout turns close() into a TCP RST.
+                    self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                    self.connection.close()
+                    self.close_connection = True
+                elif fault.kind == "truncate":
+                    data = json.dumps({"region": region}).encode("utf-8")
+                    self._reply(200, data[: len(data) // 2], length=len(data))
+                    self.close_connection = True
+                elif fault.kind == "invalid_json":
+                    self._reply(200, b"<html>upstream error</html>")
+                elif fault.kind == "no_region":
+                    self._reply(200, {"tenant": "mock"})
+                elif fault.kind == "no_target":
+                    self._reply(200, {"region": {"region_code": region["region_code"]}})
+                else:
+                    self._reply(200, {"region": region})
+
+            def _reply(self, status: int, body: dict | bytes, *, length: int | None = None) -> None:
+                data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data) if length is None else length))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up waiting, which is what a hung answer is for
+
+            def log_message(self, *_args) -> None:
+                pass
+
+        return Handler
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for control-plane discovery.")
+    parser.add_argument("--port", type=int, default=8787, help="Port to listen on (default: 8787)")
+    parser.add_argument(
+        "--grpc-authority",
+        default="127.0.0.1:8443",
+        help="host:port returned as the region's gRPC authority (default: 127.0.0.1:8443)",
+    )
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every response")
+    parser.add_argument(
+        "--fault",
+        default="ok",
+        help=f"Answer every request with KIND[:STATUS][@LATENCY_MS]; kinds: {', '.join(FAULT_KINDS)}",
+    )
+    args = parser.parse_args()
+    try:
+        fault = parse_fault(args.fault)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    plane = MockControlPlane(
+        args.grpc_authority, latency=args.latency_ms / 1000, default_fault=fault, port=args.port
+    ).start()
+    print(f"Serving {plane.url}{DISCOVERY_PATH} -> {args.grpc_authority} (Ctrl-C to stop)", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        plane.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -5,22 +5,173 @@ from __future__ import annotations
 
 import argparse
 import base64
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import importlib
+import io
 import json
+import math
 import os
+import queue
+import re
+import runpy
+import selectors
 import shlex
+import shutil
+import signal
+import socket
+import stat
+import struct
 import subprocess
 import sys
+import sysconfig
+import tarfile
+import tempfile
+import threading
 import time
+import traceback
 import urllib.error
 import urllib.parse
 import urllib.request
 import venv
 from pathlib import Path
+from typing import Callable, NamedTuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+
+try:
+    import msvcrt
+except ImportError:  # POSIX
+    msvcrt = None  # type: ignore[assignment]
+
+try:
+    import kumiho_metrics
+except ImportError:  # shipped alongside; metrics are best-effort
+    kumiho_metrics = None  # type: ignore[assignment]
 
 
 DEFAULT_PACKAGE_SPEC = "kumiho[mcp]>=0.9.7 kumiho-memory[all]>=0.3.1"
 MARKER_FILE = ".installed-packages.txt"
+INSTALL_MANIFEST_FILE = ".install-manifest.json"
+RUNTIMES_DIR = "runtimes"
+RUNTIME_POINTER_FILE = "runtime.json"
+RUNTIME_IN_USE_FILE = ".in-use.lock"
+RUNTIME_BUILD_LOG_FILE = "runtime-build.log"
+RUNTIME_BUILD_FAILURES_FILE = "runtime-build-failures.json"
+RUNTIME_BUILD_BACKOFF_BASE = 10 * 60
+RUNTIME_BUILD_BACKOFF_MAX = 24 * 60 * 60
+# Without flock (Windows) a slot counts as in use this long after its last launch.
+RUNTIME_SLOT_GRACE = 7 * 24 * 60 * 60
+BUNDLE_DIR = "bundles"
+BUNDLE_FORMAT = 1
+BUNDLE_HEADER = "kumiho-runtime-bundle.json"
+BUNDLE_SITE_PREFIX = "site-packages"
+REQUIRED_DISTRIBUTIONS = frozenset({"kumiho", "kumiho_memory"})
+IMPORTTIME_REPORT_TOP = 15
+LOCKFILE_NAME = "requirements.lock"
+LOCK_LINE_RE = re.compile(r"^(?P<name>[A-Za-z0-9][A-Za-z0-9._-]*)(?:\[[^\]]*\])?==(?P<version>[^\s;]+)")
+# Seeded by ensurepip; never removed when reconciling against a lockfile.
+BOOTSTRAP_DISTRIBUTIONS = frozenset({"pip", "setuptools", "wheel"})
 DEFAULT_DISCOVERY_USER_AGENT = "kumiho-claude/0.8.1"
+DEFAULT_DISCOVERY_TIMEOUT = 8.0
+DISCOVERY_CACHE_FILE = "discovery-cache.json"
+DEFAULT_DISCOVERY_CACHE_TTL = 24 * 60 * 60
+DISCOVERY_REFRESH_INTERVAL = 60
+DISCOVERY_CACHE_MAX_ENTRIES = 16
+DISCOVERY_HISTORY_FILE = "discovery-history.json"
+DISCOVERY_HISTORY_MAX_ENTRIES = 32
+DISCOVERY_AUTH_BACKOFF_BASE = 5 * 60
+DISCOVERY_AUTH_BACKOFF_MAX = 6 * 60 * 60
+DISCOVERY_LOCK_GRACE = 2.0
+ENDPOINT_BOOK_FILE = "endpoints.json"
+ENDPOINT_BOOK_MAX_PER_TENANT = 8
+ENDPOINT_BOOK_MAX_FAILURES = 3
+DEFAULT_ENDPOINT_PROBE_TIMEOUT = 0.75
+# After the first endpoint answers, others get this long to beat it.
+ENDPOINT_PROBE_WINDOW = 0.1
+# The preferred endpoint is kept unless an alternative is faster by more than this.
+ENDPOINT_PROBE_TIE_MS = 5.0
+ENDPOINT_PROBE_TIE_RATIO = 0.2
+STARTUP_PROFILE_FILE = "startup-profile.jsonl"
+STARTUP_PROFILE_MAX_BYTES = 512 * 1024
+BOOTSTRAP_WORKERS = 4
+# How long optional stages may outlast the required ones before exec.
+BOOTSTRAP_OPTIONAL_GRACE = 0.05
+CONFIG_INDEX_FILE = "config-index.json"
+CONFIG_INDEX_VERSION = 2
+HYDRATED_KEYS = ("KUMIHO_AUTH_TOKEN", "KUMIHO_CONTROL_PLANE_URL", "KUMIHO_TENANT_HINT")
+CREDENTIAL_KEYS = (
+    "api_token",
+    "api_token_expires_at",
+    "control_plane_token",
+    "cp_expires_at",
+    "id_token",
+    "expires_at",
+)
+SUPERVISOR_POLL_INTERVAL = 2.0
+SUPERVISOR_SETTLE_DELAY = 0.3
+SUPERVISOR_INIT_TIMEOUT = 30.0
+SUPERVISOR_STOP_TIMEOUT = 5.0
+# Longer frames are streamed through in pieces of this size, unparsed.
+RELAY_MAX_LINE_BYTES = 1024 * 1024
+PROXY_METRICS_FILE = "proxy-metrics.json"
+PROXY_METRICS_MAX_SESSIONS = 20
+METER_QUEUE_SIZE = 4096
+METER_FLUSH_INTERVAL = 15.0
+METER_LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+DEFAULT_RECALL_CACHE_TTL = 5 * 60
+DEFAULT_RECALL_CACHE_SIZE = 128
+RECALL_INVALIDATING_TOOLS = frozenset(
+    {
+        "kumiho_memory_store",
+        "kumiho_memory_store_execution",
+        "kumiho_memory_consolidate",
+        "kumiho_memory_discover_edges",
+        "kumiho_memory_dream_state",
+        "kumiho_deprecate_item",
+    }
+)
+RECALL_INVALIDATING_PREFIXES = ("kumiho_create_", "kumiho_update_", "kumiho_delete_")
+DEFAULT_RECALL_TOP_SIBLINGS = 3
+DEFAULT_RECALL_MAX_FIELD_CHARS = 400
+# Sibling revision fields the skill never reads when reranking: full-mode
+# recall attaches each sibling's raw conversation artifact and its path.
+RECALL_SIBLING_DROPPED_FIELDS = frozenset({"content", "artifact_location"})
+# Rough bytes-per-token ratio for English JSON; only used for reporting.
+RECALL_BYTES_PER_TOKEN = 4
+COALESCED_TOOLS = frozenset({"kumiho_memory_add_response", "kumiho_memory_discover_edges"})
+COALESCE_FLUSH_DELAY = 2.0
+COALESCE_MAX_BATCH = 16
+COALESCE_DRAIN_TIMEOUT = 30.0
+LAUNCH_LOCK_DIR = "locks"
+LAUNCH_LOCK_POLL_INTERVAL = 0.05
+# Installs can legitimately take minutes; config writes take milliseconds.
+RUNTIME_LOCK_TIMEOUT = 15 * 60
+CONFIG_SYNC_LOCK_TIMEOUT = 10.0
+DOCTOR_CONNECT_TIMEOUT = 3.0
+DOCTOR_IMPORT_TIMEOUT = 10.0
+DOCTOR_JWT_WARN_WINDOW = 24 * 60 * 60
+ZYGOTE_SOCKET_FILE = "zygote.sock"
+ZYGOTE_LOCK_FILE = "zygote.lock"
+ZYGOTE_LOG_FILE = "zygote.log"
+ZYGOTE_PROTOCOL = 1
+ZYGOTE_CONNECT_TIMEOUT = 2.0
+ZYGOTE_PRELOAD_MODULES = ("grpc", "kumiho", "kumiho_memory", "kumiho.mcp_server")
+# Environment the preloaded modules may read at import time; a change retires the zygote.
+ZYGOTE_ENV_PREFIXES = ("KUMIHO_", "GRPC_", "OPENAI_", "ANTHROPIC_")
+ZYGOTE_ENV_IGNORED_PREFIXES = ("KUMIHO_CLAUDE_",)
+ZYGOTE_ENV_KEYS = ("SSL_CERT_FILE", "SSL_CERT_DIR", "REQUESTS_CA_BUNDLE", "HTTPS_PROXY", "HTTP_PROXY", "NO_PROXY")
+DEFAULT_ZYGOTE_IDLE_TIMEOUT = 30 * 60
+
+
+# Process-wide metrics buffer, appended to the shared metrics log on flush.
+_METRICS = kumiho_metrics.Recorder() if kumiho_metrics is not None else None
 
 
 def _state_dir() -> Path:
@@ -44,6 +195,96 @@ def _venv_python(venv_dir: Path) -> Path:
     return venv_dir / "bin" / "python"
 
 
+def _read_state_json(path: Path) -> dict:
+    try:
+        body = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+
+def _write_text_atomic(path: Path, text: str) -> None:
+    """Replace *path* via temp file + rename so readers never see a torn file.
+
+    Symlinks are followed so a linked config keeps its link, and an existing
+    file keeps its permission bits; new files are owner-only.
+    """
+    path = path.resolve()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(text)
+        try:
+            os.chmod(tmp_name, path.stat().st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_name, path)
+    except Exception:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+
+def _write_state_json(path: Path, body: dict) -> None:
+    _write_text_atomic(path, json.dumps(body, indent=2) + "\n")
+
+
+def _try_lock_file(handle) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        elif msvcrt is not None:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock_file(handle) -> None:
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        elif msvcrt is not None:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+    except OSError:
+        pass
+
+
+@contextlib.contextmanager
+def _launch_lock(name: str, timeout: float, *, purpose: str = ""):
+    """Hold an exclusive per-user lock shared by every concurrent launcher.
+
+    Yields True once the lock is held, or False when *timeout* seconds pass
+    first (a timeout of 0 is a single non-blocking try). The OS drops the
+    lock if its holder dies, so a crashed launcher never wedges the others.
+    """
+    lock_dir = _state_dir() / LAUNCH_LOCK_DIR
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    handle = (lock_dir / f"{name}.lock").open("a+b")
+    acquired = False
+    try:
+        deadline = time.monotonic() + timeout
+        waited = False
+        while True:
+            acquired = _try_lock_file(handle)
+            if acquired or time.monotonic() >= deadline:
+                break
+            if purpose and not waited:
+                print(f"[kumiho-claude] Waiting for another launcher to finish {purpose}...", file=sys.stderr)
+                waited = True
+            time.sleep(LAUNCH_LOCK_POLL_INTERVAL)
+        yield acquired
+    finally:
+        if acquired:
+            _unlock_file(handle)
+        handle.close()
+
+
 def _run(cmd: list[str], *, check: bool = True) -> int:
     # Redirect stdout → stderr so pip/venv output never pollutes the MCP
     # stdio channel.  Claude Desktop connects stdout directly to its
@@ -52,14 +293,99 @@ def _run(cmd: list[str], *, check: bool = True) -> int:
     return proc.returncode
 
 
-def _needs_install(python_path: Path, marker_path: Path, package_spec: str) -> bool:
+def _venv_site_packages(venv_dir: Path) -> list[Path]:
+    if os.name == "nt":
+        candidates = [venv_dir / "Lib" / "site-packages"]
+    else:
+        candidates = sorted((venv_dir / "lib").glob("python*/site-packages"))
+    return [path for path in candidates if path.is_dir()]
+
+
+def _normalize_dist_name(name: str) -> str:
+    return re.sub(r"[-_.]+", "_", name).lower()
+
+
+def _snapshot_install(python_path: Path, install_key: str) -> dict:
+    """Fingerprint the managed venv so later launches can verify it by ``stat``.
+
+    RECORD contents are hashed here, once, so the manifest pins exactly which
+    build of each distribution was installed; the per-launch check only
+    compares mtimes and sizes against these entries.
+    """
+    venv_dir = python_path.parent.parent
+    sites: list[dict] = []
+    distributions: dict[str, dict] = {}
+    for site in _venv_site_packages(venv_dir):
+        sites.append({"path": str(site), "mtime_ns": site.stat().st_mtime_ns})
+        for dist_info in sorted(site.glob("*.dist-info")):
+            record = dist_info / "RECORD"
+            try:
+                stat = record.stat()
+                digest = hashlib.sha256(record.read_bytes()).hexdigest()
+            except OSError:
+                continue
+            name, _, version = dist_info.name[: -len(".dist-info")].partition("-")
+            distributions[str(record)] = {
+                "name": name,
+                "version": version,
+                "record_sha256": digest,
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+            }
+    return {
+        "python": str(python_path),
+        "python_mtime_ns": python_path.stat().st_mtime_ns,
+        "install_key": install_key,
+        "site_packages": sites,
+        "distributions": distributions,
+    }
+
+
+def _write_install_manifest(manifest_path: Path, python_path: Path, install_key: str) -> None:
+    try:
+        _write_state_json(manifest_path, _snapshot_install(python_path, install_key))
+    except Exception as exc:
+        print(f"[kumiho-claude] Could not write install manifest: {exc}", file=sys.stderr)
+
+
+def _install_manifest_matches(manifest_path: Path, python_path: Path, install_key: str) -> bool:
+    manifest = _read_state_json(manifest_path)
+    if manifest.get("python") != str(python_path) or manifest.get("install_key") != install_key:
+        return False
+    try:
+        if python_path.stat().st_mtime_ns != manifest["python_mtime_ns"]:
+            return False
+        sites = manifest["site_packages"]
+        distributions = manifest["distributions"]
+        if not sites or not distributions:
+            return False
+        # A site-packages mtime change means a distribution was added or removed.
+        for site in sites:
+            if Path(site["path"]).stat().st_mtime_ns != site["mtime_ns"]:
+                return False
+        names: set[str] = set()
+        for record_path, info in distributions.items():
+            stat = Path(record_path).stat()
+            if stat.st_mtime_ns != info["mtime_ns"] or stat.st_size != info["size"]:
+                return False
+            names.add(_normalize_dist_name(info["name"]))
+    except (OSError, KeyError, TypeError, AttributeError):
+        return False
+    return REQUIRED_DISTRIBUTIONS <= names
+
+
+def _needs_install(python_path: Path, marker_path: Path, install_key: str) -> bool:
     if not python_path.exists():
         return True
 
     marker = marker_path.read_text(encoding="utf-8").strip() if marker_path.exists() else ""
-    if marker != package_spec:
+    if marker != install_key:
         return True
 
+    manifest_path = marker_path.parent / INSTALL_MANIFEST_FILE
+    if _install_manifest_matches(manifest_path, python_path, install_key):
+        return False
+
     check_code = (
         "import importlib.util,sys;"
         "mods=('kumiho.mcp_server','kumiho_memory');"
@@ -70,35 +396,655 @@ def _needs_install(python_path: Path, marker_path: Path, package_spec: str) -> b
         _run([str(python_path), "-c", check_code], check=True)
     except subprocess.CalledProcessError:
         return True
+    # The venv is healthy but drifted from (or predates) the manifest;
+    # re-fingerprint so the next launch can skip the probe again.
+    _write_install_manifest(manifest_path, python_path, install_key)
     return False
 
 
+def _upgrade_pip_requested() -> bool:
+    return os.getenv("KUMIHO_CLAUDE_UPGRADE_PIP", "").strip().lower() in {"1", "true", "yes"}
+
+
 def _install_dependencies(python_path: Path, package_spec: str) -> None:
-    _run([str(python_path), "-m", "pip", "install", "--upgrade", "pip"])
+    if _upgrade_pip_requested():
+        _run([str(python_path), "-m", "pip", "install", "--upgrade", "pip"])
     packages = shlex.split(package_spec) if package_spec else shlex.split(DEFAULT_PACKAGE_SPEC)
     _run([str(python_path), "-m", "pip", "install", "--upgrade", *packages])
+    _precompile_venv(python_path)
+
+
+def _load_lockfile_path() -> Path | None:
+    raw = (os.getenv("KUMIHO_CLAUDE_LOCKFILE", "") or "").strip()
+    if raw and not _looks_like_placeholder(raw):
+        path = Path(raw).expanduser()
+        if path.is_file():
+            return path
+        print(f"[kumiho-claude] Lockfile {path} not found; using the package spec.", file=sys.stderr)
+        return None
+    default = _plugin_root() / LOCKFILE_NAME
+    return default if default.is_file() else None
+
 
+def _load_wheelhouse() -> Path | None:
+    raw = (os.getenv("KUMIHO_CLAUDE_WHEELHOUSE", "") or "").strip()
+    if raw and not _looks_like_placeholder(raw):
+        return Path(raw).expanduser()
+    default = _state_dir() / "wheelhouse"
+    return default if default.is_dir() else None
 
-def _ensure_runtime() -> Path:
+
+def _runtime_install_key() -> str:
+    """Identity of the requested runtime, as recorded in the install marker."""
+    lockfile = _load_lockfile_path()
+    if lockfile is not None:
+        return f"lock:{hashlib.sha256(lockfile.read_bytes()).hexdigest()}"
+    return _resolve_package_spec()
+
+
+def _parse_lockfile(path: Path) -> dict[str, tuple[str, str]]:
+    """Map normalized distribution name to ``(version, requirement_line)``."""
+    text = path.read_text(encoding="utf-8").replace("\\\n", " ")
+    pins: dict[str, tuple[str, str]] = {}
+    for raw_line in text.splitlines():
+        line = raw_line.split(" #", 1)[0].strip()
+        if not line or line.startswith("#"):
+            continue
+        match = LOCK_LINE_RE.match(line)
+        if not match:
+            raise RuntimeError(f"Lockfile {path} has an unpinned or unsupported line: {line[:80]}")
+        pins[_normalize_dist_name(match.group("name"))] = (match.group("version"), line)
+    return pins
+
+
+def _installed_distributions(venv_dir: Path) -> dict[str, str]:
+    installed: dict[str, str] = {}
+    for site in _venv_site_packages(venv_dir):
+        for dist_info in site.glob("*.dist-info"):
+            name, _, version = dist_info.name[: -len(".dist-info")].partition("-")
+            installed[_normalize_dist_name(name)] = version
+    return installed
+
+
+def _install_from_lockfile(python_path: Path, lockfile: Path, wheelhouse: Path | None) -> None:
+    """Reconcile the venv with *lockfile*, touching only distributions that differ.
+
+    Every pin is installed with ``--no-deps`` (the lockfile is the full
+    closure), and with a wheelhouse pip never contacts an index.
+    """
+    pins = _parse_lockfile(lockfile)
+    installed = _installed_distributions(python_path.parent.parent)
+
+    stale = sorted(name for name in installed if name not in pins and name not in BOOTSTRAP_DISTRIBUTIONS)
+    changed = [line for name, (version, line) in sorted(pins.items()) if installed.get(name) != version]
+    print(
+        f"[kumiho-claude] Lockfile {lockfile.name}: {len(changed)} to install, "
+        f"{len(stale)} to remove, {len(pins) - len(changed)} unchanged.",
+        file=sys.stderr,
+    )
+
+    if _upgrade_pip_requested():
+        _run([str(python_path), "-m", "pip", "install", "--upgrade", "pip"])
+    if stale:
+        _run([str(python_path), "-m", "pip", "uninstall", "-y", *stale])
+    if changed:
+        fd, requirements = tempfile.mkstemp(prefix="kumiho-lock-", suffix=".txt")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                handle.write("\n".join(changed) + "\n")
+            cmd = [str(python_path), "-m", "pip", "install", "--no-deps", "-r", requirements]
+            if wheelhouse is not None:
+                cmd[4:4] = ["--no-index", "--find-links", str(wheelhouse)]
+            _run(cmd)
+        finally:
+            os.unlink(requirements)
+    if stale or changed:
+        _precompile_venv(python_path)
+
+
+def _precompile_venv(python_path: Path) -> None:
+    """Byte-compile site-packages now so the first server launch doesn't.
+
+    ``-j 0`` uses one worker per CPU.  Some distributions ship files that do
+    not compile (vendored Python 2 code, templates), so failures are logged
+    rather than fatal.
+    """
+    sites = _venv_site_packages(python_path.parent.parent)
+    if not sites:
+        return
+    print("[kumiho-claude] Precompiling bytecode...", file=sys.stderr)
+    code = _run(
+        [str(python_path), "-m", "compileall", "-q", "-j", "0", *[str(site) for site in sites]],
+        check=False,
+    )
+    if code != 0:
+        print(
+            f"[kumiho-claude] compileall exited with {code}; some modules will compile on first import.",
+            file=sys.stderr,
+        )
+
+
+def _parse_importtime(stderr_text: str) -> list[tuple[int, int, str]]:
+    """Parse ``-X importtime`` output into ``(self_us, cumulative_us, module)`` rows."""
+    rows: list[tuple[int, int, str]] = []
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        self_us, cumulative_us, name = (field.strip() for field in fields)
+        if not (self_us.isdigit() and cumulative_us.isdigit()):
+            continue  # header row
+        rows.append((int(self_us), int(cumulative_us), name))
+    return rows
+
+
+def _report_import_times(python_path: Path) -> int:
+    """Import the server under ``-X importtime`` and print the slowest modules."""
+    proc = subprocess.run(
+        [str(python_path), "-X", "importtime", "-c", "import kumiho.mcp_server, kumiho_memory"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=False,
+    )
+    rows = _parse_importtime(proc.stderr)
+    if proc.returncode != 0:
+        errors = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+        print("[kumiho-claude] Importing kumiho.mcp_server failed:", file=sys.stderr)
+        for line in errors[-10:]:
+            print(f"  {line}", file=sys.stderr)
+        return proc.returncode
+    total_ms = sum(row[0] for row in rows) / 1000
+    print(
+        f"[kumiho-claude] Import time: {total_ms:.1f} ms across {len(rows)} modules "
+        f"(slowest {min(IMPORTTIME_REPORT_TOP, len(rows))} by self time):",
+        file=sys.stderr,
+    )
+    print(f"  {'self ms':>9} {'cumul ms':>9}  module", file=sys.stderr)
+    for self_us, cumulative_us, name in sorted(rows, reverse=True)[:IMPORTTIME_REPORT_TOP]:
+        print(f"  {self_us / 1000:>9.1f} {cumulative_us / 1000:>9.1f}  {name.strip()}", file=sys.stderr)
+    return 0
+
+
+def _resolve_package_spec() -> str:
     raw_spec = os.getenv("KUMIHO_CLAUDE_PACKAGE_SPEC", "").strip()
-    package_spec = DEFAULT_PACKAGE_SPEC if (not raw_spec or _looks_like_placeholder(raw_spec)) else raw_spec
+    return DEFAULT_PACKAGE_SPEC if (not raw_spec or _looks_like_placeholder(raw_spec)) else raw_spec
+
+
+def _runtime_slot(install_key: str) -> Path:
+    """Directory holding the venv, marker and manifest for one install key."""
+    digest = hashlib.sha256(install_key.encode("utf-8")).hexdigest()[:16]
+    return _state_dir() / RUNTIMES_DIR / digest
+
+
+def _runtime_slot_of(python_path: Path) -> Path:
+    return python_path.parent.parent.parent
+
+
+def _served_install_key(python_path: Path) -> str:
+    """Install key of the slot *python_path* belongs to (not necessarily the requested one)."""
+    try:
+        return (_runtime_slot_of(python_path) / MARKER_FILE).read_text(encoding="utf-8").strip()
+    except OSError:
+        return _runtime_install_key()
+
+
+def _active_runtime_slot() -> Path | None:
+    """Last known-good slot from the pointer file, or the pre-slot ``venv`` layout.
+
+    Only a slot whose marker still matches the key it was activated with and
+    whose install verifies is returned.
+    """
     state_dir = _state_dir()
-    state_dir.mkdir(parents=True, exist_ok=True)
+    pointer = _read_state_json(state_dir / RUNTIME_POINTER_FILE)
+    name = pointer.get("slot")
+    if isinstance(name, str) and name and pointer.get("install_key"):
+        slot, install_key = state_dir / RUNTIMES_DIR / Path(name).name, str(pointer["install_key"])
+    else:
+        # Runtimes provisioned before slots existed live directly in the state dir.
+        slot = state_dir
+        try:
+            install_key = (slot / MARKER_FILE).read_text(encoding="utf-8").strip()
+        except OSError:
+            return None
+    python_path = _venv_python(slot / "venv")
+    if not install_key or not python_path.exists():
+        return None
+    if _needs_install(python_path, slot / MARKER_FILE, install_key):
+        return None
+    return slot
 
-    venv_dir = state_dir / "venv"
-    marker_path = state_dir / MARKER_FILE
-    python_path = _venv_python(venv_dir)
 
+def _activate_runtime_slot(slot: Path, install_key: str) -> None:
+    """Point later launches at *slot*; the rename makes the swap atomic."""
+    pointer_path = _state_dir() / RUNTIME_POINTER_FILE
+    pointer = _read_state_json(pointer_path)
+    if pointer.get("slot") == slot.name and pointer.get("install_key") == install_key:
+        return
+    _write_state_json(
+        pointer_path,
+        {"slot": slot.name, "install_key": install_key, "activated_at": round(time.time(), 3)},
+    )
+    print(f"[kumiho-claude] Activated runtime {slot.name}.", file=sys.stderr)
+
+
+# Open in-use handles; kept referenced so they stay open until exec or exit.
+_HELD_SLOTS: list = []
+
+
+def _hold_runtime_slot(slot: Path) -> None:
+    """Mark *slot* as in use for as long as this process (or its exec) runs.
+
+    A shared flock on an inheritable descriptor survives ``os.execv`` into the
+    server and ``fork`` in the zygote, so garbage collection can tell which
+    slots a live session still imports from.
+    """
+    try:
+        handle = (slot / RUNTIME_IN_USE_FILE).open("a+b")
+    except OSError:
+        return
+    try:
+        os.utime(handle.fileno())
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_SH | fcntl.LOCK_NB)
+            os.set_inheritable(handle.fileno(), True)
+    except OSError:
+        pass
+    _HELD_SLOTS.append(handle)
+
+
+@contextlib.contextmanager
+def _claim_runtime_slot(slot: Path):
+    """Yield True when no live session holds *slot*, keeping others out meanwhile."""
+    lock_path = slot / RUNTIME_IN_USE_FILE
+    if fcntl is None:
+        try:
+            idle = time.time() - lock_path.stat().st_mtime >= RUNTIME_SLOT_GRACE
+        except OSError:
+            idle = True
+        yield idle
+        return
+    with lock_path.open("a+b") as handle:
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        yield True
+
+
+def _collect_runtime_slots(keep: set[str]) -> None:
+    """Delete slots that are neither in *keep* nor held by a running session.
+
+    The pre-slot ``venv`` is never collected: existing Claude Desktop
+    entries may still launch through its interpreter.
+    """
+    root = _state_dir() / RUNTIMES_DIR
+    if not root.is_dir():
+        return
+    for slot in sorted(root.iterdir()):
+        if not slot.is_dir() or slot.name in keep:
+            continue
+        with _claim_runtime_slot(slot) as idle:
+            if not idle:
+                continue
+            print(f"[kumiho-claude] Removing unused runtime {slot.name}.", file=sys.stderr)
+            shutil.rmtree(slot, ignore_errors=True)
+
+
+def _runtime_build_failure(install_key: str) -> dict | None:
+    """The recorded background build failure for *install_key*, if any."""
+    entry = _read_state_json(_state_dir() / RUNTIME_BUILD_FAILURES_FILE).get(install_key)
+    return entry if isinstance(entry, dict) else None
+
+
+def _runtime_build_retry_in(failure: dict) -> float:
+    """Seconds until a failed build may be retried (0 when it may run now)."""
+    exponent = max(0, int(failure.get("failures") or 1) - 1)
+    backoff = min(RUNTIME_BUILD_BACKOFF_MAX, RUNTIME_BUILD_BACKOFF_BASE * (2 ** min(exponent, 16)))
+    return max(0.0, float(failure.get("last_failed_at") or 0) + backoff - time.time())
+
+
+def _record_runtime_build_failure(install_key: str, error: str) -> None:
+    path = _state_dir() / RUNTIME_BUILD_FAILURES_FILE
+    failures = _read_state_json(path)
+    previous = failures.get(install_key)
+    count = int(previous.get("failures") or 0) if isinstance(previous, dict) else 0
+    failures[install_key] = {"failures": count + 1, "last_failed_at": round(time.time(), 3), "error": error[:500]}
+    try:
+        _write_state_json(path, failures)
+    except Exception as exc:
+        print(f"[kumiho-claude] Could not record runtime build failure: {exc}", file=sys.stderr)
+
+
+def _clear_runtime_build_failure(install_key: str) -> None:
+    path = _state_dir() / RUNTIME_BUILD_FAILURES_FILE
+    failures = _read_state_json(path)
+    if failures.pop(install_key, None) is None:
+        return
+    try:
+        _write_state_json(path, failures)
+    except Exception:
+        pass
+
+
+def _spawn_runtime_build() -> None:
+    """Build the requested runtime in a detached process; see ``_spawn_discovery_refresh``."""
+    state_dir = _state_dir()
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--build-runtime"]
+    kwargs: dict = {"stdin": subprocess.DEVNULL, "close_fds": True}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    try:
+        with (state_dir / RUNTIME_BUILD_LOG_FILE).open("ab") as log:
+            subprocess.Popen(cmd, stdout=log, stderr=log, **kwargs)
+    except Exception as exc:
+        print(f"[kumiho-claude] Could not start background runtime build: {exc}", file=sys.stderr)
+
+
+def _build_runtime_in_background() -> int:
+    """Body of ``--build-runtime``: provision the requested slot, then swap it in."""
+    with _launch_lock("runtime", 0) as acquired:
+        if not acquired:
+            # Another launcher is installing; it activates the slot when done.
+            return 0
+        install_key = _runtime_install_key()
+        try:
+            _provision_runtime_slot(install_key)
+        except Exception as exc:
+            print(f"[kumiho-claude] Background runtime build failed: {exc}", file=sys.stderr)
+            _record_runtime_build_failure(install_key, str(exc) or type(exc).__name__)
+            return 1
+    return 0
+
+
+def _ensure_runtime(*, allow_stale: bool = True) -> Path:
+    """Return the interpreter of a ready runtime, provisioning one if needed.
+
+    Each install key gets its own venv under ``runtimes/``.  When the
+    requested one is missing but a previously activated runtime still
+    verifies, that one is served (unless *allow_stale* is false) while the
+    new venv is built in a detached process and swapped in for later
+    launches.  Only the very first install blocks the launch.
+    """
+    install_key = _runtime_install_key()
+    _state_dir().mkdir(parents=True, exist_ok=True)
+    slot = _runtime_slot(install_key)
+    python_path = _venv_python(slot / "venv")
+
+    # Fast path without the lock: a matching manifest only needs a few stats.
+    if python_path.exists() and not _needs_install(python_path, slot / MARKER_FILE, install_key):
+        _activate_runtime_slot(slot, install_key)
+        _hold_runtime_slot(slot)
+        return python_path
+
+    fallback = _active_runtime_slot() if allow_stale else None
+    if fallback is not None and fallback != slot:
+        # A spec that cannot build would otherwise start a pip run on every launch.
+        failure = _runtime_build_failure(install_key)
+        retry_in = _runtime_build_retry_in(failure) if failure else 0.0
+        if retry_in:
+            print(
+                f"[kumiho-claude] Runtime for the requested packages failed to build "
+                f"{failure.get('failures')} time(s) (last error: {failure.get('error')}); "
+                f"retrying in {_format_age(retry_in)}, see {_state_dir() / RUNTIME_BUILD_LOG_FILE}. "
+                f"Using {fallback.name} for this session.",
+                file=sys.stderr,
+            )
+        else:
+            _spawn_runtime_build()
+            print(
+                f"[kumiho-claude] Runtime for the requested packages is building in the background; "
+                f"using {fallback.name} for this session.",
+                file=sys.stderr,
+            )
+        _hold_runtime_slot(fallback)
+        return _venv_python(fallback / "venv")
+
+    # Concurrent launchers queue here; whoever gets the lock first installs
+    # and the rest find a matching marker once they get in.
+    with _launch_lock("runtime", RUNTIME_LOCK_TIMEOUT, purpose="installing dependencies") as acquired:
+        if not acquired:
+            raise RuntimeError(
+                f"Timed out after {int(RUNTIME_LOCK_TIMEOUT)}s waiting for another launcher to install dependencies."
+            )
+        _provision_runtime_slot(install_key)
+
+    return python_path
+
+
+def _provision_runtime_slot(install_key: str) -> None:
+    """Install *install_key* into its slot, activate it and collect old slots.
+
+    A matching prebuilt bundle (see ``--build-bundle``) is unpacked instead
+    of running pip when one is present.
+
+    The caller must hold the ``runtime`` launch lock.  A failed install never
+    touches the pointer, so the previous runtime keeps serving.
+    """
+    slot = _runtime_slot(install_key)
+    slot.mkdir(parents=True, exist_ok=True)
+    _hold_runtime_slot(slot)
+    bundle = _find_runtime_bundle(install_key)
+    if bundle is not None and _needs_install(_venv_python(slot / "venv"), slot / MARKER_FILE, install_key):
+        try:
+            _install_runtime_bundle(bundle, slot, install_key)
+        except (RuntimeError, OSError, tarfile.TarError, ValueError) as exc:
+            print(f"[kumiho-claude] Runtime bundle unusable ({exc}); installing with pip.", file=sys.stderr)
+            shutil.rmtree(slot / "venv", ignore_errors=True)
+    _provision_runtime(
+        slot / "venv",
+        _venv_python(slot / "venv"),
+        slot / MARKER_FILE,
+        install_key,
+        _resolve_package_spec(),
+        _load_lockfile_path(),
+    )
+    _activate_runtime_slot(slot, install_key)
+    _clear_runtime_build_failure(install_key)
+    _collect_runtime_slots({slot.name})
+
+
+def _provision_runtime(
+    venv_dir: Path,
+    python_path: Path,
+    marker_path: Path,
+    install_key: str,
+    package_spec: str,
+    lockfile: Path | None,
+) -> None:
     if not python_path.exists():
         print(f"[kumiho-claude] Creating virtualenv: {venv_dir}", file=sys.stderr)
         venv.create(venv_dir, with_pip=True)
 
-    if _needs_install(python_path, marker_path, package_spec):
+    if _needs_install(python_path, marker_path, install_key):
         print("[kumiho-claude] Installing dependencies...", file=sys.stderr)
-        _install_dependencies(python_path, package_spec)
-        marker_path.write_text(package_spec, encoding="utf-8")
+        source = "lockfile" if lockfile is not None else "spec"
+        started = time.monotonic()
+        result = "failed"
+        try:
+            if lockfile is not None:
+                _install_from_lockfile(python_path, lockfile, _load_wheelhouse())
+            else:
+                _install_dependencies(python_path, package_spec)
+            result = "ok"
+        finally:
+            if _METRICS is not None:
+                _METRICS.inc("kumiho_claude_installs", source=source, result=result)
+                _METRICS.observe("kumiho_claude_install_seconds", time.monotonic() - started, source=source)
+                _METRICS.flush()
+        marker_path.write_text(install_key, encoding="utf-8")
+        _write_install_manifest(marker_path.parent / INSTALL_MANIFEST_FILE, python_path, install_key)
 
-    return python_path
+
+def _bundle_platform_tag() -> str:
+    """Platform and Python ABI a bundle's compiled extensions and bytecode are tied to."""
+    tag = f"{sysconfig.get_platform()}-{sys.implementation.cache_tag}{getattr(sys, 'abiflags', '')}"
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", tag)
+
+
+def _bundle_file_name(install_key: str) -> str:
+    digest = hashlib.sha256(install_key.encode("utf-8")).hexdigest()[:16]
+    return f"kumiho-runtime-{_bundle_platform_tag()}-{digest}.tar.gz"
+
+
+def _load_bundle_dir() -> Path:
+    raw = (os.getenv("KUMIHO_CLAUDE_BUNDLE_DIR", "") or "").strip()
+    if raw and not _looks_like_placeholder(raw):
+        return Path(raw).expanduser()
+    return _state_dir() / BUNDLE_DIR
+
+
+def _find_runtime_bundle(install_key: str) -> Path | None:
+    path = _load_bundle_dir() / _bundle_file_name(install_key)
+    return path if path.is_file() else None
+
+
+def _build_runtime_bundle(output: Path | None) -> int:
+    """Pack the requested runtime's site-packages, bytecode included, into one archive.
+
+    Only site-packages travels: a venv's interpreter links and ``bin``
+    scripts embed absolute paths, so the installer recreates the venv and
+    unpacks into it.
+    """
+    python_path = _ensure_runtime(allow_stale=False)
+    install_key = _served_install_key(python_path)
+    sites = _venv_site_packages(python_path.parent.parent)
+    if len(sites) != 1:
+        print(
+            f"[kumiho-claude] Expected one site-packages in {python_path.parent.parent}; found {len(sites)}.",
+            file=sys.stderr,
+        )
+        return 1
+    output = output or _load_bundle_dir() / _bundle_file_name(install_key)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    header = json.dumps(
+        {
+            "format": BUNDLE_FORMAT,
+            "install_key": install_key,
+            "platform": _bundle_platform_tag(),
+            "python": ".".join(map(str, sys.version_info[:3])),
+            "created_at": round(time.time(), 3),
+        },
+        indent=2,
+    ).encode("utf-8")
+
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{output.name}.", suffix=".tmp", dir=str(output.parent))
+    try:
+        with os.fdopen(fd, "wb") as handle, tarfile.open(fileobj=handle, mode="w:gz") as archive:
+            # The header goes first so the installer can validate before extracting anything.
+            info = tarfile.TarInfo(BUNDLE_HEADER)
+            info.size = len(header)
+            info.mtime = int(time.time())
+            archive.addfile(info, io.BytesIO(header))
+            archive.add(str(sites[0]), arcname=BUNDLE_SITE_PREFIX)
+        os.replace(tmp_name, output)
+    except Exception:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_name)
+        raise
+    size_mb = output.stat().st_size / (1024 * 1024)
+    print(f"[kumiho-claude] Wrote runtime bundle {output} ({size_mb:.1f} MiB).", file=sys.stderr)
+    return 0
+
+
+def _extract_bundle_member(archive: tarfile.TarFile, member: tarfile.TarInfo, site: Path) -> None:
+    relative = member.name[len(BUNDLE_SITE_PREFIX):].lstrip("/")
+    if not relative:
+        return
+    if member.issym() or member.islnk() or not (member.isfile() or member.isdir()):
+        raise RuntimeError(f"Bundle member {member.name} is not a regular file or directory.")
+    target = (site / relative).resolve()
+    if site.resolve() not in target.parents:
+        raise RuntimeError(f"Bundle member {member.name} escapes site-packages.")
+    if member.isdir():
+        target.mkdir(parents=True, exist_ok=True)
+        return
+    target.parent.mkdir(parents=True, exist_ok=True)
+    source = archive.extractfile(member)
+    with target.open("wb") as handle:
+        shutil.copyfileobj(source, handle)
+    os.chmod(target, member.mode & 0o755 | 0o600)
+    # Bytecode is only reused when the source mtime matches what was compiled.
+    os.utime(target, (member.mtime, member.mtime))
+
+
+def _install_runtime_bundle(bundle: Path, slot: Path, install_key: str) -> None:
+    """Recreate *slot*'s venv and stream *bundle* into its site-packages.
+
+    The archive is read strictly front to back, so nothing is buffered or
+    unpacked to a temporary location first.  Raises ``RuntimeError`` when
+    the bundle does not match this platform or install key, or the result
+    does not verify against the install marker.
+    """
+    venv_dir = slot / "venv"
+    python_path = _venv_python(venv_dir)
+    marker_path = slot / MARKER_FILE
+    print(f"[kumiho-claude] Installing runtime bundle {bundle.name}...", file=sys.stderr)
+    started = time.monotonic()
+    result = "failed"
+    try:
+        with tarfile.open(str(bundle), mode="r|gz") as archive:
+            first = archive.next()
+            if first is None or first.name != BUNDLE_HEADER:
+                raise RuntimeError(f"{bundle.name} is not a kumiho runtime bundle.")
+            header = json.loads(archive.extractfile(first).read().decode("utf-8"))
+            if header.get("format") != BUNDLE_FORMAT:
+                raise RuntimeError(f"{bundle.name} has unsupported bundle format {header.get('format')!r}.")
+            if header.get("platform") != _bundle_platform_tag():
+                raise RuntimeError(
+                    f"{bundle.name} was built for {header.get('platform')}, not {_bundle_platform_tag()}."
+                )
+            if header.get("install_key") != install_key:
+                raise RuntimeError(f"{bundle.name} was built for a different package spec or lockfile.")
+
+            shutil.rmtree(venv_dir, ignore_errors=True)
+            marker_path.unlink(missing_ok=True)
+            # pip ships inside the bundle, so ensurepip is skipped.
+            venv.create(venv_dir, with_pip=False)
+            site = _venv_site_packages(venv_dir)[0]
+            for member in archive:
+                if member.name == BUNDLE_SITE_PREFIX or member.name.startswith(BUNDLE_SITE_PREFIX + "/"):
+                    _extract_bundle_member(archive, member, site)
+
+        marker_path.write_text(install_key, encoding="utf-8")
+        _write_install_manifest(slot / INSTALL_MANIFEST_FILE, python_path, install_key)
+        if _needs_install(python_path, marker_path, install_key):
+            raise RuntimeError(f"{bundle.name} did not verify against the install marker.")
+        result = "ok"
+    finally:
+        if _METRICS is not None:
+            _METRICS.inc("kumiho_claude_installs", source="bundle", result=result)
+            _METRICS.observe("kumiho_claude_install_seconds", time.monotonic() - started, source="bundle")
+            _METRICS.flush()
+    print(f"[kumiho-claude] Installed runtime bundle in {time.monotonic() - started:.1f}s.", file=sys.stderr)
+
+
+def _install_runtime_bundle_main(bundle: Path) -> int:
+    """Body of ``--install-bundle``: provision and activate the slot from *bundle* now."""
+    if not bundle.is_file():
+        print(f"[kumiho-claude] Bundle {bundle} not found.", file=sys.stderr)
+        return 1
+    install_key = _runtime_install_key()
+    slot = _runtime_slot(install_key)
+    with _launch_lock("runtime", RUNTIME_LOCK_TIMEOUT, purpose="installing dependencies") as acquired:
+        if not acquired:
+            print("[kumiho-claude] Timed out waiting for another launcher to install dependencies.", file=sys.stderr)
+            return 1
+        slot.mkdir(parents=True, exist_ok=True)
+        _hold_runtime_slot(slot)
+        try:
+            _install_runtime_bundle(bundle, slot, install_key)
+        except (RuntimeError, OSError, tarfile.TarError, ValueError) as exc:
+            print(f"[kumiho-claude] Could not install bundle: {exc}", file=sys.stderr)
+            return 1
+        _activate_runtime_slot(slot, install_key)
+        _collect_runtime_slots({slot.name})
+    return 0
 
 
 def _warn_auth() -> None:
@@ -160,18 +1106,15 @@ def _cached_kumiho_auth_path() -> Path:
     return Path.home() / ".kumiho" / "kumiho_authentication.json"
 
 
-def _read_cached_kumiho_credentials() -> dict | None:
-    path = _cached_kumiho_auth_path()
-
-    if not path.exists():
-        return None
-    try:
-        body = json.loads(path.read_text(encoding="utf-8"))
-    except Exception:
-        return None
+def _extract_credentials(text: str) -> dict | None:
+    body = json.loads(text)
     if not isinstance(body, dict):
         return None
-    return body
+    return {key: body[key] for key in CREDENTIAL_KEYS if key in body}
+
+
+def _read_cached_kumiho_credentials() -> dict | None:
+    return _config_index().lookup(_cached_kumiho_auth_path(), "credentials", _extract_credentials)
 
 
 def _load_cached_kumiho_token() -> str:
@@ -273,6 +1216,139 @@ def _plugin_root() -> Path:
     return Path(__file__).resolve().parents[1]
 
 
+class _ConfigIndex:
+    """Persisted ``(path, mtime, size) -> extracted env values`` for config sources.
+
+    Hydration re-reads and re-parses a source only when its stat signature
+    changes, so a warm launch resolves the environment with one ``stat`` per
+    candidate file.  Only ``HYDRATED_KEYS`` values are written to disk; a
+    source that yielded anything else (other dotenv entries, the credential
+    cache) is stored as ``partial`` and re-read by the next process.  The
+    index can still hold ``KUMIHO_AUTH_TOKEN``, so it lives in the per-user
+    state dir and is written with owner-only permissions.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._sources: dict | None = None
+        self._dirty = False
+
+    def _load(self) -> dict:
+        if self._sources is None:
+            body = _read_state_json(self.path)
+            sources = body.get("sources") if body.get("version") == CONFIG_INDEX_VERSION else None
+            self._sources = sources if isinstance(sources, dict) else {}
+        return self._sources
+
+    def lookup(self, path: Path, kind: str, extract: Callable[[str], dict | None]) -> dict | None:
+        """Return extracted values for *path*, or ``None`` if it is missing or unusable."""
+        key = str(path)
+        try:
+            stat = path.stat()
+        except OSError:
+            with self._lock:
+                if self._load().pop(key, None) is not None:
+                    self._dirty = True
+            return None
+        signature = [stat.st_mtime_ns, stat.st_size]
+        with self._lock:
+            entry = self._load().get(key)
+            if (
+                isinstance(entry, dict)
+                and entry.get("kind") == kind
+                and entry.get("sig") == signature
+                and not entry.get("partial")
+            ):
+                return entry.get("values")
+        try:
+            values = extract(path.read_text(encoding="utf-8"))
+        except Exception:
+            values = None
+        with self._lock:
+            self._load()[key] = {"kind": kind, "sig": signature, "values": values}
+            self._dirty = True
+        return values
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty or self._sources is None:
+                return
+            sources = {key: self._persistable(entry) for key, entry in self._sources.items()}
+            try:
+                _write_state_json(self.path, {"version": CONFIG_INDEX_VERSION, "sources": sources})
+                self._dirty = False
+            except Exception as exc:
+                print(f"[kumiho-claude] Could not write config index: {exc}", file=sys.stderr)
+
+    @staticmethod
+    def _persistable(entry: object) -> object:
+        values = entry.get("values") if isinstance(entry, dict) else None
+        if not isinstance(values, dict):
+            return entry
+        kept = {key: value for key, value in values.items() if key in HYDRATED_KEYS}
+        if len(kept) == len(values):
+            return entry
+        return {**entry, "values": kept, "partial": True}
+
+
+_CONFIG_INDEX: _ConfigIndex | None = None
+
+
+def _config_index() -> _ConfigIndex:
+    global _CONFIG_INDEX
+    if _CONFIG_INDEX is None:
+        _CONFIG_INDEX = _ConfigIndex(_state_dir() / CONFIG_INDEX_FILE)
+    return _CONFIG_INDEX
+
+
+def _extract_dotenv(text: str) -> dict:
+    values: dict[str, str] = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "=" not in line:
+            continue
+        key, _, value = line.partition("=")
+        key = key.strip()
+        value = value.strip()
+        # Strip optional surrounding quotes
+        if len(value) >= 2 and (
+            (value[0] == '"' and value[-1] == '"')
+            or (value[0] == "'" and value[-1] == "'")
+        ):
+            value = value[1:-1]
+        values[key] = value
+    return values
+
+
+def _extract_env_block(env: object) -> dict | None:
+    if not isinstance(env, dict):
+        return None
+    return {key: env[key] for key in HYDRATED_KEYS if isinstance(env.get(key), str)}
+
+
+def _extract_claude_settings(text: str) -> dict | None:
+    body = json.loads(text)
+    if not isinstance(body, dict):
+        return None
+    return _extract_env_block(body.get("env"))
+
+
+def _extract_plugin_mcp(text: str) -> dict | None:
+    body = json.loads(text)
+    if not isinstance(body, dict):
+        return None
+    servers = body.get("mcpServers")
+    if not isinstance(servers, dict):
+        return None
+    server = servers.get("kumiho-memory")
+    if not isinstance(server, dict):
+        return None
+    return _extract_env_block(server.get("env"))
+
+
 def _hydrate_env_from_dotenv() -> None:
     """Read KEY=VALUE pairs from .env.local at the plugin root.
 
@@ -284,57 +1360,23 @@ def _hydrate_env_from_dotenv() -> None:
     root = _plugin_root()
     for name in (".env.local", ".env"):
         dotenv_path = root / name
-        if not dotenv_path.exists():
+        values = _config_index().lookup(dotenv_path, "dotenv", _extract_dotenv)
+        if values is None:
+            if dotenv_path.exists():
+                return  # an unreadable .env.local still shadows .env
             continue
-        try:
-            for line in dotenv_path.read_text(encoding="utf-8").splitlines():
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-                if "=" not in line:
-                    continue
-                key, _, value = line.partition("=")
-                key = key.strip()
-                value = value.strip()
-                # Strip optional surrounding quotes
-                if len(value) >= 2 and (
-                    (value[0] == '"' and value[-1] == '"')
-                    or (value[0] == "'" and value[-1] == "'")
-                ):
-                    value = value[1:-1]
-                _set_env_if_absent(key, value, str(dotenv_path))
-        except Exception:
-            pass
+        for key, value in values.items():
+            _set_env_if_absent(key, value, str(dotenv_path))
         return  # stop after the first file found
 
 
 def _hydrate_env_from_plugin_mcp() -> None:
-    root = _plugin_root()
-    mcp_path = root / ".mcp.json"
-    if not mcp_path.exists():
-        return
-
-    try:
-        body = json.loads(mcp_path.read_text(encoding="utf-8"))
-    except Exception:
-        return
-
-    if not isinstance(body, dict):
-        return
-    servers = body.get("mcpServers")
-    if not isinstance(servers, dict):
-        return
-    server = servers.get("kumiho-memory")
-    if not isinstance(server, dict):
-        return
-    env = server.get("env")
-    if not isinstance(env, dict):
+    mcp_path = _plugin_root() / ".mcp.json"
+    values = _config_index().lookup(mcp_path, "mcp", _extract_plugin_mcp)
+    if not values:
         return
-
-    for key in ("KUMIHO_AUTH_TOKEN", "KUMIHO_CONTROL_PLANE_URL", "KUMIHO_TENANT_HINT"):
-        raw = env.get(key)
-        if isinstance(raw, str):
-            _set_env_if_absent(key, raw, f"{mcp_path}")
+    for key, raw in values.items():
+        _set_env_if_absent(key, raw, f"{mcp_path}")
 
 
 def _candidate_settings_paths() -> list[Path]:
@@ -363,25 +1405,16 @@ def _candidate_settings_paths() -> list[Path]:
 def _hydrate_env_from_claude_settings() -> None:
     candidates = _candidate_settings_paths()
     found_any = False
+    index = _config_index()
     for settings_path in candidates:
-        if not settings_path.exists():
-            continue
-        try:
-            body = json.loads(settings_path.read_text(encoding="utf-8"))
-        except Exception:
-            continue
-        if not isinstance(body, dict):
-            continue
-        env = body.get("env")
-        if not isinstance(env, dict):
+        env = index.lookup(settings_path, "settings", _extract_claude_settings)
+        if env is None:
             continue
         found_any = True
         loaded_any = False
-        for key in ("KUMIHO_AUTH_TOKEN", "KUMIHO_CONTROL_PLANE_URL", "KUMIHO_TENANT_HINT"):
-            raw = env.get(key)
-            if isinstance(raw, str):
-                if _set_env_if_absent(key, raw, f"{settings_path}"):
-                    loaded_any = True
+        for key, raw in env.items():
+            if _set_env_if_absent(key, raw, f"{settings_path}"):
+                loaded_any = True
         if loaded_any:
             return
     if not found_any:
@@ -405,6 +1438,7 @@ def _hydrate_env_from_local_config() -> None:
             "[kumiho-claude] Loaded KUMIHO_AUTH_TOKEN from local Kumiho credential cache.",
             file=sys.stderr,
         )
+    _config_index().save()
 
 
 def _claude_desktop_config_paths() -> list[Path]:
@@ -445,17 +1479,77 @@ def _claude_desktop_config_paths() -> list[Path]:
     return paths
 
 
-def _try_sync_token_to_config(config_path: Path, token: str) -> bool:
-    """Attempt to write *token* into a single MCP config file.
+class _ConfigTransaction:
+    """Load each MCP config file once, apply every change, then write once.
 
-    Returns True on success, False on any error.
+    The desktop server entry and the token sync both edit
+    ``claude_desktop_config.json`` / ``.mcp.json``.  Batching them means one
+    read and at most one write per file, and a file is only rewritten when
+    its parsed content actually changed (formatting differences alone never
+    trigger a write): every write makes Claude Desktop restart the server.
     """
-    if not config_path.exists():
-        return False
 
-    try:
-        body = json.loads(config_path.read_text(encoding="utf-8"))
-    except Exception:
+    def __init__(self) -> None:
+        self._docs: dict[Path, dict | None] = {}
+        self._originals: dict[Path, str | None] = {}
+        self._notes: dict[Path, list[str]] = {}
+
+    def load(self, path: Path, *, create: bool = False) -> dict | None:
+        """Return the parsed body of *path* for in-place edits.
+
+        Missing files yield ``None`` unless *create* is set, in which case an
+        empty document is staged.  Unparseable files always yield ``None`` so
+        they are never overwritten.
+        """
+        if path not in self._docs:
+            original: str | None = None
+            body: dict | None = None
+            try:
+                original = path.read_text(encoding="utf-8")
+                parsed = json.loads(original)
+                body = parsed if isinstance(parsed, dict) else None
+            except FileNotFoundError:
+                pass
+            except Exception:
+                body = None
+            self._docs[path] = body
+            self._originals[path] = original
+        body = self._docs[path]
+        if body is None and create and self._originals[path] is None:
+            body = self._docs[path] = {}
+        return body
+
+    def note(self, path: Path, message: str) -> None:
+        """Queue a log line that is printed only if *path* is actually written."""
+        self._notes.setdefault(path, []).append(message)
+
+    def commit(self) -> list[Path]:
+        touched: list[Path] = []
+        for path, body in self._docs.items():
+            if body is None:
+                continue
+            original = self._originals[path]
+            if original is not None and body == json.loads(original):
+                continue
+            try:
+                _write_text_atomic(path, json.dumps(body, indent=2) + "\n")
+            except Exception as exc:
+                print(f"[kumiho-claude] Could not write {path}: {exc}", file=sys.stderr)
+                continue
+            touched.append(path)
+            for message in self._notes.get(path, []):
+                print(message, file=sys.stderr)
+        return touched
+
+
+def _try_sync_token_to_config(txn: _ConfigTransaction, config_path: Path, token: str) -> bool:
+    """Stage *token* into a single MCP config file.
+
+    Returns True when the file has a kumiho server entry (already in sync
+    or updated), False otherwise.
+    """
+    body = txn.load(config_path)
+    if body is None:
         return False
 
     servers = body.get("mcpServers")
@@ -478,20 +1572,17 @@ def _try_sync_token_to_config(config_path: Path, token: str) -> bool:
     current = (env.get("KUMIHO_AUTH_TOKEN") or "").strip()
     if current == token:
         return True  # already in sync
+    # The write is deferred to commit, so check up front that the rename
+    # can succeed (plugin roots are often read-only package caches).
+    if not os.access(config_path.resolve().parent, os.W_OK):
+        return False
 
     env["KUMIHO_AUTH_TOKEN"] = token
-    try:
-        config_path.write_text(json.dumps(body, indent=2) + "\n", encoding="utf-8")
-        print(
-            f"[kumiho-claude] Synced KUMIHO_AUTH_TOKEN into {config_path.name}.",
-            file=sys.stderr,
-        )
-        return True
-    except Exception:
-        return False
+    txn.note(config_path, f"[kumiho-claude] Synced KUMIHO_AUTH_TOKEN into {config_path.name}.")
+    return True
 
 
-def _bootstrap_desktop_server_entries() -> None:
+def _bootstrap_desktop_server_entries(txn: _ConfigTransaction) -> None:
     """Ensure Claude Desktop configs have a kumiho-memory server entry.
 
     Writes absolute paths (no ``${...}`` templates) so Claude Desktop can
@@ -508,8 +1599,9 @@ def _bootstrap_desktop_server_entries() -> None:
     if not script_path.exists():
         return  # Not in a standard plugin layout; skip.
 
-    venv_py = _venv_python(_state_dir() / "venv")
-    command = str(venv_py) if venv_py.exists() else sys.executable
+    # Managed venvs are replaced on upgrade; the interpreter they (and this
+    # launcher) run on outlives them.
+    command = getattr(sys, "_base_executable", "") or sys.executable
 
     server_entry: dict = {
         "command": command,
@@ -524,53 +1616,44 @@ def _bootstrap_desktop_server_entries() -> None:
     if token and not _looks_like_placeholder(token):
         server_entry["env"]["KUMIHO_AUTH_TOKEN"] = token
 
-    for desktop_path in _claude_desktop_config_paths():
-        try:
-            if desktop_path.exists():
-                body = json.loads(desktop_path.read_text(encoding="utf-8"))
-                if not isinstance(body, dict):
-                    body = {}
-            else:
-                body = {}
-        except Exception:
-            continue
-
-        # Check if already configured *with a valid script path*.
-        # If the entry exists but points to a missing file (e.g. stale version
-        # path), fall through and overwrite it with the correct paths.
-        def _has_valid_entry(b: dict) -> bool:
-            servers = b.get("mcpServers")
-            if not isinstance(servers, dict):
-                return False
-            for name in ("kumiho-memory", "kumiho"):
-                entry = servers.get(name)
-                if not isinstance(entry, dict):
-                    continue
-                args = entry.get("args") or []
-                if args and Path(args[0]).exists():
-                    return True
+    # Check if already configured *with a valid script path*.
+    # If the entry exists but points to a missing file (e.g. stale version
+    # path), fall through and overwrite it with the correct paths.
+    def _has_valid_entry(b: dict) -> bool:
+        servers = b.get("mcpServers")
+        if not isinstance(servers, dict):
             return False
+        for name in ("kumiho-memory", "kumiho"):
+            entry = servers.get(name)
+            if not isinstance(entry, dict):
+                continue
+            args = entry.get("args") or []
+            command = entry.get("command") or ""
+            if Path(command).is_absolute() and not Path(command).exists():
+                continue
+            if args and Path(args[0]).exists():
+                return True
+        return False
 
+    for desktop_path in _claude_desktop_config_paths():
+        body = txn.load(desktop_path, create=True)
+        if body is None:
+            continue
         if _has_valid_entry(body):
             continue  # Valid entry — skip.
 
         # Not configured — bootstrap the entry.
-        body.setdefault("mcpServers", {})["kumiho-memory"] = server_entry
-        try:
-            desktop_path.parent.mkdir(parents=True, exist_ok=True)
-            desktop_path.write_text(json.dumps(body, indent=2) + "\n", encoding="utf-8")
-            print(
-                f"[kumiho-claude] Bootstrapped kumiho-memory server entry in {desktop_path.name}.",
-                file=sys.stderr,
-            )
-        except Exception as exc:
-            print(
-                f"[kumiho-claude] Could not write {desktop_path}: {exc}",
-                file=sys.stderr,
-            )
+        servers = body.get("mcpServers")
+        if not isinstance(servers, dict):
+            servers = body["mcpServers"] = {}
+        servers["kumiho-memory"] = json.loads(json.dumps(server_entry))
+        txn.note(
+            desktop_path,
+            f"[kumiho-claude] Bootstrapped kumiho-memory server entry in {desktop_path.name}.",
+        )
 
 
-def _sync_token_to_mcp_json() -> None:
+def _sync_token_to_mcp_json(txn: _ConfigTransaction) -> None:
     """Write the resolved token into MCP config so Claude Desktop picks it up.
 
     Tries the plugin-local ``.mcp.json`` first.  If that fails (read-only
@@ -581,12 +1664,13 @@ def _sync_token_to_mcp_json() -> None:
         return
 
     # Try plugin-local .mcp.json first
-    if _try_sync_token_to_config(_plugin_root() / ".mcp.json", token):
+    plugin_mcp = _plugin_root() / ".mcp.json"
+    if _try_sync_token_to_config(txn, plugin_mcp, token):
         return
 
     # Fallback: Claude Desktop global config
     for desktop_path in _claude_desktop_config_paths():
-        if _try_sync_token_to_config(desktop_path, token):
+        if _try_sync_token_to_config(txn, desktop_path, token):
             return
 
     print(
@@ -595,6 +1679,23 @@ def _sync_token_to_mcp_json() -> None:
     )
 
 
+def _sync_mcp_configs() -> list[Path]:
+    """Apply the desktop server entry and token sync in one pass per file.
+
+    Returns the files that were written; each one is also logged.
+    """
+    # Each pass is read-modify-write; serialising launchers keeps one from
+    # overwriting another's edit with a stale copy.
+    with _launch_lock("config-sync", CONFIG_SYNC_LOCK_TIMEOUT, purpose="syncing MCP configs") as acquired:
+        if not acquired:
+            print("[kumiho-claude] Skipping MCP config sync; another launcher is still writing.", file=sys.stderr)
+            return []
+        txn = _ConfigTransaction()
+        _bootstrap_desktop_server_entries(txn)
+        _sync_token_to_mcp_json(txn)
+        return txn.commit()
+
+
 def _build_discovery_url(base_url: str) -> str:
     base = base_url.rstrip("/")
     if base.endswith("/api/discovery/tenant"):
@@ -645,91 +1746,367 @@ def _normalize_server_target(raw_target: str) -> str | None:
     return target or None
 
 
-def _bootstrap_server_endpoint() -> None:
-    preset_endpoint = os.getenv("KUMIHO_SERVER_ENDPOINT", "").strip() or os.getenv("KUMIHO_SERVER_ADDRESS", "").strip()
-    if preset_endpoint:
+def _load_discovery_cache_ttl() -> int:
+    raw = (os.getenv("KUMIHO_CLAUDE_DISCOVERY_CACHE_TTL", "") or "").strip()
+    if not raw or _looks_like_placeholder(raw):
+        return DEFAULT_DISCOVERY_CACHE_TTL
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        return DEFAULT_DISCOVERY_CACHE_TTL
+
+
+def _token_fingerprint(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+
+def _discovery_cache_key(token: str, control_plane_url: str, tenant_hint: str) -> str:
+    raw = "\n".join((_token_fingerprint(token), tenant_hint, control_plane_url.rstrip("/")))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _lookup_cached_endpoint(
+    token_candidates: list[str], control_plane_url: str, tenant_hint: str
+) -> tuple[str, float] | None:
+    """Return ``(endpoint, age_seconds)`` for the first candidate with a cache entry."""
+    entries = _read_state_json(_state_dir() / DISCOVERY_CACHE_FILE).get("entries")
+    if not isinstance(entries, dict):
+        return None
+    now = time.time()
+    for token in token_candidates:
+        entry = entries.get(_discovery_cache_key(token, control_plane_url, tenant_hint))
+        if not isinstance(entry, dict):
+            continue
+        endpoint = entry.get("endpoint")
+        resolved_at = entry.get("resolved_at")
+        if not isinstance(endpoint, str) or not endpoint:
+            continue
+        if not isinstance(resolved_at, (int, float)):
+            continue
+        return endpoint, max(0.0, now - float(resolved_at))
+    return None
+
+
+def _store_cached_endpoint(token: str, control_plane_url: str, tenant_hint: str, endpoint: str) -> None:
+    path = _state_dir() / DISCOVERY_CACHE_FILE
+    entries = _read_state_json(path).get("entries")
+    if not isinstance(entries, dict):
+        entries = {}
+    entries[_discovery_cache_key(token, control_plane_url, tenant_hint)] = {
+        "endpoint": endpoint,
+        "resolved_at": time.time(),
+    }
+    # Keep the file small: one entry per (token, tenant, control plane) is
+    # plenty, and rotated tokens leave orphans behind.
+    newest = sorted(
+        entries.items(),
+        key=lambda item: item[1].get("resolved_at", 0) if isinstance(item[1], dict) else 0,
+        reverse=True,
+    )[:DISCOVERY_CACHE_MAX_ENTRIES]
+    try:
+        _write_state_json(path, {"entries": dict(newest)})
+    except Exception as exc:
+        print(f"[kumiho-claude] Could not write discovery cache: {exc}", file=sys.stderr)
+
+
+def _endpoint_book_key(token_candidates: list[str], control_plane_url: str, tenant_hint: str) -> str:
+    """Key endpoints by tenant so they survive token rotation."""
+    tenant = tenant_hint
+    if not tenant:
+        for token in token_candidates:
+            claims = _decode_jwt_claims(token) or {}
+            value = claims.get("tenant_id") or claims.get("tenant") or claims.get("sub")
+            if isinstance(value, str) and value:
+                tenant = value
+                break
+    if not tenant and token_candidates:
+        tenant = _token_fingerprint(token_candidates[0])
+    raw = "\n".join((tenant, control_plane_url.rstrip("/")))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _known_endpoints(book_key: str) -> list[str]:
+    """Endpoints discovery has returned for this tenant, most recent first."""
+    tenants = _read_state_json(_state_dir() / ENDPOINT_BOOK_FILE).get("tenants")
+    entry = tenants.get(book_key) if isinstance(tenants, dict) else None
+    seen = entry.get("endpoints") if isinstance(entry, dict) else None
+    if not isinstance(seen, dict):
+        return []
+    return [
+        endpoint
+        for endpoint, last_seen in sorted(seen.items(), key=lambda item: item[1], reverse=True)
+        if isinstance(last_seen, (int, float))
+    ]
+
+
+def _remember_endpoint(book_key: str, endpoint: str) -> None:
+    path = _state_dir() / ENDPOINT_BOOK_FILE
+    tenants = _read_state_json(path).get("tenants")
+    if not isinstance(tenants, dict):
+        tenants = {}
+    entry = tenants.get(book_key)
+    seen = entry.get("endpoints") if isinstance(entry, dict) else None
+    if not isinstance(seen, dict):
+        seen = {}
+    now = time.time()
+    seen[endpoint] = now
+    seen = dict(sorted(seen.items(), key=lambda item: item[1], reverse=True)[:ENDPOINT_BOOK_MAX_PER_TENANT])
+    failures = entry.get("failures") if isinstance(entry, dict) else None
+    failures = {
+        known: count for known, count in (failures or {}).items() if known in seen and known != endpoint
+    }
+    tenants[book_key] = {"endpoints": seen, "failures": failures, "updated_at": now}
+    newest = sorted(
+        tenants.items(),
+        key=lambda item: item[1].get("updated_at", 0) if isinstance(item[1], dict) else 0,
+        reverse=True,
+    )[:DISCOVERY_CACHE_MAX_ENTRIES]
+    try:
+        _write_state_json(path, {"tenants": dict(newest)})
+    except Exception as exc:
+        print(f"[kumiho-claude] Could not write endpoint cache: {exc}", file=sys.stderr)
+
+
+def _record_endpoint_probes(book_key: str, outcomes: dict[str, bool]) -> None:
+    """Count consecutive probe failures per endpoint and forget repeat offenders.
+
+    An endpoint that fails ``ENDPOINT_BOOK_MAX_FAILURES`` probes in a row is
+    dropped from the book; a successful probe resets its count.  Nothing is
+    written unless a count actually changed.
+    """
+    path = _state_dir() / ENDPOINT_BOOK_FILE
+    tenants = _read_state_json(path).get("tenants")
+    entry = tenants.get(book_key) if isinstance(tenants, dict) else None
+    seen = entry.get("endpoints") if isinstance(entry, dict) else None
+    if not isinstance(seen, dict):
+        return
+    failures = entry.get("failures")
+    if not isinstance(failures, dict):
+        failures = {}
+    changed = False
+    for endpoint, healthy in outcomes.items():
+        if endpoint not in seen:
+            continue
+        if healthy:
+            changed |= failures.pop(endpoint, None) is not None
+            continue
+        count = int(failures.get(endpoint) or 0) + 1
+        changed = True
+        if count >= ENDPOINT_BOOK_MAX_FAILURES:
+            seen.pop(endpoint)
+            failures.pop(endpoint, None)
+            print(
+                f"[kumiho-claude] Forgetting endpoint {endpoint} after {count} failed probes in a row.",
+                file=sys.stderr,
+            )
+        else:
+            failures[endpoint] = count
+    if not changed:
+        return
+    entry["endpoints"] = seen
+    entry["failures"] = failures
+    try:
+        _write_state_json(path, {"tenants": tenants})
+    except Exception as exc:
+        print(f"[kumiho-claude] Could not write endpoint cache: {exc}", file=sys.stderr)
+
+
+def _probe_endpoint_into(endpoint: str, timeout: float, tls: bool, results: queue.Queue) -> None:
+    results.put((endpoint, _probe_endpoint(endpoint, timeout, tls)))
+
+
+def _load_endpoint_probe_mode() -> str:
+    raw = (os.getenv("KUMIHO_CLAUDE_ENDPOINT_PROBE", "") or "").strip().lower()
+    if raw in {"off", "0", "false", "no"}:
+        return "off"
+    if raw == "tls":
+        return "tls"
+    return "tcp"
+
+
+def _load_endpoint_probe_timeout() -> float:
+    raw = (os.getenv("KUMIHO_CLAUDE_ENDPOINT_PROBE_TIMEOUT", "") or "").strip()
+    if not raw or _looks_like_placeholder(raw):
+        return DEFAULT_ENDPOINT_PROBE_TIMEOUT
+    try:
+        value = float(raw)
+    except ValueError:
+        return DEFAULT_ENDPOINT_PROBE_TIMEOUT
+    return value if value > 0 and math.isfinite(value) else DEFAULT_ENDPOINT_PROBE_TIMEOUT
+
+
+def _probe_endpoint(endpoint: str, timeout: float, tls: bool) -> float | None:
+    """Return connect (and optionally TLS handshake) latency in ms, or None."""
+    host, _, port = endpoint.rpartition(":")
+    host = host.strip("[]")
+    if not host or not port.isdigit():
+        return None
+    started = time.monotonic()
+    try:
+        with socket.create_connection((host, int(port)), timeout=timeout) as sock:
+            if tls:
+                import ssl
+
+                context = ssl.create_default_context()
+                with context.wrap_socket(sock, server_hostname=host):
+                    pass
+    except (OSError, ValueError):
+        return None
+    return round((time.monotonic() - started) * 1000, 1)
+
+
+def _select_endpoint(preferred: str | None, book_key: str) -> str | None:
+    """Pick the fastest reachable endpoint among *preferred* and known alternatives.
+
+    Every candidate is probed at once on daemon threads.  Once the first one
+    answers, the others get ``ENDPOINT_PROBE_WINDOW`` more seconds; anything
+    slower than that loses anyway, so a dead alternative never costs a full
+    probe timeout.  The preferred endpoint wins near-ties.  If nothing
+    answers the preferred (or most recently seen) endpoint is kept: a
+    transient network blip should not turn into the needs-auth sentinel.
+    Probes that finished are recorded so endpoints that keep failing are
+    forgotten.
+    """
+    candidates = [preferred] if preferred else []
+    candidates += [endpoint for endpoint in _known_endpoints(book_key) if endpoint != preferred]
+    if not candidates:
+        return None
+    mode = _load_endpoint_probe_mode()
+    if len(candidates) == 1 or mode == "off":
+        return candidates[0]
+
+    timeout = _load_endpoint_probe_timeout()
+    results: queue.Queue = queue.Queue()
+    for endpoint in candidates:
+        threading.Thread(
+            target=_probe_endpoint_into,
+            args=(endpoint, timeout, mode == "tls", results),
+            name="kumiho-endpoint-probe",
+            daemon=True,
+        ).start()
+
+    latencies: dict[str, float | None] = {}
+    deadline = time.monotonic() + timeout + 0.25
+    while len(latencies) < len(candidates):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            endpoint, latency = results.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if latency is not None and not any(value is not None for value in latencies.values()):
+            deadline = min(deadline, time.monotonic() + ENDPOINT_PROBE_WINDOW)
+        latencies[endpoint] = latency
+    _record_endpoint_probes(book_key, {endpoint: latency is not None for endpoint, latency in latencies.items()})
+
+    healthy = [(latency, endpoint) for endpoint, latency in latencies.items() if latency is not None]
+    if not healthy:
         print(
-            "[kumiho-claude] Ignoring pre-set KUMIHO_SERVER_ENDPOINT/KUMIHO_SERVER_ADDRESS; "
-            "resolving endpoint via control-plane discovery.",
+            f"[kumiho-claude] No known endpoint answered a {mode} probe within {timeout}s; "
+            f"keeping {candidates[0]}.",
             file=sys.stderr,
         )
-    # Always clear any inherited endpoint so startup cannot lock onto stale routing.
-    os.environ.pop("KUMIHO_SERVER_ENDPOINT", None)
-    os.environ.pop("KUMIHO_SERVER_ADDRESS", None)
-
-    token_candidates = _discovery_token_candidates()
-    if not token_candidates:
+        return candidates[0]
+    fastest, chosen = min(healthy)
+    preferred_latency = latencies.get(candidates[0])
+    if preferred_latency is not None and preferred_latency - fastest <= max(
+        ENDPOINT_PROBE_TIE_MS, fastest * ENDPOINT_PROBE_TIE_RATIO
+    ):
+        return candidates[0]
+    if chosen != candidates[0]:
+        if preferred_latency is not None:
+            reason = f"{preferred_latency}ms"
+        else:
+            reason = "unreachable" if candidates[0] in latencies else "no answer in time"
         print(
-            "[kumiho-claude] KUMIHO_AUTH_TOKEN is not set; skipping discovery bootstrap. "
-            "MCP tools will load, but authenticated calls will fail until token is provided.",
+            f"[kumiho-claude] Using {chosen} ({fastest}ms) instead of {candidates[0]} ({reason}).",
             file=sys.stderr,
         )
-        # Set a sentinel endpoint so the SDK does NOT fall back to
-        # localhost:8080.  The .invalid TLD is guaranteed to never
-        # resolve (RFC 6761), producing a clear "not connected" error.
-        os.environ["KUMIHO_SERVER_ENDPOINT"] = "needs-auth.kumiho.invalid:443"
+    return chosen
+
+
+def _dns_prefetch_enabled() -> bool:
+    raw = (os.getenv("KUMIHO_CLAUDE_DNS_PREFETCH", "") or "").strip().lower()
+    return raw not in {"0", "false", "no", "off"}
+
+
+def _resolve_endpoint_addresses(endpoint: str) -> list[str]:
+    host, _, port = endpoint.rpartition(":")
+    host = host.strip("[]")
+    if not host or not port.isdigit():
+        return []
+    infos = socket.getaddrinfo(host, int(port), proto=socket.IPPROTO_TCP)
+    addresses: list[str] = []
+    for family, _type, _proto, _canonname, sockaddr in infos:
+        address = f"[{sockaddr[0]}]:{sockaddr[1]}" if family == socket.AF_INET6 else f"{sockaddr[0]}:{sockaddr[1]}"
+        if address not in addresses:
+            addresses.append(address)
+    return addresses
+
+
+def _prefetch_endpoint_dns() -> None:
+    """Resolve the exported endpoint on a daemon thread, without waiting for it.
+
+    gRPC does its own name resolution and cannot be handed addresses from
+    outside the process, so the only help a launcher can give is priming a
+    caching system resolver (systemd-resolved, nscd, mDNSResponder, the
+    Windows DNS Client) before the server's first call.  The lookup never
+    delays exec; if it has not finished by then it is simply dropped.
+    """
+    endpoint = (os.getenv("KUMIHO_SERVER_ENDPOINT", "") or "").strip()
+    if not endpoint or endpoint.split(":", 1)[0].endswith(".invalid") or not _dns_prefetch_enabled():
         return
 
-    control_plane_url = _load_control_plane_url()
-    discovery_url = _build_discovery_url(control_plane_url)
-    tenant_hint = os.getenv("KUMIHO_TENANT_HINT", "").strip()
-    discovery_user_agent = _load_discovery_user_agent()
+    def _resolve() -> None:
+        with contextlib.suppress(OSError, UnicodeError):
+            _resolve_endpoint_addresses(endpoint)
 
-    payload: dict[str, str] = {}
-    if tenant_hint:
-        payload["tenant_hint"] = tenant_hint
+    threading.Thread(target=_resolve, name="kumiho-dns-prefetch", daemon=True).start()
 
-    body_text: str | None = None
-    last_error: Exception | None = None
-    request_body = json.dumps(payload).encode("utf-8")
 
-    for index, bearer in enumerate(token_candidates, start=1):
-        request = urllib.request.Request(
-            discovery_url,
-            data=request_body,
-            headers={
-                "Authorization": f"Bearer {bearer}",
-                "Content-Type": "application/json",
-                "User-Agent": discovery_user_agent,
-            },
-            method="POST",
-        )
-        try:
-            with urllib.request.urlopen(request, timeout=8) as response:
-                body_text = response.read().decode("utf-8")
-            break
-        except urllib.error.HTTPError as exc:
-            detail = ""
-            try:
-                detail = exc.read().decode("utf-8")
-            except Exception:
-                detail = ""
-            detail = detail.strip().replace("\n", " ")
-            if detail:
-                detail = f" {detail[:160]}"
-            print(
-                f"[kumiho-claude] Discovery candidate #{index} failed ({exc.code}).{detail}",
-                file=sys.stderr,
-            )
-            last_error = exc
-        except Exception as exc:
-            print(
-                f"[kumiho-claude] Discovery candidate #{index} request error: {exc}",
-                file=sys.stderr,
-            )
-            last_error = exc
+def _spawn_discovery_refresh() -> None:
+    """Re-run discovery in a detached process so the launcher never waits on it.
+
+    A thread would not survive ``os.execv``.  The child inherits the hydrated
+    environment and only rewrites the discovery cache; its stdio is detached
+    so it can never write into the MCP channel.
+    """
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--refresh-discovery-cache"]
+    kwargs: dict = {
+        "stdin": subprocess.DEVNULL,
+        "stdout": subprocess.DEVNULL,
+        "stderr": subprocess.DEVNULL,
+        "close_fds": True,
+    }
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    try:
+        subprocess.Popen(cmd, **kwargs)
+    except Exception as exc:
+        print(f"[kumiho-claude] Could not start background discovery refresh: {exc}", file=sys.stderr)
+
 
-    if body_text is None:
-        if last_error is None:
-            raise RuntimeError("Control-plane discovery failed with no usable token candidates.")
-        raise RuntimeError(f"Control-plane discovery failed across all token candidates: {last_error}")
+def _load_discovery_timeout() -> float:
+    raw = (os.getenv("KUMIHO_CLAUDE_DISCOVERY_TIMEOUT", "") or "").strip()
+    if not raw or _looks_like_placeholder(raw):
+        return DEFAULT_DISCOVERY_TIMEOUT
+    try:
+        value = float(raw)
+    except ValueError:
+        return DEFAULT_DISCOVERY_TIMEOUT
+    return value if value > 0 else DEFAULT_DISCOVERY_TIMEOUT
 
+
+def _endpoint_from_discovery_body(body_text: str) -> str:
     try:
         body = json.loads(body_text)
     except json.JSONDecodeError:
         raise RuntimeError("Control-plane discovery returned invalid JSON.")
 
-    region = body.get("region")
+    region = body.get("region") if isinstance(body, dict) else None
     if not isinstance(region, dict):
         raise RuntimeError("Control-plane discovery response missing region routing.")
 
@@ -745,74 +2122,2414 @@ def _bootstrap_server_endpoint() -> None:
     resolved_target = _normalize_server_target(raw_target)
     if not resolved_target:
         raise RuntimeError("Control-plane discovery response missing gRPC target.")
-
-    os.environ["KUMIHO_SERVER_ENDPOINT"] = resolved_target
-    os.environ.pop("KUMIHO_SERVER_ADDRESS", None)
-    print(
-        f"[kumiho-claude] Resolved KUMIHO_SERVER_ENDPOINT={resolved_target} via discovery bootstrap.",
-        file=sys.stderr,
+    return resolved_target
+
+
+def _discovery_attempt(
+    index: int,
+    bearer: str,
+    discovery_url: str,
+    request_body: bytes,
+    user_agent: str,
+    timeout: float,
+    results: queue.Queue,
+) -> None:
+    """Run one discovery POST and post ``(index, bearer, endpoint, error, detail, latency_ms)``."""
+    started = time.monotonic()
+    request = urllib.request.Request(
+        discovery_url,
+        data=request_body,
+        headers={
+            "Authorization": f"Bearer {bearer}",
+            "Content-Type": "application/json",
+            "User-Agent": user_agent,
+        },
+        method="POST",
     )
+    endpoint: str | None = None
+    error: Exception | None = None
+    detail = ""
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body_text = response.read().decode("utf-8")
+        endpoint = _endpoint_from_discovery_body(body_text)
+    except urllib.error.HTTPError as exc:
+        try:
+            detail = exc.read().decode("utf-8")
+        except Exception:
+            detail = ""
+        error = exc
+    except Exception as exc:
+        error = exc
+    latency_ms = round((time.monotonic() - started) * 1000, 1)
+    results.put((index, bearer, endpoint, error, detail, latency_ms))
+
+
+def _log_discovery_failure(index: int, error: Exception, detail: str) -> None:
+    if isinstance(error, urllib.error.HTTPError):
+        detail = detail.strip().replace("\n", " ")
+        if detail:
+            detail = f" {detail[:160]}"
+        print(
+            f"[kumiho-claude] Discovery candidate #{index} failed ({error.code}).{detail}",
+            file=sys.stderr,
+        )
+    else:
+        print(
+            f"[kumiho-claude] Discovery candidate #{index} request error: {error}",
+            file=sys.stderr,
+        )
 
 
-def _sanitize_placeholder_env_vars() -> None:
-    """Strip unresolved ${VAR:-default} placeholders that Claude Desktop
-    passes through as literal strings.  Without this, downstream code
-    (pip install, log-level parsing, etc.) receives garbage values.
+def _discovery_backoff(consecutive_failures: int) -> float:
+    exponent = max(0, consecutive_failures - 1)
+    return min(DISCOVERY_AUTH_BACKOFF_MAX, DISCOVERY_AUTH_BACKOFF_BASE * (2 ** min(exponent, 16)))
+
+
+def _token_expiry(token: str) -> int | None:
+    claims = _decode_jwt_claims(token)
+    exp = claims.get("exp") if claims else None
+    return int(exp) if isinstance(exp, (int, float)) else None
+
+
+def _usable_discovery_candidates(token_candidates: list[str]) -> list[str]:
+    """Drop candidates that cannot succeed right now.
+
+    Tokens that got a 401/403 are skipped until their backoff window ends,
+    as are JWTs that have already expired.  Order is left alone: every
+    survivor is raced at once.  If every candidate is excluded they are all
+    tried anyway, so a fixed token is never locked out by stale history.
     """
-    for key in (
-        "KUMIHO_AUTH_TOKEN",
-        "KUMIHO_CONTROL_PLANE_URL",
-        "KUMIHO_CLAUDE_PACKAGE_SPEC",
-        "KUMIHO_CLAUDE_DISCOVERY_USER_AGENT",
-        "KUMIHO_MCP_LOG_LEVEL",
-        "KUMIHO_CLAUDE_DISABLE_LLM_FALLBACK",
-    ):
-        raw = (os.getenv(key, "") or "").strip()
-        if raw and _looks_like_placeholder(raw):
-            os.environ.pop(key, None)
+    tokens = _read_state_json(_state_dir() / DISCOVERY_HISTORY_FILE).get("tokens")
+    if not isinstance(tokens, dict):
+        tokens = {}
+    now = time.time()
+    usable: list[str] = []
+    for token in token_candidates:
+        expiry = _token_expiry(token)
+        if expiry is not None and expiry <= now + 30:
+            continue
+        entry = tokens.get(_token_fingerprint(token))
+        backoff_until = entry.get("backoff_until") if isinstance(entry, dict) else None
+        if isinstance(backoff_until, (int, float)) and backoff_until > now:
             print(
-                f"[kumiho-claude] Cleared unresolved placeholder for {key}.",
+                f"[kumiho-claude] Skipping a discovery token rejected with "
+                f"{entry.get('last_status')}; retry in {int(backoff_until - now)}s.",
                 file=sys.stderr,
             )
+            continue
+        usable.append(token)
+    if not usable and token_candidates:
+        print(
+            "[kumiho-claude] Every discovery token is expired or backing off; trying them anyway.",
+            file=sys.stderr,
+        )
+        return list(token_candidates)
+    return usable
 
 
-def _configure_llm_fallback() -> None:
-    if os.getenv("KUMIHO_CLAUDE_DISABLE_LLM_FALLBACK", "").strip().lower() in {"1", "true", "yes"}:
+def _record_discovery_outcomes(outcomes: list[tuple]) -> None:
+    """Fold ``(index, bearer, endpoint, error, detail, latency_ms)`` results into the history."""
+    if not outcomes:
         return
+    path = _state_dir() / DISCOVERY_HISTORY_FILE
+    tokens = _read_state_json(path).get("tokens")
+    if not isinstance(tokens, dict):
+        tokens = {}
+    now = time.time()
+    for _index, bearer, endpoint, error, _detail, latency_ms in outcomes:
+        if _METRICS is not None:
+            code = error.code if isinstance(error, urllib.error.HTTPError) else None
+            result = "ok" if endpoint else (f"http_{code}" if code is not None else "error")
+            _METRICS.inc("kumiho_claude_discovery_attempts", result=result)
+            _METRICS.observe("kumiho_claude_discovery_seconds", latency_ms / 1000)
+        key = _token_fingerprint(bearer)
+        entry = tokens.get(key)
+        entry = entry if isinstance(entry, dict) else {}
+        entry["last_at"] = now
+        if endpoint:
+            entry["last_status"] = "ok"
+            entry["consecutive_failures"] = 0
+            entry.pop("backoff_until", None)
+        else:
+            code = error.code if isinstance(error, urllib.error.HTTPError) else None
+            entry["last_status"] = code if code is not None else "error"
+            entry["consecutive_failures"] = int(entry.get("consecutive_failures", 0) or 0) + 1
+            if code in (401, 403):
+                entry["backoff_until"] = now + _discovery_backoff(entry["consecutive_failures"])
+        tokens[key] = entry
+    recent = sorted(
+        (item for item in tokens.items() if isinstance(item[1], dict)),
+        key=lambda item: item[1].get("last_at", 0),
+        reverse=True,
+    )[:DISCOVERY_HISTORY_MAX_ENTRIES]
+    try:
+        _write_state_json(path, {"tokens": dict(recent)})
+    except Exception as exc:
+        print(f"[kumiho-claude] Could not write discovery history: {exc}", file=sys.stderr)
 
-    key_vars = ("KUMIHO_LLM_API_KEY", "OPENAI_API_KEY", "ANTHROPIC_API_KEY")
-    if any(os.getenv(var, "").strip() for var in key_vars):
-        return
 
-    os.environ.setdefault("KUMIHO_LLM_PROVIDER", "openai")
-    os.environ.setdefault("OPENAI_API_KEY", "kumiho-claude-fallback")
-    os.environ.setdefault("KUMIHO_LLM_BASE_URL", "http://127.0.0.1:9/v1")
-    print(
-        "[kumiho-claude] No LLM API key detected. "
-        "Using fail-fast local fallback for summarization.",
-        file=sys.stderr,
-    )
+def _request_discovery_endpoint(
+    token_candidates: list[str], control_plane_url: str, tenant_hint: str
+) -> tuple[str, str]:
+    """Race every token candidate against discovery; return ``(endpoint, bearer_used)``.
 
+    All candidates are fired at once and the first one that yields a usable
+    region wins.  ``KUMIHO_CLAUDE_DISCOVERY_TIMEOUT`` bounds the whole race,
+    not each request, so stale session tokens can no longer stack up
+    N x timeout of startup delay.
+    """
+    discovery_url = _build_discovery_url(control_plane_url)
+    discovery_user_agent = _load_discovery_user_agent()
+    timeout = _load_discovery_timeout()
 
-def main() -> int:
-    parser = argparse.ArgumentParser(description="Run Kumiho MCP with auto-bootstrap.")
-    parser.add_argument(
-        "--self-test",
+    payload: dict[str, str] = {}
+    if tenant_hint:
+        payload["tenant_hint"] = tenant_hint
+    request_body = json.dumps(payload).encode("utf-8")
+
+    token_candidates = _usable_discovery_candidates(token_candidates)
+    if not token_candidates:
+        raise RuntimeError("Control-plane discovery failed with no usable token candidates.")
+
+    # Losing requests cannot be interrupted inside urlopen, so they run on
+    # daemon threads and are simply abandoned once a winner is found; their
+    # own timeout never exceeds the overall deadline.
+    results: queue.Queue = queue.Queue()
+    deadline = time.monotonic() + timeout
+    for index, bearer in enumerate(token_candidates, start=1):
+        threading.Thread(
+            target=_discovery_attempt,
+            args=(index, bearer, discovery_url, request_body, discovery_user_agent, timeout, results),
+            name=f"kumiho-discovery-{index}",
+            daemon=True,
+        ).start()
+
+    last_error: Exception | None = None
+    pending = len(token_candidates)
+    outcomes: list[tuple] = []
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                outcome = results.get(timeout=remaining)
+            except queue.Empty:
+                break
+            outcomes.append(outcome)
+            index, bearer, endpoint, error, detail, _latency = outcome
+            pending -= 1
+            if endpoint:
+                # Report candidates that already finished; the rest are dropped.
+                while True:
+                    try:
+                        done = results.get_nowait()
+                    except queue.Empty:
+                        break
+                    outcomes.append(done)
+                    if not done[2]:
+                        _log_discovery_failure(done[0], done[3], done[4])
+                return endpoint, bearer
+            _log_discovery_failure(index, error, detail)
+            last_error = error
+    finally:
+        _record_discovery_outcomes(outcomes)
+
+    if pending:
+        print(
+            f"[kumiho-claude] Discovery deadline of {timeout:g}s reached with "
+            f"{pending} candidate(s) still pending.",
+            file=sys.stderr,
+        )
+        last_error = TimeoutError(f"no discovery response within {timeout:g}s")
+
+    if last_error is None:
+        raise RuntimeError("Control-plane discovery failed with no usable token candidates.")
+    raise RuntimeError(f"Control-plane discovery failed across all token candidates: {last_error}")
+
+
+def _refresh_discovery_cache() -> int:
+    """Entry point for the detached ``--refresh-discovery-cache`` process."""
+    token_candidates = _discovery_token_candidates()
+    if not token_candidates:
+        return 0
+    control_plane_url = _load_control_plane_url()
+    tenant_hint = os.getenv("KUMIHO_TENANT_HINT", "").strip()
+    with _launch_lock("discovery", 0) as acquired:
+        if not acquired:
+            # A launcher is resolving right now and will cache the result.
+            return 0
+        try:
+            endpoint, used_token = _request_discovery_endpoint(token_candidates, control_plane_url, tenant_hint)
+        except RuntimeError:
+            return 1
+        _store_cached_endpoint(used_token, control_plane_url, tenant_hint, endpoint)
+    _remember_endpoint(_endpoint_book_key(token_candidates, control_plane_url, tenant_hint), endpoint)
+    if _METRICS is not None:
+        _METRICS.flush()
+    return 0
+
+
+def _bootstrap_server_endpoint() -> None:
+    preset_endpoint = os.getenv("KUMIHO_SERVER_ENDPOINT", "").strip() or os.getenv("KUMIHO_SERVER_ADDRESS", "").strip()
+    if preset_endpoint:
+        print(
+            "[kumiho-claude] Ignoring pre-set KUMIHO_SERVER_ENDPOINT/KUMIHO_SERVER_ADDRESS; "
+            "resolving endpoint via control-plane discovery.",
+            file=sys.stderr,
+        )
+    # Always clear any inherited endpoint so startup cannot lock onto stale routing.
+    os.environ.pop("KUMIHO_SERVER_ENDPOINT", None)
+    os.environ.pop("KUMIHO_SERVER_ADDRESS", None)
+
+    token_candidates = _discovery_token_candidates()
+    if not token_candidates:
+        print(
+            "[kumiho-claude] KUMIHO_AUTH_TOKEN is not set; skipping discovery bootstrap. "
+            "MCP tools will load, but authenticated calls will fail until token is provided.",
+            file=sys.stderr,
+        )
+        # Set a sentinel endpoint so the SDK does NOT fall back to
+        # localhost:8080.  The .invalid TLD is guaranteed to never
+        # resolve (RFC 6761), producing a clear "not connected" error.
+        os.environ["KUMIHO_SERVER_ENDPOINT"] = "needs-auth.kumiho.invalid:443"
+        return
+
+    control_plane_url = _load_control_plane_url()
+    tenant_hint = os.getenv("KUMIHO_TENANT_HINT", "").strip()
+    cache_ttl = _load_discovery_cache_ttl()
+    book_key = _endpoint_book_key(token_candidates, control_plane_url, tenant_hint)
+
+    # Stale-while-revalidate: a fresh cache entry is exported immediately and
+    # a detached process refreshes it for the next launch.
+    cached = _lookup_cached_endpoint(token_candidates, control_plane_url, tenant_hint) if cache_ttl else None
+    if cached is not None and cached[1] < cache_ttl:
+        _export_cached_endpoint(cached[0], cached[1], book_key)
+        return
+
+    if not cache_ttl:
+        _discover_endpoint(token_candidates, control_plane_url, tenant_hint, book_key, cached, cache_ttl)
+        return
+
+    # Sessions started together would otherwise all query the control plane;
+    # the first one resolves and the rest reuse the endpoint it cached.
+    timeout = _load_discovery_timeout() + DISCOVERY_LOCK_GRACE
+    with _launch_lock("discovery", timeout, purpose="endpoint discovery"):
+        shared = _lookup_cached_endpoint(token_candidates, control_plane_url, tenant_hint)
+        if shared is not None and shared[1] < cache_ttl:
+            _export_cached_endpoint(shared[0], shared[1], book_key)
+            return
+        _discover_endpoint(token_candidates, control_plane_url, tenant_hint, book_key, shared or cached, cache_ttl)
+
+
+def _export_cached_endpoint(endpoint: str, age: float, book_key: str) -> None:
+    endpoint = _select_endpoint(endpoint, book_key) or endpoint
+    os.environ["KUMIHO_SERVER_ENDPOINT"] = endpoint
+    print(
+        f"[kumiho-claude] Using cached KUMIHO_SERVER_ENDPOINT={endpoint} "
+        f"(resolved {int(age)}s ago).",
+        file=sys.stderr,
+    )
+    if age >= DISCOVERY_REFRESH_INTERVAL:
+        _spawn_discovery_refresh()
+
+
+def _discover_endpoint(
+    token_candidates: list[str],
+    control_plane_url: str,
+    tenant_hint: str,
+    book_key: str,
+    cached: tuple[str, float] | None,
+    cache_ttl: int,
+) -> None:
+    try:
+        resolved_target, used_token = _request_discovery_endpoint(token_candidates, control_plane_url, tenant_hint)
+    except RuntimeError as exc:
+        # An expired entry or any endpoint previously returned for this
+        # tenant still beats the needs-auth sentinel when the control plane
+        # is unreachable.
+        endpoint = _select_endpoint(cached[0] if cached is not None else None, book_key)
+        if endpoint is None:
+            raise
+        os.environ["KUMIHO_SERVER_ENDPOINT"] = endpoint
+        print(
+            f"[kumiho-claude] Discovery failed ({exc}); "
+            f"falling back to previously resolved KUMIHO_SERVER_ENDPOINT={endpoint}.",
+            file=sys.stderr,
+        )
+        return
+
+    if cache_ttl:
+        _store_cached_endpoint(used_token, control_plane_url, tenant_hint, resolved_target)
+    _remember_endpoint(book_key, resolved_target)
+    resolved_target = _select_endpoint(resolved_target, book_key) or resolved_target
+
+    os.environ["KUMIHO_SERVER_ENDPOINT"] = resolved_target
+    os.environ.pop("KUMIHO_SERVER_ADDRESS", None)
+    print(
+        f"[kumiho-claude] Resolved KUMIHO_SERVER_ENDPOINT={resolved_target} via discovery bootstrap.",
+        file=sys.stderr,
+    )
+
+
+def _sanitize_placeholder_env_vars() -> None:
+    """Strip unresolved ${VAR:-default} placeholders that Claude Desktop
+    passes through as literal strings.  Without this, downstream code
+    (pip install, log-level parsing, etc.) receives garbage values.
+    """
+    for key in (
+        "KUMIHO_AUTH_TOKEN",
+        "KUMIHO_CONTROL_PLANE_URL",
+        "KUMIHO_CLAUDE_PACKAGE_SPEC",
+        "KUMIHO_CLAUDE_DISCOVERY_USER_AGENT",
+        "KUMIHO_MCP_LOG_LEVEL",
+        "KUMIHO_CLAUDE_DISABLE_LLM_FALLBACK",
+    ):
+        raw = (os.getenv(key, "") or "").strip()
+        if raw and _looks_like_placeholder(raw):
+            os.environ.pop(key, None)
+            print(
+                f"[kumiho-claude] Cleared unresolved placeholder for {key}.",
+                file=sys.stderr,
+            )
+
+
+def _configure_llm_fallback() -> None:
+    if os.getenv("KUMIHO_CLAUDE_DISABLE_LLM_FALLBACK", "").strip().lower() in {"1", "true", "yes"}:
+        return
+
+    key_vars = ("KUMIHO_LLM_API_KEY", "OPENAI_API_KEY", "ANTHROPIC_API_KEY")
+    if any(os.getenv(var, "").strip() for var in key_vars):
+        return
+
+    os.environ.setdefault("KUMIHO_LLM_PROVIDER", "openai")
+    os.environ.setdefault("OPENAI_API_KEY", "kumiho-claude-fallback")
+    os.environ.setdefault("KUMIHO_LLM_BASE_URL", "http://127.0.0.1:9/v1")
+    print(
+        "[kumiho-claude] No LLM API key detected. "
+        "Using fail-fast local fallback for summarization.",
+        file=sys.stderr,
+    )
+
+
+def _supervise_requested(flag: bool) -> bool:
+    if flag:
+        return True
+    return os.getenv("KUMIHO_CLAUDE_SUPERVISE", "").strip().lower() in {"1", "true", "yes"}
+
+
+def _supervised_paths() -> list[Path]:
+    return [_cached_kumiho_auth_path(), _plugin_root() / ".env.local"]
+
+
+def _file_digest(path: Path) -> str | None:
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+class _CredentialWatcher:
+    """Report content changes to credential files.
+
+    On Linux the parent directories are watched with inotify (through ctypes,
+    so no extra dependency); elsewhere, or when a directory does not exist
+    yet, the files are polled.  Either way a wake-up only counts as a change
+    if the file contents differ, so touches and unrelated files are ignored.
+    """
+
+    # IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    _INOTIFY_MASK = 0x8 | 0x40 | 0x80 | 0x100 | 0x200
+    _INOTIFY_FLAGS = 0o4000 | 0o2000000  # IN_NONBLOCK | IN_CLOEXEC
+    _EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, paths: list[Path]) -> None:
+        self.paths = paths
+        self._digests = {path: _file_digest(path) for path in paths}
+        self._fd: int | None = None
+        self._names: dict[int, set[str]] = {}
+        if sys.platform.startswith("linux"):
+            try:
+                self._init_inotify()
+            except Exception as exc:
+                self.close()
+                print(f"[kumiho-claude] inotify unavailable ({exc}); polling credential files.", file=sys.stderr)
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._fd is not None else "polling"
+
+    def _init_inotify(self) -> None:
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(self._INOTIFY_FLAGS)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self._fd = fd
+        by_dir: dict[Path, set[str]] = {}
+        for path in self.paths:
+            by_dir.setdefault(path.parent, set()).add(path.name)
+        for directory, names in by_dir.items():
+            wd = libc.inotify_add_watch(fd, os.fsencode(str(directory)), self._INOTIFY_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"cannot watch {directory}")
+            self._names[wd] = names
+
+    def _drain(self) -> bool:
+        """Consume queued inotify events; True if any touched a watched name."""
+        relevant = False
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return relevant
+            offset = 0
+            while offset + self._EVENT_HEADER.size <= len(data):
+                wd, _mask, _cookie, length = self._EVENT_HEADER.unpack_from(data, offset)
+                offset += self._EVENT_HEADER.size
+                name = data[offset : offset + length].rstrip(b"\0").decode("utf-8", "replace")
+                offset += length
+                if name in self._names.get(wd, ()):
+                    relevant = True
+
+    def wait(self, stop: threading.Event, timeout: float) -> bool:
+        """Block up to *timeout* seconds; True if a watched file changed."""
+        if self._fd is None:
+            if stop.wait(timeout):
+                return False
+        else:
+            with selectors.DefaultSelector() as selector:
+                selector.register(self._fd, selectors.EVENT_READ)
+                if not selector.select(timeout) or not self._drain():
+                    return False
+            # Let multi-step writers (write + rename, several writes) settle.
+            time.sleep(SUPERVISOR_SETTLE_DELAY)
+            self._drain()
+        changed = False
+        for path in self.paths:
+            digest = _file_digest(path)
+            if digest != self._digests[path]:
+                self._digests[path] = digest
+                changed = True
+        return changed
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def _proxy_requested(flag: bool) -> bool:
+    if flag:
+        return True
+    return os.getenv("KUMIHO_CLAUDE_PROXY", "").strip().lower() in {"1", "true", "yes"}
+
+
+def _new_meter_stats() -> dict:
+    return {
+        "count": 0,
+        "errors": 0,
+        "latency_ms_sum": 0.0,
+        "latency_ms_max": 0.0,
+        # One count per METER_LATENCY_BUCKETS_MS bound, plus overflow.
+        "buckets": [0] * (len(METER_LATENCY_BUCKETS_MS) + 1),
+        "bytes_in": 0,
+        "bytes_out": 0,
+    }
+
+
+class _ToolMeter:
+    """Aggregate per-method and per-tool JSON-RPC latency off the relay path.
+
+    Relay threads only timestamp each line and hand it over with a
+    non-blocking put.  Parsing, request/response matching and the periodic
+    write to ``proxy-metrics.json`` happen on the meter's own thread.  When
+    the queue is full the event is dropped and counted instead of stalling
+    the pipe.
+    """
+
+    _STOP = object()
+
+    def __init__(self) -> None:
+        self.session_id = f"{int(time.time())}-{os.getpid()}"
+        self.started_at = time.time()
+        self.methods: dict[str, dict] = {}
+        self.tools: dict[str, dict] = {}
+        self.dropped = 0
+        self.sections: dict[str, Callable[[], dict]] = {}
+        self._events: queue.Queue = queue.Queue(maxsize=METER_QUEUE_SIZE)
+        self._inflight: dict[str, tuple[float, str, str | None, int]] = {}
+        self._dirty = False
+        self._thread = threading.Thread(target=self._run, name="kumiho-meter", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        with contextlib.suppress(queue.Full):
+            self._events.put(self._STOP, timeout=1.0)
+        self._thread.join(timeout=2.0)
+
+    def observe(self, direction: str, line: bytes) -> None:
+        """Record one line; *direction* is ``"in"`` (client to server) or ``"out"``."""
+        try:
+            self._events.put_nowait((direction, line, time.monotonic()))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        next_flush = time.monotonic() + METER_FLUSH_INTERVAL
+        while True:
+            try:
+                event = self._events.get(timeout=max(0.0, next_flush - time.monotonic()))
+            except queue.Empty:
+                event = None
+            if event is self._STOP:
+                break
+            if event is not None:
+                self._handle(*event)
+            if time.monotonic() >= next_flush:
+                self.flush()
+                next_flush = time.monotonic() + METER_FLUSH_INTERVAL
+        self.flush()
+
+    def _handle(self, direction: str, line: bytes, at: float) -> None:
+        try:
+            parsed = json.loads(line)
+        except ValueError:
+            return
+        for message in parsed if isinstance(parsed, list) else [parsed]:
+            if not isinstance(message, dict) or "id" not in message:
+                continue
+            key = json.dumps(message["id"])
+            method = message.get("method")
+            if direction == "in" and isinstance(method, str):
+                params = message.get("params")
+                tool = params.get("name") if method == "tools/call" and isinstance(params, dict) else None
+                self._inflight[key] = (at, method, tool if isinstance(tool, str) else None, len(line))
+            elif direction == "out" and method is None:
+                started = self._inflight.pop(key, None)
+                if started is None:
+                    continue
+                started_at, method, tool, bytes_in = started
+                result = message.get("result")
+                failed = "error" in message or (isinstance(result, dict) and result.get("isError") is True)
+                latency_ms = (at - started_at) * 1000
+                self._record(self.methods, method, latency_ms, bytes_in, len(line), failed)
+                if tool:
+                    self._record(self.tools, tool, latency_ms, bytes_in, len(line), failed)
+
+    def _record(
+        self, table: dict[str, dict], name: str, latency_ms: float, bytes_in: int, bytes_out: int, failed: bool
+    ) -> None:
+        stats = table.setdefault(name, _new_meter_stats())
+        stats["count"] += 1
+        stats["errors"] += int(failed)
+        stats["latency_ms_sum"] = round(stats["latency_ms_sum"] + latency_ms, 3)
+        stats["latency_ms_max"] = round(max(stats["latency_ms_max"], latency_ms), 3)
+        bucket = next(
+            (i for i, bound in enumerate(METER_LATENCY_BUCKETS_MS) if latency_ms <= bound),
+            len(METER_LATENCY_BUCKETS_MS),
+        )
+        stats["buckets"][bucket] += 1
+        stats["bytes_in"] += bytes_in
+        stats["bytes_out"] += bytes_out
+        self._dirty = True
+        if _METRICS is not None and table is self.tools:
+            _METRICS.inc("kumiho_claude_tool_calls", tool=name, result="error" if failed else "ok")
+            _METRICS.observe("kumiho_claude_tool_call_seconds", latency_ms / 1000, tool=name)
+            _METRICS.inc("kumiho_claude_tool_bytes", bytes_in, tool=name, direction="in")
+            _METRICS.inc("kumiho_claude_tool_bytes", bytes_out, tool=name, direction="out")
+
+    def snapshot(self) -> dict:
+        return {
+            "started_at": self.started_at,
+            "updated_at": time.time(),
+            "latency_buckets_ms": list(METER_LATENCY_BUCKETS_MS),
+            "methods": self.methods,
+            "tools": self.tools,
+            "dropped_events": self.dropped,
+            **{name: provider() for name, provider in self.sections.items()},
+        }
+
+    def flush(self) -> None:
+        if not self._dirty:
+            return
+        self._dirty = False
+        if _METRICS is not None:
+            _METRICS.flush()
+        path = _state_dir() / PROXY_METRICS_FILE
+        sessions = _read_state_json(path).get("sessions")
+        if not isinstance(sessions, dict):
+            sessions = {}
+        sessions[self.session_id] = self.snapshot()
+        newest = sorted(
+            sessions.items(),
+            key=lambda item: item[1].get("updated_at", 0) if isinstance(item[1], dict) else 0,
+            reverse=True,
+        )[:PROXY_METRICS_MAX_SESSIONS]
+        try:
+            _write_state_json(path, {"sessions": dict(newest)})
+        except Exception as exc:
+            print(f"[kumiho-claude] Could not write proxy metrics: {exc}", file=sys.stderr)
+
+
+def _load_recall_cache_settings() -> tuple[int, int] | None:
+    """Return ``(ttl_seconds, max_entries)`` when the recall cache is enabled.
+
+    The cache serves results up to a TTL old, so it is opt-in on top of the
+    proxy; a zero TTL or size disables it as well.
+    """
+    if os.getenv("KUMIHO_CLAUDE_RECALL_CACHE", "").strip().lower() not in {"1", "true", "yes"}:
+        return None
+    settings = []
+    for name, default in (
+        ("KUMIHO_CLAUDE_RECALL_CACHE_TTL", DEFAULT_RECALL_CACHE_TTL),
+        ("KUMIHO_CLAUDE_RECALL_CACHE_SIZE", DEFAULT_RECALL_CACHE_SIZE),
+    ):
+        raw = (os.getenv(name, "") or "").strip()
+        try:
+            value = max(0, int(raw)) if raw and not _looks_like_placeholder(raw) else default
+        except ValueError:
+            value = default
+        settings.append(value)
+    if not all(settings):
+        return None
+    return settings[0], settings[1]
+
+
+def _recall_cache_key(arguments: dict) -> str:
+    normalized = dict(arguments)
+    query = normalized.get("query")
+    if isinstance(query, str):
+        normalized["query"] = " ".join(query.split()).casefold()
+    normalized["graph_augmented"] = bool(normalized.get("graph_augmented", False))
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class _RecallCache:
+    """Answer repeated ``kumiho_memory_recall`` calls from the proxy.
+
+    Results are keyed by the normalized query and the remaining arguments,
+    live for a TTL and are evicted LRU.  Writes made through the same session
+    invalidate them: ``kumiho_deprecate_item`` drops the entries whose cached
+    result mentions the deprecated kref, any other memory or graph write
+    drops everything.  A generation counter keeps a recall that was in
+    flight across an invalidation from being cached.
+    """
+
+    def __init__(self, ttl: int, max_entries: int) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        self._entries: collections.OrderedDict[str, tuple[float, object, str]] = collections.OrderedDict()
+        self._pending: dict[str, tuple[str, int]] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+            self._generation += 1
+
+    def _invalidate(self, tool: str, arguments: dict) -> None:
+        kref = arguments.get("item_kref") if tool == "kumiho_deprecate_item" else None
+        if isinstance(kref, str) and kref:
+            stale = [key for key, (_, _, text) in self._entries.items() if kref in text]
+        else:
+            stale = list(self._entries)
+        for key in stale:
+            del self._entries[key]
+        self._generation += 1
+        self.stats["invalidations"] += len(stale)
+
+    def intercept(self, line: bytes) -> bytes | None:
+        """Inspect a client ``tools/call``; return a cached response line on a hit."""
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(message, dict) or message.get("method") != "tools/call" or "id" not in message:
+            return None
+        params = message.get("params")
+        tool = params.get("name") if isinstance(params, dict) else None
+        arguments = params.get("arguments") if isinstance(params, dict) else None
+        if not isinstance(tool, str):
+            return None
+        arguments = arguments if isinstance(arguments, dict) else {}
+        with self._lock:
+            if tool != "kumiho_memory_recall":
+                if tool in RECALL_INVALIDATING_TOOLS or tool.startswith(RECALL_INVALIDATING_PREFIXES):
+                    self._invalidate(tool, arguments)
+                return None
+            key = _recall_cache_key(arguments)
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                response = {"jsonrpc": "2.0", "id": message["id"], "result": entry[1]}
+                return (json.dumps(response) + "\n").encode("utf-8")
+            self._entries.pop(key, None)
+            self.stats["misses"] += 1
+            self._pending[json.dumps(message["id"])] = (key, self._generation)
+        return None
+
+    def observe_response(self, line: bytes) -> None:
+        if not self._pending:
+            return
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return
+        if not isinstance(message, dict) or "method" in message or "id" not in message:
+            return
+        with self._lock:
+            pending = self._pending.pop(json.dumps(message["id"]), None)
+            if pending is None:
+                return
+            key, generation = pending
+            result = message.get("result")
+            if generation != self._generation or not isinstance(result, dict) or result.get("isError"):
+                return
+            self._entries[key] = (time.monotonic(), result, json.dumps(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else None,
+            }
+
+
+def _coalesce_writes_requested() -> bool:
+    return os.getenv("KUMIHO_CLAUDE_COALESCE_WRITES", "").strip().lower() in {"1", "true", "yes"}
+
+
+class _WriteCoalescer:
+    """Acknowledge fire-and-forget memory writes at once and forward them in batches.
+
+    ``kumiho_memory_add_response`` and ``kumiho_memory_discover_edges`` get a
+    synthetic "queued" result immediately.  The calls are held in arrival
+    order, a call identical to the one just before it is folded into it, and
+    each batch is pipelined to the server in a single write under proxy-owned
+    ids whose responses are swallowed (failures are logged).
+
+    Ordering guarantee: the server sees memory writes in the order the
+    client sent them.  Folding only ever merges neighbours, and any other
+    memory write (see ``RECALL_INVALIDATING_TOOLS``) is held back until the
+    queue has been delivered and answered, including writes re-sent after a
+    server restart.  The queue is also drained at shutdown.
+    """
+
+    def __init__(self, send: Callable[[bytes], None]) -> None:
+        self._send = send
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._queue: list[tuple[str, dict]] = []
+        # Fingerprint of the last queued call; None while the queue is empty.
+        self._tail_key: str | None = None
+        self._inflight: dict[str, tuple[str, dict]] = {}
+        self._counter = 0
+        self._due: float | None = None
+        self.stats = {"acknowledged": 0, "deduplicated": 0, "flushes": 0, "forwarded": 0, "failed": 0}
+
+    def intercept(self, line: bytes) -> bytes | None:
+        """Queue a coalescible ``tools/call`` and return its synthetic response line."""
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(message, dict) or message.get("method") != "tools/call" or "id" not in message:
+            return None
+        params = message.get("params")
+        tool = params.get("name") if isinstance(params, dict) else None
+        if tool not in COALESCED_TOOLS:
+            if isinstance(tool, str) and (
+                tool in RECALL_INVALIDATING_TOOLS or tool.startswith(RECALL_INVALIDATING_PREFIXES)
+            ):
+                # Queued writes must land before this one (consolidation, for
+                # one, reads the session buffer they fill).
+                self.flush(wait=True)
+            return None
+        key = hashlib.sha256(
+            json.dumps([tool, params.get("arguments")], sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        with self._cond:
+            self.stats["acknowledged"] += 1
+            if key == self._tail_key:
+                self.stats["deduplicated"] += 1
+            else:
+                self._tail_key = key
+                self._queue.append((tool, message))
+                if self._due is None:
+                    self._due = time.monotonic() + COALESCE_FLUSH_DELAY
+                self._cond.notify_all()
+        result = {
+            "content": [{"type": "text", "text": json.dumps({"status": "queued", "tool": tool})}],
+            "isError": False,
+        }
+        return (json.dumps({"jsonrpc": "2.0", "id": message["id"], "result": result}) + "\n").encode("utf-8")
+
+    def _send_queued(self) -> None:
+        with self._send_lock:
+            with self._cond:
+                batch, self._queue = self._queue, []
+                self._tail_key = None
+                self._due = None
+                lines = []
+                for tool, message in batch:
+                    self._counter += 1
+                    flush_id = f"kumiho-claude-write-{self._counter}"
+                    self._inflight[flush_id] = (tool, message)
+                    lines.append((json.dumps(dict(message, id=flush_id)) + "\n").encode("utf-8"))
+                if batch:
+                    self.stats["flushes"] += 1
+                    self.stats["forwarded"] += len(batch)
+            if lines:
+                self._send(b"".join(lines))
+
+    def flush(self, *, wait: bool = False, timeout: float = COALESCE_DRAIN_TIMEOUT) -> None:
+        """Send the queue; with *wait*, block until every forwarded write is answered."""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._send_queued()
+            if not wait:
+                return
+            with self._cond:
+                while self._inflight and not self._queue:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        print(
+                            f"[kumiho-claude] {len(self._inflight)} coalesced write(s) still unanswered after {timeout}s.",
+                            file=sys.stderr,
+                        )
+                        return
+                    self._cond.wait(remaining)
+                if not self._queue:
+                    return
+            # A restart put unanswered writes back in the queue: send them again.
+
+    def requeue_inflight(self) -> None:
+        """Put unanswered writes back at the head of the queue (server restarted)."""
+        with self._cond:
+            if not self._inflight:
+                return
+            self._queue[:0] = list(self._inflight.values())
+            self._inflight.clear()
+            self._due = time.monotonic()
+            self._cond.notify_all()
+
+    def observe_response(self, line: bytes) -> bool:
+        """Swallow responses to forwarded writes; True if *line* was one."""
+        if not self._inflight or b"kumiho-claude-write-" not in line:
+            return False
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return False
+        if not isinstance(message, dict) or "method" in message:
+            return False
+        with self._cond:
+            entry = self._inflight.pop(message.get("id"), None)
+            if entry is None:
+                return False
+            result = message.get("result")
+            if "error" in message or (isinstance(result, dict) and result.get("isError")):
+                self.stats["failed"] += 1
+                print(f"[kumiho-claude] Coalesced {entry[0]} call failed: {line[:300]!r}", file=sys.stderr)
+            self._cond.notify_all()
+        return True
+
+    def run(self, stopped: threading.Event) -> None:
+        while not stopped.is_set():
+            with self._cond:
+                if self._due is None:
+                    self._cond.wait(SUPERVISOR_POLL_INTERVAL)
+                    continue
+                delay = self._due - time.monotonic()
+                if delay > 0 and len(self._queue) < COALESCE_MAX_BATCH:
+                    self._cond.wait(delay)
+                    continue
+            self.flush()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {**self.stats, "queued": len(self._queue), "inflight": len(self._inflight)}
+
+
+def _load_recall_trim_settings() -> tuple[int, int] | None:
+    """Return ``(top_siblings, max_field_chars)`` when recall trimming is enabled."""
+    if os.getenv("KUMIHO_CLAUDE_RECALL_TRIM", "").strip().lower() not in {"1", "true", "yes"}:
+        return None
+    settings = []
+    for name, default in (
+        ("KUMIHO_CLAUDE_RECALL_TOP_SIBLINGS", DEFAULT_RECALL_TOP_SIBLINGS),
+        ("KUMIHO_CLAUDE_RECALL_MAX_FIELD_CHARS", DEFAULT_RECALL_MAX_FIELD_CHARS),
+    ):
+        raw = (os.getenv(name, "") or "").strip()
+        try:
+            value = max(0, int(raw)) if raw and not _looks_like_placeholder(raw) else default
+        except ValueError:
+            value = default
+        settings.append(value)
+    return settings[0], settings[1]
+
+
+def _sibling_score(entry: object) -> float:
+    if isinstance(entry, dict):
+        # kumiho_memory scores siblings under "_score"; "score" is the primary's.
+        for key in ("_score", "score"):
+            value = entry.get(key)
+            if isinstance(value, (int, float)):
+                return float(value)
+    return float("-inf")
+
+
+class _RecallTrimmer:
+    """Shrink ``kumiho_memory_recall`` results before they reach the model.
+
+    A recall result is ``{"results": [memory, ...], "count", "recall_mode"}``
+    and each memory may carry ``sibling_revisions``, which is where the bulk
+    is.  Only those siblings are shaped: the top-k by score are kept, their
+    long strings are truncated (krefs and ids are never cut) and
+    ``RECALL_SIBLING_DROPPED_FIELDS`` are removed.  Primary memories and any
+    other shape of payload pass through unchanged.  Results are JSON inside
+    MCP text content, so each text item is parsed, shaped and re-serialized
+    compactly; text that is not JSON is passed through untouched.
+    """
+
+    def __init__(self, top_siblings: int, max_field_chars: int) -> None:
+        self.top_siblings = top_siblings
+        self.max_field_chars = max_field_chars
+        self.stats = {"calls": 0, "bytes_before": 0, "bytes_after": 0}
+        self._pending: set[str] = set()
+        self._lock = threading.Lock()
+
+    def note_request(self, line: bytes) -> None:
+        if b'"kumiho_memory_recall"' not in line:
+            return
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return
+        params = message.get("params") if isinstance(message, dict) else None
+        if isinstance(params, dict) and params.get("name") == "kumiho_memory_recall" and "id" in message:
+            with self._lock:
+                self._pending.add(json.dumps(message["id"]))
+
+    def _truncate(self, key: str, value: str) -> str:
+        if len(value) <= self.max_field_chars or key == "id" or key.endswith(("kref", "krefs", "_id")):
+            return value
+        return value[: self.max_field_chars].rstrip() + "…"
+
+    def _truncate_all(self, value: object, key: str) -> object:
+        if isinstance(value, dict):
+            return {child_key: self._truncate_all(child, child_key) for child_key, child in value.items()}
+        if isinstance(value, list):
+            return [self._truncate_all(item, key) for item in value]
+        if isinstance(value, str):
+            return self._truncate(key, value)
+        return value
+
+    def _shape_sibling(self, sibling: object) -> object:
+        if not isinstance(sibling, dict):
+            return sibling
+        return {
+            key: self._truncate_all(value, key)
+            for key, value in sibling.items()
+            if key not in RECALL_SIBLING_DROPPED_FIELDS
+        }
+
+    def _shape(self, payload: object) -> object:
+        memories = payload.get("results") if isinstance(payload, dict) else None
+        if not isinstance(memories, list):
+            return payload
+        shaped = []
+        for memory in memories:
+            siblings = memory.get("sibling_revisions") if isinstance(memory, dict) else None
+            if isinstance(siblings, list):
+                ranked = sorted(siblings, key=_sibling_score, reverse=True)[: self.top_siblings]
+                memory = {**memory, "sibling_revisions": [self._shape_sibling(entry) for entry in ranked]}
+                if len(siblings) > len(ranked):
+                    # As in kumiho_memory's summarized engage: a shortened
+                    # list must not read as "this item has few revisions".
+                    memory.setdefault("sibling_count", len(siblings))
+            shaped.append(memory)
+        return {**payload, "results": shaped}
+
+    def shape(self, line: bytes) -> bytes:
+        """Return *line*, trimmed if it answers a pending recall."""
+        if not self._pending:
+            return line
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return line
+        if not isinstance(message, dict) or "method" in message or "id" not in message:
+            return line
+        with self._lock:
+            if json.dumps(message["id"]) not in self._pending:
+                return line
+            self._pending.discard(json.dumps(message["id"]))
+        result = message.get("result")
+        if not isinstance(result, dict):
+            return line
+        for item in result.get("content") or []:
+            if not isinstance(item, dict) or item.get("type") != "text" or not isinstance(item.get("text"), str):
+                continue
+            try:
+                payload = json.loads(item["text"])
+            except ValueError:
+                continue
+            item["text"] = json.dumps(self._shape(payload), ensure_ascii=False, separators=(",", ":"))
+        if isinstance(result.get("structuredContent"), dict):
+            result["structuredContent"] = self._shape(result["structuredContent"])
+        trimmed = (json.dumps(message, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        if len(trimmed) >= len(line):
+            trimmed = line
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["bytes_before"] += len(line)
+            self.stats["bytes_after"] += len(trimmed)
+        saved = len(line) - len(trimmed)
+        if saved:
+            print(
+                f"[kumiho-claude] Trimmed recall response by {saved} bytes "
+                f"(~{saved // RECALL_BYTES_PER_TOKEN} tokens).",
+                file=sys.stderr,
+            )
+        return trimmed
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            saved = self.stats["bytes_before"] - self.stats["bytes_after"]
+            return {**self.stats, "bytes_saved": saved, "est_tokens_saved": saved // RECALL_BYTES_PER_TOKEN}
+
+
+class _Supervisor:
+    """Keep the client's stdio open across restarts of ``kumiho.mcp_server``.
+
+    JSON-RPC messages are newline-delimited on the MCP stdio transport, so
+    the supervisor relays whole lines.  It remembers the client's
+    ``initialize`` request and ``notifications/initialized`` notification,
+    replays them into every replacement child (swallowing the replayed
+    response), and answers requests still in flight at restart time with an
+    error so the client never waits on a server that is gone.
+
+    Without *watch* the child is never restarted and the relay only feeds
+    the optional *meter* (proxy mode).
+
+    Lines are read at most ``RELAY_MAX_LINE_BYTES`` at a time.  A longer
+    frame is passed through piece by piece without being parsed, metered,
+    cached or trimmed, so one huge or newline-free frame never buffers
+    without bound.
+    """
+
+    def __init__(
+        self,
+        cmd: list[str],
+        reload_env: Callable[[], None],
+        *,
+        watch: bool = True,
+        meter: _ToolMeter | None = None,
+        recall_cache: _RecallCache | None = None,
+        coalesce_writes: bool = False,
+        recall_trimmer: _RecallTrimmer | None = None,
+    ) -> None:
+        self.cmd = cmd
+        self.reload_env = reload_env
+        self.watch = watch
+        self.meter = meter
+        self.recall_cache = recall_cache
+        if meter is not None and recall_cache is not None:
+            meter.sections["recall_cache"] = recall_cache.snapshot
+        self.coalescer = _WriteCoalescer(functools.partial(self._forward, track=False)) if coalesce_writes else None
+        if meter is not None and self.coalescer is not None:
+            meter.sections["write_coalescing"] = self.coalescer.snapshot
+        self.recall_trimmer = recall_trimmer
+        if meter is not None and recall_trimmer is not None:
+            meter.sections["recall_trimming"] = recall_trimmer.snapshot
+        self.stopped = threading.Event()
+        self.exit_code = 0
+        self._lock = threading.Lock()
+        self._out_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._replayed = threading.Event()
+        self._child: subprocess.Popen | None = None
+        self._generation = 0
+        self._replay_id: str | None = None
+        self._pending: set[object] = set()
+        self._initialize: dict | None = None
+        self._initialized: bytes | None = None
+
+    def _write_client(self, line: bytes) -> None:
+        with self._out_lock:
+            sys.stdout.buffer.write(line)
+            sys.stdout.buffer.flush()
+
+    def _spawn(self) -> subprocess.Popen:
+        self._generation += 1
+        child = subprocess.Popen(self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=dict(os.environ))
+        threading.Thread(target=self._pump_child, args=(child,), daemon=True).start()
+        return child
+
+    @staticmethod
+    def _relay_oversize(head: bytes, stream, write: Callable[[bytes], None]) -> None:
+        """Copy the rest of a frame that overflowed the line limit from *stream* to *write*."""
+        total = len(head)
+        write(head)
+        chunk = head
+        while not chunk.endswith(b"\n"):
+            chunk = stream.readline(RELAY_MAX_LINE_BYTES)
+            if not chunk:
+                break
+            total += len(chunk)
+            write(chunk)
+        print(
+            f"[kumiho-claude] Relayed a {total}-byte frame unparsed (longer than {RELAY_MAX_LINE_BYTES} bytes).",
+            file=sys.stderr,
+        )
+
+    def _pump_child(self, child: subprocess.Popen) -> None:
+        for line in iter(functools.partial(child.stdout.readline, RELAY_MAX_LINE_BYTES), b""):
+            if not line.endswith(b"\n") and len(line) >= RELAY_MAX_LINE_BYTES:
+                with self._lock:
+                    current = not self.watch or child is self._child
+                write = sys.stdout.buffer.write if current else (lambda _chunk: None)
+                with self._out_lock:
+                    self._relay_oversize(line, child.stdout, write)
+                    sys.stdout.buffer.flush()
+                continue
+            if self.recall_trimmer is not None:
+                line = self.recall_trimmer.shape(line)
+            if self.meter is not None:
+                self.meter.observe("out", line)
+            if self.recall_cache is not None:
+                self.recall_cache.observe_response(line)
+            if self.coalescer is not None and self.coalescer.observe_response(line):
+                continue
+            if not self.watch:
+                self._write_client(line)
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                message = None
+            with self._lock:
+                if child is not self._child:
+                    continue  # output of a child being replaced
+                if isinstance(message, dict) and "method" not in message and "id" in message:
+                    if self._replay_id is not None and message["id"] == self._replay_id:
+                        self._replay_id = None
+                        self._replayed.set()
+                        continue
+                    self._pending.discard(message["id"])
+            self._write_client(line)
+        code = child.wait()
+        with self._lock:
+            if child is not self._child:
+                return
+        print(f"[kumiho-claude] MCP server exited with code {code}.", file=sys.stderr)
+        self.exit_code = code
+        self.stopped.set()
+
+    def _forward(self, line: bytes, *, track: bool = True) -> None:
+        """Write *line* to the current child, waiting out any restart."""
+        try:
+            # Only restarts need the handshake and in-flight ids.
+            parsed = json.loads(line) if self.watch and track else None
+        except ValueError:
+            parsed = None
+        messages = parsed if isinstance(parsed, list) else [parsed]
+        while True:
+            self._ready.wait()
+            with self._lock:
+                if not self._ready.is_set():
+                    continue
+                for message in messages:
+                    if not isinstance(message, dict):
+                        continue
+                    method = message.get("method")
+                    if method == "initialize":
+                        self._initialize = message
+                    elif method == "notifications/initialized":
+                        self._initialized = line
+                    if method and "id" in message:
+                        self._pending.add(message["id"])
+                try:
+                    self._child.stdin.write(line)
+                    self._child.stdin.flush()
+                except (BrokenPipeError, OSError):
+                    pass  # the child's exit is reported by its pump
+                return
+
+    def _forward_oversize(self, head: bytes) -> None:
+        """Stream a frame that overflowed the line limit from stdin to the current child."""
+        while True:
+            self._ready.wait()
+            with self._lock:
+                if not self._ready.is_set():
+                    continue
+                child = self._child
+
+                def write(chunk: bytes) -> None:
+                    with contextlib.suppress(OSError):
+                        child.stdin.write(chunk)
+
+                self._relay_oversize(head, sys.stdin.buffer, write)
+                with contextlib.suppress(OSError):
+                    child.stdin.flush()
+                return
+
+    def _pump_client(self) -> None:
+        for line in iter(functools.partial(sys.stdin.buffer.readline, RELAY_MAX_LINE_BYTES), b""):
+            if not line.endswith(b"\n") and len(line) >= RELAY_MAX_LINE_BYTES:
+                self._forward_oversize(line)
+                continue
+            if self.meter is not None:
+                self.meter.observe("in", line)
+            if b'"tools/call"' in line:
+                reply = self.recall_cache.intercept(line) if self.recall_cache is not None else None
+                if reply is None and self.coalescer is not None:
+                    reply = self.coalescer.intercept(line)
+                if reply is not None:
+                    if self.meter is not None:
+                        self.meter.observe("out", reply)
+                    self._write_client(reply)
+                    continue
+                if self.recall_trimmer is not None:
+                    self.recall_trimmer.note_request(line)
+            self._forward(line)
+        # Client closed stdin: deliver queued writes, then let the server see
+        # EOF and wind down.
+        if self.coalescer is not None:
+            self.coalescer.flush(wait=True)
+        with self._lock:
+            child = self._child
+        if child is not None and child.stdin:
+            with contextlib.suppress(OSError):
+                child.stdin.close()
+
+    def _child_exited(self) -> bool:
+        with self._lock:
+            return self._child is None or self._child.poll() is not None
+
+    def _stop_child(self, child: subprocess.Popen) -> None:
+        with contextlib.suppress(OSError):
+            child.stdin.close()
+        child.terminate()
+        try:
+            child.wait(timeout=SUPERVISOR_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            child.kill()
+            child.wait()
+
+    def restart(self) -> None:
+        with self._lock:
+            self._ready.clear()
+            old, self._child = self._child, None
+            pending, self._pending = self._pending, set()
+        if self.recall_cache is not None:
+            # New credentials may mean a different tenant.
+            self.recall_cache.clear()
+        if self.coalescer is not None:
+            self.coalescer.requeue_inflight()
+        for request_id in pending:
+            error = {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {
+                    "code": -32603,
+                    "message": "Kumiho MCP server restarted after a credential change; retry the request.",
+                },
+            }
+            self._write_client((json.dumps(error) + "\n").encode("utf-8"))
+        if old is not None:
+            self._stop_child(old)
+        try:
+            self.reload_env()
+        except Exception as exc:
+            print(f"[kumiho-claude] Reload failed ({exc}); restarting with the previous settings.", file=sys.stderr)
+        with self._lock:
+            self._child = child = self._spawn()
+            initialize = self._initialize
+            if initialize is not None:
+                self._replay_id = f"kumiho-claude-replay-{self._generation}"
+                self._replayed.clear()
+                replay = dict(initialize, id=self._replay_id)
+                with contextlib.suppress(OSError):
+                    child.stdin.write((json.dumps(replay) + "\n").encode("utf-8"))
+                    child.stdin.flush()
+        if initialize is not None:
+            if not self._replayed.wait(SUPERVISOR_INIT_TIMEOUT):
+                print("[kumiho-claude] Restarted MCP server did not answer initialize in time.", file=sys.stderr)
+            if self._initialized is not None:
+                with contextlib.suppress(OSError):
+                    child.stdin.write(self._initialized)
+                    child.stdin.flush()
+        self._ready.set()
+        print(f"[kumiho-claude] MCP server restarted (generation {self._generation}).", file=sys.stderr)
+
+    def run(self) -> int:
+        watcher = _CredentialWatcher(_supervised_paths()) if self.watch else None
+        if watcher is not None:
+            print(
+                f"[kumiho-claude] Supervising MCP server; watching credentials via {watcher.mode}.",
+                file=sys.stderr,
+            )
+        if self.meter is not None:
+            print(
+                f"[kumiho-claude] Proxying MCP server; metering tool latency to "
+                f"{_state_dir() / PROXY_METRICS_FILE}.",
+                file=sys.stderr,
+            )
+            self.meter.start()
+        if os.name != "nt":
+            signal.signal(signal.SIGTERM, lambda *_: self.stopped.set())
+        with self._lock:
+            self._child = self._spawn()
+        self._ready.set()
+        threading.Thread(target=self._pump_client, daemon=True).start()
+        if self.coalescer is not None:
+            threading.Thread(target=self.coalescer.run, args=(self.stopped,), daemon=True).start()
+        try:
+            while not self.stopped.is_set():
+                if watcher is None:
+                    self.stopped.wait(SUPERVISOR_POLL_INTERVAL)
+                elif watcher.wait(self.stopped, SUPERVISOR_POLL_INTERVAL):
+                    print("[kumiho-claude] Credential change detected; reloading MCP server.", file=sys.stderr)
+                    self.restart()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if watcher is not None:
+                watcher.close()
+            if self.coalescer is not None and not self._child_exited():
+                self.coalescer.flush(wait=True, timeout=SUPERVISOR_STOP_TIMEOUT)
+            with self._lock:
+                child, self._child = self._child, None
+            if child is not None:
+                self._stop_child(child)
+            if self.meter is not None:
+                self.meter.stop()
+        return self.exit_code
+
+
+def _zygote_enabled() -> bool:
+    if os.getenv("KUMIHO_CLAUDE_ZYGOTE", "").strip().lower() not in {"1", "true", "yes"}:
+        return False
+    # Descriptor passing needs AF_UNIX + SCM_RIGHTS; Windows keeps the cold path.
+    return os.name != "nt" and hasattr(socket, "send_fds")
+
+
+def _load_zygote_idle_timeout() -> float:
+    raw = (os.getenv("KUMIHO_CLAUDE_ZYGOTE_IDLE_TIMEOUT", "") or "").strip()
+    if not raw or _looks_like_placeholder(raw):
+        return DEFAULT_ZYGOTE_IDLE_TIMEOUT
+    try:
+        value = float(raw)
+    except ValueError:
+        return DEFAULT_ZYGOTE_IDLE_TIMEOUT
+    return max(0.0, value) if math.isfinite(value) else DEFAULT_ZYGOTE_IDLE_TIMEOUT
+
+
+def _zygote_env_fingerprint(env: dict) -> str:
+    """Hash the variables the preloaded modules may have read when imported."""
+    relevant = sorted(
+        (str(key), str(value))
+        for key, value in env.items()
+        if (str(key).startswith(ZYGOTE_ENV_PREFIXES) and not str(key).startswith(ZYGOTE_ENV_IGNORED_PREFIXES))
+        or str(key).upper() in ZYGOTE_ENV_KEYS
+    )
+    return hashlib.sha256(json.dumps(relevant).encode("utf-8")).hexdigest()[:16]
+
+
+def _zygote_socket_path() -> Path | None:
+    """Where the zygote listens, or ``None`` if no safe location exists."""
+    path = _state_dir() / ZYGOTE_SOCKET_FILE
+    # sun_path is limited to ~104 bytes on macOS; fall back to a private
+    # per-user directory under the system temp dir for deep state dirs.
+    if len(str(path)) < 100:
+        return path
+    private_dir = Path(tempfile.gettempdir()) / f"kumiho-claude-{os.getuid()}"
+    try:
+        private_dir.mkdir(mode=0o700, exist_ok=True)
+        info = os.lstat(private_dir)
+    except OSError as exc:
+        print(f"[kumiho-claude] Zygote disabled: cannot create {private_dir}: {exc}", file=sys.stderr)
+        return None
+    # The temp dir is shared, so the name may have been claimed first by
+    # someone else; a socket there would hand them our env and stdio.
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        print(
+            f"[kumiho-claude] Zygote disabled: {private_dir} is not a private directory owned by this user.",
+            file=sys.stderr,
+        )
+        return None
+    return private_dir / ZYGOTE_SOCKET_FILE
+
+
+def _zygote_peer_is_us(sock: socket.socket) -> bool:
+    """False if *sock*'s peer runs as another user (where the OS can tell)."""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return True
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    _pid, uid, _gid = struct.unpack("3i", creds)
+    return uid == os.getuid()
+
+
+def _zygote_send(sock: socket.socket, body: dict, fds: list[int] | None = None) -> None:
+    data = json.dumps(body).encode("utf-8")
+    frame = struct.pack(">I", len(data)) + data
+    if fds:
+        sent = socket.send_fds(sock, [frame], fds)
+        if sent < len(frame):
+            sock.sendall(frame[sent:])
+    else:
+        sock.sendall(frame)
+
+
+def _zygote_recv(sock: socket.socket, *, with_fds: bool = False) -> tuple[dict | None, list[int]]:
+    """Read one length-prefixed JSON frame; returns ``(None, [])`` on EOF."""
+    fds: list[int] = []
+    if with_fds:
+        header, fds, _flags, _addr = socket.recv_fds(sock, 4, 3)
+    else:
+        header = sock.recv(4)
+    while header and len(header) < 4:
+        chunk = sock.recv(4 - len(header))
+        if not chunk:
+            break
+        header += chunk
+    if len(header) < 4:
+        for fd in fds:
+            os.close(fd)
+        return None, []
+    (length,) = struct.unpack(">I", header)
+    data = b""
+    while len(data) < length:
+        chunk = sock.recv(min(65536, length - len(data)))
+        if not chunk:
+            for fd in fds:
+                os.close(fd)
+            return None, []
+        data += chunk
+    body = json.loads(data.decode("utf-8"))
+    return (body if isinstance(body, dict) else None), fds
+
+
+def _zygote_request(body: dict, *, timeout: float = ZYGOTE_CONNECT_TIMEOUT) -> dict | None:
+    path = _zygote_socket_path()
+    if path is None or not path.exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(path))
+            if not _zygote_peer_is_us(sock):
+                return None
+            _zygote_send(sock, body)
+            reply, _ = _zygote_recv(sock)
+            return reply
+    except (OSError, ValueError):
+        return None
+
+
+def _zygote_connect(python_path: Path, install_key: str, passthrough: list[str]) -> socket.socket | None:
+    """Ask a running zygote to fork a server onto our stdio.
+
+    Returns the connected socket once the fork is acknowledged, or ``None``
+    when no compatible zygote is listening (the caller then cold-starts).
+    """
+    path = _zygote_socket_path()
+    if path is None or not path.exists():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(ZYGOTE_CONNECT_TIMEOUT)
+        sock.connect(str(path))
+        if not _zygote_peer_is_us(sock):
+            # Never hand our environment (tokens) and stdio to another user.
+            print(f"[kumiho-claude] Zygote socket {path} belongs to another user; cold-starting.", file=sys.stderr)
+            sock.close()
+            return None
+        _zygote_send(
+            sock,
+            {
+                "op": "spawn",
+                "protocol": ZYGOTE_PROTOCOL,
+                "python": str(python_path),
+                "install_key": install_key,
+                "argv": passthrough,
+                "env": dict(os.environ),
+                "cwd": os.getcwd(),
+            },
+            fds=[0, 1, 2],
+        )
+        reply, _ = _zygote_recv(sock)
+    except (OSError, ValueError):
+        sock.close()
+        return None
+    if not reply or not reply.get("ok"):
+        error = (reply or {}).get("error", "no reply")
+        print(f"[kumiho-claude] Zygote declined the launch ({error}); cold-starting.", file=sys.stderr)
+        sock.close()
+        return None
+    sock.settimeout(None)
+    print(f"[kumiho-claude] Handed off to pre-warmed zygote (server pid {reply.get('pid')}).", file=sys.stderr)
+    return sock
+
+
+def _zygote_wait(sock: socket.socket) -> int:
+    """Block until the zygote reports the forked server's exit status.
+
+    The launcher stays alive as the process the host is watching; if the
+    host kills it, the closed socket tells the zygote to stop the server.
+    """
+    with sock:
+        try:
+            reply, _ = _zygote_recv(sock)
+        except (OSError, ValueError):
+            return 1
+    if not reply:
+        return 1
+    code = reply.get("exit")
+    return code if isinstance(code, int) else 1
+
+
+def _spawn_zygote(python_path: Path, install_key: str) -> None:
+    """Start a detached zygote under the venv interpreter for later launches."""
+    state_dir = _state_dir()
+    state_dir.mkdir(parents=True, exist_ok=True)
+    cmd = [
+        str(python_path),
+        str(Path(__file__).resolve()),
+        "zygote",
+        "serve",
+        "--install-key",
+        install_key,
+    ]
+    try:
+        with (state_dir / ZYGOTE_LOG_FILE).open("ab") as log:
+            subprocess.Popen(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=log,
+                close_fds=True,
+                start_new_session=True,
+            )
+    except Exception as exc:
+        print(f"[kumiho-claude] Could not start zygote: {exc}", file=sys.stderr)
+
+
+def _zygote_run_server(request: dict, fds: list[int]) -> int:
+    """Body of a forked zygote child: adopt the client's stdio and run the server."""
+    for target, fd in zip((0, 1, 2), fds):
+        os.dup2(fd, target)
+    for fd in fds:
+        if fd > 2:
+            os.close(fd)
+    env = request.get("env")
+    if isinstance(env, dict):
+        os.environ.clear()
+        os.environ.update({str(k): str(v) for k, v in env.items()})
+    cwd = request.get("cwd")
+    if isinstance(cwd, str):
+        try:
+            os.chdir(cwd)
+        except OSError:
+            pass
+    argv = request.get("argv") if isinstance(request.get("argv"), list) else []
+    sys.argv = ["kumiho.mcp_server", *[str(arg) for arg in argv]]
+    # Only the server's dependencies stay warm; the entry module itself is
+    # executed fresh as __main__, exactly like ``python -m``.
+    sys.modules.pop("kumiho.mcp_server", None)
+    try:
+        runpy.run_module("kumiho.mcp_server", run_name="__main__", alter_sys=True)
+    except SystemExit as exc:
+        if exc.code is None:
+            return 0
+        return exc.code if isinstance(exc.code, int) else 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def _zygote_serve(install_key: str) -> int:
+    """Keep the server's heavy imports resident and fork a server per launch.
+
+    The loop is single-threaded on purpose: forking a process that has other
+    live threads can leave locks held in the child.
+    """
+    state_dir = _state_dir()
+    state_dir.mkdir(parents=True, exist_ok=True)
+    lock_handle = (state_dir / ZYGOTE_LOCK_FILE).open("a")
+    # A zygote that just retired itself may still be winding down.
+    deadline = time.monotonic() + ZYGOTE_CONNECT_TIMEOUT
+    while True:
+        try:
+            fcntl.flock(lock_handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except OSError:
+            if time.monotonic() >= deadline:
+                print("[kumiho-claude] Another zygote is already running.", file=sys.stderr)
+                return 0
+            time.sleep(0.1)
+    env_fingerprint = _zygote_env_fingerprint(dict(os.environ))
+    idle_timeout = _load_zygote_idle_timeout()
+    # Forked servers import from this slot long after the launch that started us.
+    _hold_runtime_slot(_runtime_slot_of(Path(sys.executable)))
+
+    started = time.monotonic()
+    preloaded = 0
+    for module in ZYGOTE_PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+            preloaded += 1
+        except Exception as exc:
+            # Not fatal: the forked server imports whatever is missing itself.
+            print(f"[kumiho-claude] Zygote could not preload {module}: {exc}", file=sys.stderr)
+    print(
+        f"[kumiho-claude] Zygote pid {os.getpid()} preloaded {preloaded} modules "
+        f"in {(time.monotonic() - started) * 1000:.0f}ms.",
+        file=sys.stderr,
+    )
+
+    socket_path = _zygote_socket_path()
+    if socket_path is None:
+        return 1
+    try:
+        socket_path.unlink()
+    except FileNotFoundError:
+        pass
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(socket_path))
+    os.chmod(socket_path, 0o600)
+    listener.listen(16)
+
+    stopping = False
+
+    def _request_stop(_signum, _frame) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    children: dict[int, socket.socket] = {}
+    spawned = 0
+    last_active = time.monotonic()
+
+    def _handle(conn: socket.socket) -> None:
+        nonlocal stopping, spawned
+        conn.settimeout(2.0)
+        if not _zygote_peer_is_us(conn):
+            conn.close()
+            return
+        request, fds = _zygote_recv(conn, with_fds=True)
+        op = (request or {}).get("op")
+        if op == "ping":
+            _zygote_send(
+                conn,
+                {
+                    "ok": True,
+                    "pid": os.getpid(),
+                    "python": sys.executable,
+                    "install_key": install_key,
+                    "uptime_s": round(time.monotonic() - started, 1),
+                    "spawned": spawned,
+                    "active": len(children),
+                    "env_fingerprint": env_fingerprint,
+                    "idle_timeout_s": idle_timeout,
+                },
+            )
+            conn.close()
+            return
+        if op == "stop":
+            stopping = True
+            _zygote_send(conn, {"ok": True})
+            conn.close()
+            return
+        if op != "spawn" or len(fds) != 3:
+            for fd in fds:
+                os.close(fd)
+            _zygote_send(conn, {"ok": False, "error": "bad request"})
+            conn.close()
+            return
+        if (
+            request.get("protocol") != ZYGOTE_PROTOCOL
+            or request.get("python") != sys.executable
+            or request.get("install_key") != install_key
+        ):
+            # The runtime moved on (new spec, new venv, new launcher); retire
+            # so the launcher can start a replacement.
+            for fd in fds:
+                os.close(fd)
+            _zygote_send(conn, {"ok": False, "error": "stale zygote"})
+            conn.close()
+            stopping = True
+            return
+        env = request.get("env")
+        if not isinstance(env, dict) or _zygote_env_fingerprint(env) != env_fingerprint:
+            # The preloaded modules saw a different token, endpoint or
+            # provider setup at import time; a fork would inherit stale state.
+            for fd in fds:
+                os.close(fd)
+            _zygote_send(conn, {"ok": False, "error": "environment changed"})
+            conn.close()
+            stopping = True
+            return
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                selector.close()
+                listener.close()
+                for other in children.values():
+                    other.close()
+                conn.close()
+                lock_handle.close()
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                code = _zygote_run_server(request, fds)
+            finally:
+                try:
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                finally:
+                    os._exit(code)
+        for fd in fds:
+            os.close(fd)
+        spawned += 1
+        children[pid] = conn
+        conn.settimeout(None)
+        _zygote_send(conn, {"ok": True, "pid": pid})
+        selector.register(conn, selectors.EVENT_READ, pid)
+
+    try:
+        while not stopping:
+            if idle_timeout and not children and time.monotonic() - last_active >= idle_timeout:
+                print(f"[kumiho-claude] Zygote idle for {idle_timeout:g}s; exiting.", file=sys.stderr)
+                break
+            for key, _events in selector.select(timeout=0.5):
+                if key.fileobj is listener:
+                    try:
+                        conn, _addr = listener.accept()
+                        _handle(conn)
+                    except (OSError, ValueError) as exc:
+                        print(f"[kumiho-claude] Zygote request failed: {exc}", file=sys.stderr)
+                    continue
+                # Readable launcher socket means it hung up: stop its server.
+                selector.unregister(key.fileobj)
+                try:
+                    os.kill(key.data, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            while children:
+                try:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if pid == 0:
+                    break
+                conn = children.pop(pid, None)
+                if conn is None:
+                    continue
+                last_active = time.monotonic()
+                try:
+                    selector.unregister(conn)
+                except (KeyError, ValueError):
+                    pass
+                try:
+                    _zygote_send(conn, {"exit": os.waitstatus_to_exitcode(status)})
+                except OSError:
+                    pass
+                conn.close()
+    finally:
+        selector.close()
+        listener.close()
+        try:
+            socket_path.unlink()
+        except FileNotFoundError:
+            pass
+    return 0
+
+
+def _zygote_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="run_kumiho_mcp.py zygote",
+        description="Manage the pre-warmed MCP server zygote (POSIX only).",
+    )
+    parser.add_argument("action", choices=("start", "stop", "status", "serve"))
+    parser.add_argument("--install-key", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if os.name == "nt" or not hasattr(socket, "send_fds"):
+        print("The zygote requires a POSIX platform with SCM_RIGHTS support.", file=sys.stderr)
+        return 2
+
+    if args.action == "serve":
+        return _zygote_serve(args.install_key or _served_install_key(Path(sys.executable)))
+
+    if args.action == "status":
+        reply = _zygote_request({"op": "ping"})
+        if not reply:
+            print("zygote: not running")
+            return 1
+        print(json.dumps(reply, indent=2))
+        return 0
+
+    if args.action == "stop":
+        reply = _zygote_request({"op": "stop"})
+        print("zygote: stopped" if reply else "zygote: not running")
+        return 0
+
+    _sanitize_placeholder_env_vars()
+    _hydrate_env_from_local_config()
+    python_path = _ensure_runtime()
+    if _zygote_request({"op": "ping"}):
+        print("zygote: already running")
+        return 0
+    _spawn_zygote(python_path, _served_install_key(python_path))
+    print(f"zygote: starting (log: {_state_dir() / ZYGOTE_LOG_FILE})")
+    return 0
+
+
+def _wheel_hashes(wheelhouse: Path, name: str, version: str) -> list[str]:
+    """sha256 of every wheel/sdist in *wheelhouse* matching ``name==version``."""
+    hashes: list[str] = []
+    for artifact in sorted(wheelhouse.iterdir()):
+        filename = artifact.name
+        if filename.endswith(".whl"):
+            parts = filename[:-4].split("-")
+        elif filename.endswith((".tar.gz", ".zip")):
+            parts = filename.rsplit(".tar.gz", 1)[0].rsplit(".zip", 1)[0].rsplit("-", 1)
+        else:
+            continue
+        if len(parts) < 2 or _normalize_dist_name(parts[0]) != name or parts[1] != version:
+            continue
+        hashes.append(hashlib.sha256(artifact.read_bytes()).hexdigest())
+    return hashes
+
+
+def _lock_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="run_kumiho_mcp.py lock",
+        description="Write a hash-pinned lockfile from the managed venv and a local wheelhouse.",
+    )
+    parser.add_argument("--output", default="", help=f"Lockfile path (default: <plugin root>/{LOCKFILE_NAME}).")
+    parser.add_argument("--wheelhouse", default="", help="Wheel directory (default: <runtime home>/wheelhouse).")
+    parser.add_argument(
+        "--download",
         action="store_true",
-        help="Provision runtime and verify required modules, then exit.",
+        help="Fetch the pinned distributions into the wheelhouse with 'pip download' first.",
     )
-    args, passthrough = parser.parse_known_args()
+    args = parser.parse_args(argv)
 
     _sanitize_placeholder_env_vars()
     _hydrate_env_from_local_config()
-    _bootstrap_desktop_server_entries()
-    _sync_token_to_mcp_json()
+    python_path = _ensure_runtime(allow_stale=False)
+    output = Path(args.output).expanduser() if args.output else _plugin_root() / LOCKFILE_NAME
+    wheelhouse = Path(args.wheelhouse).expanduser() if args.wheelhouse else _state_dir() / "wheelhouse"
+
+    installed = {
+        name: version
+        for name, version in _installed_distributions(python_path.parent.parent).items()
+        if name not in BOOTSTRAP_DISTRIBUTIONS
+    }
+    if args.download:
+        wheelhouse.mkdir(parents=True, exist_ok=True)
+        pins = [f"{name}=={version}" for name, version in sorted(installed.items())]
+        _run([str(python_path), "-m", "pip", "download", "--no-deps", "-d", str(wheelhouse), *pins])
+    if not wheelhouse.is_dir():
+        print(f"Wheelhouse {wheelhouse} does not exist; pass --download to populate it.", file=sys.stderr)
+        return 1
+
+    lines = [f"# Generated by run_kumiho_mcp.py lock for: {_resolve_package_spec()}"]
+    missing: list[str] = []
+    for name, version in sorted(installed.items()):
+        hashes = _wheel_hashes(wheelhouse, name, version)
+        if not hashes:
+            missing.append(f"{name}=={version}")
+            continue
+        lines.append(f"{name}=={version} " + " ".join(f"--hash=sha256:{digest}" for digest in hashes))
+    if missing:
+        print(
+            f"No wheel in {wheelhouse} for: {', '.join(missing)}. Pass --download to fetch them.",
+            file=sys.stderr,
+        )
+        return 1
+
+    output.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    print(f"Wrote {len(lines) - 1} pins to {output}.", file=sys.stderr)
+    return 0
+
+
+class _StartupProfiler:
+    """Time launcher phases with a monotonic clock and append them to a log.
+
+    Phases are always timed (it costs a few microseconds); the record is only
+    written when profiling was requested via ``--profile-startup`` or
+    ``KUMIHO_CLAUDE_PROFILE_STARTUP``.
+    """
+
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self.started = time.monotonic()
+        self.phases: dict[str, float] = {}
+        self.failures: dict[str, str] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.monotonic() - start) * 1000, 3)
+
+    def record(self, outcome: str) -> None:
+        total_ms = round((time.monotonic() - self.started) * 1000, 3)
+        if _METRICS is not None:
+            _METRICS.inc("kumiho_claude_launches", outcome=outcome)
+            for name, ms in self.phases.items():
+                _METRICS.observe("kumiho_claude_launch_phase_seconds", ms / 1000, phase=name)
+            _METRICS.observe("kumiho_claude_launch_phase_seconds", total_ms / 1000, phase="total")
+            _METRICS.flush()
+        if not self.enabled:
+            return
+        entry = {
+            "ts": round(time.time(), 3),
+            "pid": os.getpid(),
+            "platform": sys.platform,
+            "outcome": outcome,
+            "total_ms": total_ms,
+            "phases": self.phases,
+        }
+        if self.failures:
+            entry["failures"] = self.failures
+        breakdown = ", ".join(f"{name}={ms:.1f}ms" for name, ms in self.phases.items())
+        print(f"[kumiho-claude] Startup profile ({total_ms:.1f}ms): {breakdown}", file=sys.stderr)
+        path = _state_dir() / STARTUP_PROFILE_FILE
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if path.exists() and path.stat().st_size >= STARTUP_PROFILE_MAX_BYTES:
+                os.replace(path, path.with_name(path.name + ".1"))
+            with path.open("a", encoding="utf-8") as handle:
+                handle.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        except Exception as exc:
+            print(f"[kumiho-claude] Could not write startup profile: {exc}", file=sys.stderr)
+
+
+def _profile_startup_requested(flag: bool) -> bool:
+    if flag:
+        return True
+    return os.getenv("KUMIHO_CLAUDE_PROFILE_STARTUP", "").strip().lower() in {"1", "true", "yes"}
+
+
+def _load_startup_profiles(limit: int) -> list[dict]:
+    path = _state_dir() / STARTUP_PROFILE_FILE
+    records: list[dict] = []
+    for candidate in (path.with_name(path.name + ".1"), path):
+        if not candidate.exists():
+            continue
+        try:
+            lines = candidate.read_text(encoding="utf-8").splitlines()
+        except Exception:
+            continue
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(entry, dict) and isinstance(entry.get("phases"), dict):
+                records.append(entry)
+    return records[-limit:] if limit > 0 else records
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    # Nearest-rank percentile; exact enough for a few hundred launches.
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _profile_summary_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="run_kumiho_mcp.py profile-summary",
+        description="Summarize recorded startup profiles per phase.",
+    )
+    parser.add_argument(
+        "--last",
+        type=int,
+        default=100,
+        help="Number of most recent launches to include (default: 100, 0 for all).",
+    )
+    args = parser.parse_args(argv)
+
+    records = _load_startup_profiles(args.last)
+    if not records:
+        print(
+            f"No startup profiles in {_state_dir() / STARTUP_PROFILE_FILE}. "
+            "Launch with --profile-startup or KUMIHO_CLAUDE_PROFILE_STARTUP=1 first."
+        )
+        return 1
+
+    samples: dict[str, list[float]] = {}
+    totals: list[float] = []
+    for entry in records:
+        for name, value in entry["phases"].items():
+            if isinstance(value, (int, float)):
+                samples.setdefault(name, []).append(float(value))
+        total = entry.get("total_ms")
+        if isinstance(total, (int, float)):
+            totals.append(float(total))
+    if totals:
+        samples["total"] = totals
+
+    print(f"Startup phases across {len(records)} launch(es):")
+    print(f"{'phase':<20} {'n':>5} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+    for name, values in samples.items():
+        print(
+            f"{name:<20} {len(values):>5} {_percentile(values, 50):>10.1f} "
+            f"{_percentile(values, 95):>10.1f} {max(values):>10.1f}"
+        )
+    return 0
+
+
+class _DoctorCheck(NamedTuple):
+    name: str
+    func: Callable[[dict], tuple[str, str, object]]
+    timeout: float
+    deps: tuple[str, ...] = ()
+
+
+def _doctor_credentials(_results: dict) -> tuple[str, str, object]:
+    sources: list[str] = []
+    if _clean_token_candidate((os.getenv("KUMIHO_AUTH_TOKEN", "") or "").strip()):
+        sources.append("KUMIHO_AUTH_TOKEN")
+    cache_path = _cached_kumiho_auth_path()
+    body = _read_cached_kumiho_credentials() or {}
+    cached = [key for key in ("api_token", "control_plane_token", "id_token") if isinstance(body.get(key), str)]
+    if cached:
+        sources.append(f"{cache_path} ({', '.join(cached)})")
+    candidates = _discovery_token_candidates()
+    if not candidates:
+        return "fail", "no token in env, .env.local, settings, .mcp.json or the credential cache; run /kumiho-auth", []
+    return "ok", f"{len(candidates)} token candidate(s) from {'; '.join(sources) or 'local config'}", candidates
+
+
+def _doctor_jwt_expiry(results: dict) -> tuple[str, str, object]:
+    now = int(time.time())
+    notes: list[str] = []
+    usable = 0
+    soonest: int | None = None
+    for index, token in enumerate(results["credentials"], start=1):
+        claims = _decode_jwt_claims(token)
+        if claims is None:
+            notes.append(f"#{index} not a JWT")
+            continue
+        expiry = _token_expiry(token)
+        if expiry is None:
+            usable += 1
+            notes.append(f"#{index} no exp claim")
+        elif expiry <= now:
+            notes.append(f"#{index} expired {_format_age(now - expiry)} ago")
+        else:
+            usable += 1
+            soonest = expiry if soonest is None else min(soonest, expiry)
+            notes.append(f"#{index} expires in {_format_age(expiry - now)}")
+    detail = ", ".join(notes)
+    if not usable:
+        return "fail", detail, None
+    if soonest is not None and soonest - now < DOCTOR_JWT_WARN_WINDOW:
+        return "warn", detail, None
+    return "ok", detail, None
+
+
+def _format_age(seconds: float) -> str:
+    seconds = int(seconds)
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+
+def _doctor_discovery(results: dict) -> tuple[str, str, object]:
+    control_plane_url = _load_control_plane_url()
+    tenant_hint = os.getenv("KUMIHO_TENANT_HINT", "").strip()
+    try:
+        endpoint, _used = _request_discovery_endpoint(results["credentials"], control_plane_url, tenant_hint)
+    except RuntimeError as exc:
+        book_key = _endpoint_book_key(results["credentials"], control_plane_url, tenant_hint)
+        cached = _lookup_cached_endpoint(results["credentials"], control_plane_url, tenant_hint)
+        fallback = cached[0] if cached else next(iter(_known_endpoints(book_key)), None)
+        if fallback:
+            return "warn", f"{exc}; launches fall back to {fallback}", fallback
+        return "fail", str(exc), None
+    return "ok", f"{_build_discovery_url(control_plane_url)} -> {endpoint}", endpoint
+
+
+def _doctor_dns(results: dict) -> tuple[str, str, object]:
+    endpoint = results["discovery"]
+    try:
+        addresses = _resolve_endpoint_addresses(endpoint)
+    except OSError as exc:
+        return "fail", f"{endpoint}: {exc}", None
+    if not addresses:
+        return "fail", f"{endpoint} did not resolve", None
+    return "ok", f"{endpoint} -> {', '.join(addresses[:4])}", endpoint
+
+
+def _doctor_tcp(results: dict) -> tuple[str, str, object]:
+    endpoint = results["dns"]
+    latency = _probe_endpoint(endpoint, DOCTOR_CONNECT_TIMEOUT, tls=False)
+    if latency is None:
+        return "fail", f"could not connect to {endpoint} within {DOCTOR_CONNECT_TIMEOUT:g}s", None
+    return "ok", f"connected to {endpoint} in {latency}ms", None
+
+
+def _doctor_venv(_results: dict) -> tuple[str, str, object]:
+    install_key = _runtime_install_key()
+    slot = _runtime_slot(install_key)
+    python_path = _venv_python(slot / "venv")
+    if _install_manifest_matches(slot / INSTALL_MANIFEST_FILE, python_path, install_key):
+        return "ok", f"runtime {slot.name} matches its install manifest", python_path
+    active = _active_runtime_slot()
+    if active is not None:
+        active_python = _venv_python(active / "venv")
+        failure = _runtime_build_failure(install_key)
+        if failure is not None:
+            detail = (
+                f"requested runtime {slot.name} failed to build {failure.get('failures')} time(s): "
+                f"{failure.get('error')}; serving {active.name}"
+            )
+            return "fail", detail, active_python
+        if python_path.exists():
+            detail = f"requested runtime {slot.name} does not verify; serving {active.name}"
+        else:
+            detail = f"requested runtime {slot.name} not built yet; serving {active.name}"
+        return "warn", detail, active_python
+    if python_path.exists():
+        return "fail", f"runtime {slot.name} exists but does not match its install manifest", python_path
+    return "fail", "no runtime provisioned; the next launch installs one", None
+
+
+def _doctor_modules(results: dict) -> tuple[str, str, object]:
+    python_path = results["venv"]
+    if python_path is None:
+        return "skip", "no runtime to import from", None
+    check_code = (
+        "import importlib.util,sys;"
+        "mods=('kumiho.mcp_server','kumiho_memory');"
+        "missing=[m for m in mods if importlib.util.find_spec(m) is None];"
+        "print(','.join(missing));"
+        "sys.exit(1 if missing else 0)"
+    )
+    try:
+        proc = subprocess.run(
+            [str(python_path), "-c", check_code],
+            capture_output=True,
+            text=True,
+            timeout=DOCTOR_IMPORT_TIMEOUT,
+            check=False,
+        )
+    except (OSError, subprocess.TimeoutExpired) as exc:
+        return "fail", str(exc), None
+    if proc.returncode != 0:
+        missing = proc.stdout.strip() or proc.stderr.strip().splitlines()[-1:]
+        return "fail", f"not importable: {missing}", None
+    return "ok", "kumiho.mcp_server and kumiho_memory are importable", None
+
+
+def _doctor_desktop_config(_results: dict) -> tuple[str, str, object]:
+    problems: list[str] = []
+    notes: list[str] = []
+    token = _clean_token_candidate((os.getenv("KUMIHO_AUTH_TOKEN", "") or "").strip())
+    for path in [*_claude_desktop_config_paths(), _plugin_root() / ".mcp.json"]:
+        if not path.exists():
+            continue
+        try:
+            body = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as exc:
+            problems.append(f"{path}: unreadable ({exc})")
+            continue
+        servers = body.get("mcpServers") if isinstance(body, dict) else None
+        entry = None
+        if isinstance(servers, dict):
+            names = [name for name in ("kumiho-memory", "kumiho") if isinstance(servers.get(name), dict)]
+            entry = servers[names[0]] if names else None
+        if entry is None:
+            problems.append(f"{path}: no kumiho-memory server entry")
+            continue
+        command = entry.get("command") or ""
+        args = entry.get("args") or []
+        if Path(command).is_absolute() and not Path(command).exists():
+            problems.append(f"{path}: command {command} is missing")
+        elif args and "${" not in str(args[0]) and not Path(args[0]).exists():
+            problems.append(f"{path}: launcher {args[0]} is missing")
+        env = entry.get("env") if isinstance(entry.get("env"), dict) else {}
+        configured = _clean_token_candidate(str(env.get("KUMIHO_AUTH_TOKEN") or ""))
+        if configured and not _looks_like_placeholder(configured) and token and configured != token:
+            notes.append(f"{path}: KUMIHO_AUTH_TOKEN differs from the resolved token")
+        else:
+            notes.append(f"{path}: ok")
+    if problems:
+        return "fail", "; ".join(problems + notes), None
+    if not notes:
+        return "warn", "no Claude Desktop config or .mcp.json found", None
+    status = "warn" if any("differs" in note for note in notes) else "ok"
+    return status, "; ".join(notes), None
+
+
+def _doctor_checks() -> tuple[_DoctorCheck, ...]:
+    return (
+        _DoctorCheck("credentials", _doctor_credentials, 2.0),
+        _DoctorCheck("jwt_expiry", _doctor_jwt_expiry, 1.0, ("credentials",)),
+        _DoctorCheck("discovery", _doctor_discovery, _load_discovery_timeout() + 1, ("credentials",)),
+        _DoctorCheck("dns", _doctor_dns, 3.0, ("discovery",)),
+        _DoctorCheck("tcp", _doctor_tcp, DOCTOR_CONNECT_TIMEOUT + 1, ("dns",)),
+        _DoctorCheck("venv", _doctor_venv, 5.0),
+        _DoctorCheck("modules", _doctor_modules, DOCTOR_IMPORT_TIMEOUT + 1, ("venv",)),
+        _DoctorCheck("desktop_config", _doctor_desktop_config, 2.0),
+    )
+
+
+def _run_doctor_checks(checks: tuple[_DoctorCheck, ...]) -> list[dict]:
+    """Run *checks* concurrently, each as soon as its dependencies passed.
+
+    Checks run on daemon threads like discovery candidates do: one that
+    overruns its timeout is reported and abandoned rather than awaited.
+    A check whose dependency failed (or produced nothing to test) is skipped.
+    """
+    report: dict[str, dict] = {}
+    values: dict[str, object] = {}
+    finished: queue.Queue = queue.Queue()
+    pending = list(checks)
+    running: dict[str, tuple[_DoctorCheck, float]] = {}
+
+    def _worker(check: _DoctorCheck, inputs: dict) -> None:
+        started = time.monotonic()
+        try:
+            status, detail, value = check.func(inputs)
+        except Exception as exc:
+            status, detail, value = "fail", f"{type(exc).__name__}: {exc}", None
+        finished.put((check.name, status, detail, value, time.monotonic() - started))
+
+    while pending or running:
+        for check in list(pending):
+            blocked = next((dep for dep in check.deps if dep in report and values.get(dep) is None), None)
+            if blocked is not None:
+                pending.remove(check)
+                report[check.name] = {"status": "skip", "detail": f"needs {blocked}", "ms": 0.0}
+            elif all(dep in values for dep in check.deps):
+                pending.remove(check)
+                running[check.name] = (check, time.monotonic() + check.timeout)
+                threading.Thread(
+                    target=_worker,
+                    args=(check, dict(values)),
+                    name=f"kumiho-doctor-{check.name}",
+                    daemon=True,
+                ).start()
+        if not running:
+            break
+        wait = max(0.0, min(deadline for _check, deadline in running.values()) - time.monotonic())
+        try:
+            name, status, detail, value, elapsed = finished.get(timeout=wait)
+        except queue.Empty:
+            now = time.monotonic()
+            for name, (check, deadline) in list(running.items()):
+                if deadline <= now:
+                    del running[name]
+                    report[name] = {
+                        "status": "timeout",
+                        "detail": f"no answer within {check.timeout:g}s",
+                        "ms": check.timeout * 1000,
+                    }
+            continue
+        if name not in running:
+            continue  # already reported as timed out
+        del running[name]
+        report[name] = {"status": status, "detail": detail, "ms": round(elapsed * 1000, 1)}
+        if status in {"ok", "warn"} and value is not None:
+            values[name] = value
+        elif status in {"ok", "warn"}:
+            values[name] = True
+    return [{"check": check.name, **report[check.name]} for check in checks if check.name in report]
+
+
+def _doctor_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="run_kumiho_mcp.py doctor",
+        description="Run every connectivity and runtime health check concurrently and report the results.",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args(argv)
+
+    started = time.monotonic()
+    # Hydration logs where each value came from; keep that for the report
+    # instead of interleaving it with the table.
+    hydration_log = io.StringIO()
+    with contextlib.redirect_stderr(hydration_log):
+        _sanitize_placeholder_env_vars()
+        _hydrate_env_from_local_config()
+    report = _run_doctor_checks(_doctor_checks())
+    total_ms = round((time.monotonic() - started) * 1000, 1)
+    sources = [line.split("] ", 1)[-1] for line in hydration_log.getvalue().splitlines() if "Loaded " in line]
+
+    if args.json:
+        print(json.dumps({"total_ms": total_ms, "hydrated": sources, "checks": report}, indent=2))
+    else:
+        for line in sources:
+            print(f"  {line}")
+        print(f"{'check':<16} {'status':<8} {'ms':>8}  detail")
+        for entry in report:
+            print(f"{entry['check']:<16} {entry['status'].upper():<8} {entry['ms']:>8.0f}  {entry['detail']}")
+        print(f"Finished {len(report)} checks in {total_ms:.0f}ms.")
+    return 1 if any(entry["status"] in {"fail", "timeout"} for entry in report) else 0
+
+
+def _metrics_main(argv: list[str]) -> int:
+    if kumiho_metrics is None:
+        print("[kumiho-claude] kumiho_metrics.py is missing next to this script.", file=sys.stderr)
+        return 1
+    return kumiho_metrics.main(argv, prog="run_kumiho_mcp.py metrics")
+
+
+class _BootstrapStage(NamedTuple):
+    name: str
+    func: Callable[[], object]
+    deps: tuple[str, ...] = ()
+    # Optional stages only print advice; exec does not wait for them.
+    optional: bool = False
+
+
+def _check_auth_token() -> None:
     _validate_auth_token()
     _warn_auth()
+
+
+def _discovery_stage() -> None:
     try:
         _bootstrap_server_endpoint()
-    except RuntimeError as exc:
-        # Prevent SDK from falling back to localhost:8080.
+        _prefetch_endpoint_dns()
+    except Exception as exc:
+        # Any failure here (not just a discovery RuntimeError) leaves the
+        # endpoint unset; prevent SDK from falling back to localhost:8080.
         os.environ["KUMIHO_SERVER_ENDPOINT"] = "needs-auth.kumiho.invalid:443"
         print(
             "[kumiho-claude] Discovery bootstrap failed. "
@@ -820,8 +4537,149 @@ def main() -> int:
             f"Error: {exc}",
             file=sys.stderr,
         )
-    _configure_llm_fallback()
-    python_path = _ensure_runtime()
+
+
+def _run_bootstrap_stages(
+    stages: list[_BootstrapStage], profiler: _StartupProfiler
+) -> tuple[dict[str, object], dict[str, BaseException]]:
+    """Run *stages* on a small pool, each as soon as its dependencies succeed.
+
+    Stages must be listed after their dependencies.  Independent I/O (the
+    discovery round trip, the venv check, config rewrites) overlaps; a
+    failed stage skips everything that depends on it.  Returns once every
+    required stage has finished: those write config files or the server's
+    environment, and exec would cut them short.  Optional stages get
+    ``BOOTSTRAP_OPTIONAL_GRACE`` more and are then left running.
+    """
+    results: dict[str, object] = {}
+    failures: dict[str, BaseException] = {}
+    pending = list(stages)
+    running: dict[concurrent.futures.Future, _BootstrapStage] = {}
+
+    def _timed(stage: _BootstrapStage) -> object:
+        with profiler.phase(stage.name):
+            return stage.func()
+
+    def _collect(done: set[concurrent.futures.Future]) -> None:
+        for future in done:
+            name = running.pop(future).name
+            try:
+                results[name] = future.result()
+            except Exception as exc:
+                failures[name] = exc
+                profiler.failures[name] = str(exc)
+                print(f"[kumiho-claude] Bootstrap stage {name} failed: {exc}", file=sys.stderr)
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=BOOTSTRAP_WORKERS, thread_name_prefix="kumiho-bootstrap"
+    )
+    try:
+        while True:
+            for stage in list(pending):
+                blocked = next((dep for dep in stage.deps if dep in failures), None)
+                if blocked is not None:
+                    pending.remove(stage)
+                    failures[stage.name] = RuntimeError(f"skipped because {blocked} failed")
+                    profiler.failures[stage.name] = f"skipped because {blocked} failed"
+                elif all(dep in results for dep in stage.deps):
+                    pending.remove(stage)
+                    running[executor.submit(_timed, stage)] = stage
+            if not any(not stage.optional for stage in (*pending, *running.values())):
+                break
+            if not running:
+                raise RuntimeError(f"Bootstrap stage {pending[0].name} has unmet dependencies.")
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            _collect(done)
+        if running:
+            done, _ = concurrent.futures.wait(running, timeout=BOOTSTRAP_OPTIONAL_GRACE)
+            _collect(done)
+        for stage in (*pending, *running.values()):
+            profiler.failures[stage.name] = "not finished at handoff"
+    finally:
+        executor.shutdown(wait=False)
+    return results, failures
+
+
+def main() -> int:
+    argv = sys.argv[1:]
+    subcommands = {
+        "doctor": _doctor_main,
+        "lock": _lock_main,
+        "metrics": _metrics_main,
+        "profile-summary": _profile_summary_main,
+        "zygote": _zygote_main,
+    }
+    if argv and argv[0] in subcommands:
+        return subcommands[argv[0]](argv[1:])
+
+    parser = argparse.ArgumentParser(description="Run Kumiho MCP with auto-bootstrap.")
+    parser.add_argument(
+        "--self-test",
+        action="store_true",
+        help="Provision runtime, verify required modules and report import times, then exit.",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Time each startup phase and append the result to the startup profile log.",
+    )
+    parser.add_argument(
+        "--supervise",
+        action="store_true",
+        help="Stay resident and restart the MCP server when cached credentials change.",
+    )
+    parser.add_argument(
+        "--proxy",
+        action="store_true",
+        help="Relay stdio to the MCP server and record per-tool latency metrics.",
+    )
+    parser.add_argument(
+        "--build-bundle",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="PATH",
+        help="Provision the runtime and pack it into a relocatable bundle archive, then exit.",
+    )
+    parser.add_argument(
+        "--install-bundle",
+        default="",
+        metavar="PATH",
+        help="Provision the runtime from a bundle archive built with --build-bundle, then exit.",
+    )
+    parser.add_argument("--refresh-discovery-cache", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--build-runtime", action="store_true", help=argparse.SUPPRESS)
+    args, passthrough = parser.parse_known_args(argv)
+
+    if args.refresh_discovery_cache:
+        return _refresh_discovery_cache()
+    if args.build_runtime:
+        return _build_runtime_in_background()
+    if args.build_bundle is not None or args.install_bundle:
+        _sanitize_placeholder_env_vars()
+        _hydrate_env_from_local_config()
+        if args.install_bundle:
+            return _install_runtime_bundle_main(Path(args.install_bundle).expanduser())
+        return _build_runtime_bundle(Path(args.build_bundle).expanduser() if args.build_bundle else None)
+
+    launch_env = dict(os.environ)
+    # --self-test verifies the requested runtime, so it waits for the install.
+    ensure_runtime = functools.partial(_ensure_runtime, allow_stale=not args.self_test)
+    profiler = _StartupProfiler(_profile_startup_requested(args.profile_startup))
+    stages = [
+        _BootstrapStage("sanitize", _sanitize_placeholder_env_vars),
+        _BootstrapStage("hydrate_env", _hydrate_env_from_local_config, ("sanitize",)),
+        _BootstrapStage("config_sync", _sync_mcp_configs, ("hydrate_env",)),
+        _BootstrapStage("validate_auth", _check_auth_token, ("hydrate_env",), optional=True),
+        _BootstrapStage("discovery", _discovery_stage, ("hydrate_env",)),
+        _BootstrapStage("llm_fallback", _configure_llm_fallback, ("hydrate_env",)),
+        _BootstrapStage("runtime", ensure_runtime, ("hydrate_env",)),
+    ]
+    results, failures = _run_bootstrap_stages(stages, profiler)
+    if "runtime" in failures:
+        profiler.record("failed")
+        raise failures["runtime"]
+    python_path = results["runtime"]
 
     if args.self_test:
         check_code = (
@@ -831,9 +4689,61 @@ def main() -> int:
             "print('ok' if not missing else 'missing:' + ','.join(missing));"
             "sys.exit(0 if not missing else 1)"
         )
-        return _run([str(python_path), "-c", check_code], check=False)
-
-    cmd = [str(python_path), "-m", "kumiho.mcp_server", *passthrough]
+        with profiler.phase("self_test"):
+            code = _run([str(python_path), "-c", check_code], check=False)
+            if code == 0:
+                code = _report_import_times(python_path)
+        profiler.record("self-test")
+        return code
+
+    supervise = _supervise_requested(args.supervise)
+    proxy = _proxy_requested(args.proxy)
+    if supervise or proxy:
+
+        def reload_env() -> None:
+            # Re-resolve from the launch environment so new credentials win
+            # exactly as they would on a fresh start.
+            os.environ.clear()
+            os.environ.update(launch_env)
+            _sanitize_placeholder_env_vars()
+            _hydrate_env_from_local_config()
+            _discovery_stage()
+            _configure_llm_fallback()
+
+        profiler.record("supervise" if supervise else "proxy")
+        cmd = [str(python_path), "-m", "kumiho.mcp_server", *passthrough]
+        meter = _ToolMeter() if proxy else None
+        recall_settings = _load_recall_cache_settings() if proxy else None
+        recall_cache = _RecallCache(*recall_settings) if recall_settings else None
+        trim_settings = _load_recall_trim_settings() if proxy else None
+        return _Supervisor(
+            cmd,
+            reload_env,
+            watch=supervise,
+            meter=meter,
+            recall_cache=recall_cache,
+            coalesce_writes=proxy and _coalesce_writes_requested(),
+            recall_trimmer=_RecallTrimmer(*trim_settings) if trim_settings else None,
+        ).run()
+
+    if _zygote_enabled() and _zygote_socket_path() is not None:
+        install_key = _served_install_key(python_path)
+        with profiler.phase("zygote_handoff"):
+            zygote = _zygote_connect(python_path, install_key, passthrough)
+        if zygote is not None:
+            profiler.record("zygote")
+            return _zygote_wait(zygote)
+        # Cold start this time; the next launch finds a warm zygote.
+        _spawn_zygote(python_path, install_key)
+
+    with profiler.phase("exec_handoff"):
+        cmd = [str(python_path), "-m", "kumiho.mcp_server", *passthrough]
+        # execv discards unflushed Python-level buffers.
+        sys.stdout.flush()
+        sys.stderr.flush()
+    # The record must be written before handing off: execv never returns and
+    # subprocess.run below blocks for the whole session.
+    profiler.record("exec")
     # On Windows os.execv spawns a new process and immediately exits the
     # current one.  Claude Desktop monitors the original PID; when it exits
     # the transport is closed ~85 ms later even though the child is still
@@ -27,9 +27,15 @@ from __future__ import annotations
 import json
 import os
 import sys
+import time
 from datetime import datetime, timezone
 from pathlib import Path
 
+try:
+    import kumiho_metrics
+except ImportError:  # metrics are optional; never lose the artifact over them
+    kumiho_metrics = None
+
 
 def _read_hook_input() -> dict:
     """Read the JSON payload from stdin."""
@@ -278,5 +284,17 @@ def main() -> int:
     return 0
 
 
+def _run() -> int:
+    started = time.monotonic()
+    outcome = "error"
+    try:
+        code = main()
+        outcome = "ok" if code == 0 else "failed"
+        return code
+    finally:
+        if kumiho_metrics is not None:
+            kumiho_metrics.record_hook("save-session-artifact", started, outcome)
+
+
 if __name__ == "__main__":
-    raise SystemExit(main())
+    raise SystemExit(_run())
@@ -15,6 +15,14 @@ from __future__ import annotations
 
 import json
 import sys
+import time
+
+_STARTED = time.monotonic()
+
+try:
+    import kumiho_metrics
+except ImportError:  # metrics are optional; never block session start
+    kumiho_metrics = None
 
 CONTEXT = (
     "SESSION-START INSTRUCTION (kumiho-memory plugin)\n"
@@ -77,14 +85,20 @@ CONTEXT = (
     "kumiho_memory_discover_edges on the returned revision_kref."
 )
 
-print(
-    json.dumps(
-        {
-            "hookSpecificOutput": {
-                "hookEventName": "SessionStart",
-                "additionalContext": CONTEXT,
+_outcome = "error"
+try:
+    print(
+        json.dumps(
+            {
+                "hookSpecificOutput": {
+                    "hookEventName": "SessionStart",
+                    "additionalContext": CONTEXT,
+                }
             }
-        }
+        )
     )
-)
+    _outcome = "ok"
+finally:
+    if kumiho_metrics is not None:
+        kumiho_metrics.record_hook("session-bootstrap", _STARTED, _outcome)
 sys.exit(0)
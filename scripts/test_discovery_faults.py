@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""Fault-injection suite for discovery and token resolution.
+
+Every scenario launches run_kumiho_mcp.py end to end against
+``mock_control_plane.py`` with injected faults (latency, 401/403/5xx,
+connection resets, truncated bodies, malformed routing) and a stub
+``kumiho.mcp_server``.  It checks which endpoint the server was started with
+(the discovered one, a cached one, or the needs-auth sentinel) and that the
+first JSON-RPC response arrived within the scenario's time-to-ready budget.
+
+Usage (from kumiho-claude/ or repo root):
+    python kumiho-claude/scripts/test_discovery_faults.py
+    python kumiho-claude/scripts/test_discovery_faults.py --repeat 5 --only hung
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+import bench_startup as bench
+import run_kumiho_mcp as bootstrap
+from mock_control_plane import Fault, MockControlPlane
+
+SENTINEL_ENDPOINT = "needs-auth.kumiho.invalid:443"
+DISCOVERY_TIMEOUT = 2.0
+# Launch overhead allowed on top of any injected delay.
+DEFAULT_BASE_BUDGET = 1.0
+
+
+class Scenario(NamedTuple):
+    name: str
+    expect: str  # "discovered" or "sentinel"
+    faults: tuple[Fault, ...] = ()
+    default_fault: Fault | None = None
+    # Faults for a second token from the credential cache; None means no second token.
+    cached_token_faults: tuple[Fault, ...] | None = None
+    # Launch once against a healthy control plane first to populate caches.
+    prime: bool = False
+    cache_ttl: int | None = None
+    # Seconds added to the base budget (injected latency, discovery deadline).
+    extra_budget: float = 0.0
+    max_requests: int | None = None
+
+
+SCENARIOS = (
+    Scenario("healthy", "discovered", max_requests=1),
+    Scenario("slow", "discovered", faults=(Fault("ok", latency=0.8),), extra_budget=0.8),
+    Scenario("unauthorized", "sentinel", faults=(Fault("status", 401),)),
+    Scenario("forbidden", "sentinel", faults=(Fault("status", 403),)),
+    Scenario("server-error", "sentinel", default_fault=Fault("status", 503)),
+    Scenario("bad-gateway", "sentinel", default_fault=Fault("status", 502)),
+    Scenario("connection-reset", "sentinel", default_fault=Fault("reset")),
+    Scenario("truncated-body", "sentinel", default_fault=Fault("truncate")),
+    Scenario("invalid-json", "sentinel", default_fault=Fault("invalid_json")),
+    Scenario("missing-region", "sentinel", default_fault=Fault("no_region")),
+    Scenario("missing-target", "sentinel", default_fault=Fault("no_target")),
+    Scenario(
+        "hung",
+        "sentinel",
+        default_fault=Fault("ok", latency=DISCOVERY_TIMEOUT + 3),
+        extra_budget=DISCOVERY_TIMEOUT,
+    ),
+    Scenario(
+        "race-rejected-env-token",
+        "discovered",
+        faults=(Fault("status", 401),),
+        cached_token_faults=(),
+    ),
+    Scenario(
+        "race-hung-env-token",
+        "discovered",
+        faults=(Fault("ok", latency=DISCOVERY_TIMEOUT + 3),),
+        cached_token_faults=(),
+    ),
+    Scenario(
+        "race-all-rejected",
+        "sentinel",
+        faults=(Fault("status", 401),),
+        cached_token_faults=(Fault("status", 403),),
+    ),
+    Scenario(
+        "outage-fresh-cache",
+        "discovered",
+        default_fault=Fault("status", 503),
+        prime=True,
+        max_requests=0,
+    ),
+    Scenario(
+        "outage-expired-cache",
+        "discovered",
+        default_fault=Fault("status", 503),
+        prime=True,
+        cache_ttl=1,
+    ),
+    Scenario(
+        "reset-expired-cache",
+        "discovered",
+        default_fault=Fault("reset"),
+        prime=True,
+        cache_ttl=1,
+    ),
+)
+
+
+class Outcome(NamedTuple):
+    scenario: str
+    passed: bool
+    ready_ms: float
+    budget_ms: float
+    endpoint: str
+    requests: int
+    detail: str
+
+
+def _write_cached_token(sandbox: bench._Sandbox, token: str) -> None:
+    path = Path(sandbox.env["KUMIHO_CONFIG_DIR"]) / "kumiho_authentication.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    body = {"control_plane_token": token, "cp_expires_at": int(time.time()) + 3600}
+    path.write_text(json.dumps(body), encoding="utf-8")
+
+
+def _run_scenario(
+    scenario: Scenario,
+    sandbox: bench._Sandbox,
+    plane: MockControlPlane,
+    launcher: Path,
+    base_budget: float,
+) -> Outcome:
+    sandbox.reset_caches()
+    plane.reset()
+    saved_env = dict(sandbox.env)
+    sandbox.env["KUMIHO_CLAUDE_DISCOVERY_TIMEOUT"] = str(DISCOVERY_TIMEOUT)
+    if scenario.cache_ttl is not None:
+        sandbox.env["KUMIHO_CLAUDE_DISCOVERY_CACHE_TTL"] = str(scenario.cache_ttl)
+    env_token = sandbox.env["KUMIHO_AUTH_TOKEN"]
+    try:
+        if scenario.prime:
+            bench._launch_once(sandbox, launcher)
+            if scenario.cache_ttl is not None:
+                time.sleep(scenario.cache_ttl + 0.1)  # let the cached entry expire
+            plane.reset()
+        if scenario.cached_token_faults is not None:
+            cached_token = bench._fake_jwt("bench-cached")
+            _write_cached_token(sandbox, cached_token)
+            plane.inject(*scenario.cached_token_faults, token=cached_token)
+            plane.inject(*scenario.faults, token=env_token)
+        else:
+            plane.inject(*scenario.faults)
+        plane.default_fault = scenario.default_fault or Fault()
+
+        budget = base_budget + scenario.extra_budget
+        try:
+            timings = bench._launch_once(sandbox, launcher)
+        except RuntimeError as exc:
+            return Outcome(scenario.name, False, 0.0, budget * 1000, "", plane.request_count(), str(exc))
+        endpoint = sandbox.exec_record().get("endpoint", "")
+    finally:
+        sandbox.env.clear()
+        sandbox.env.update(saved_env)
+
+    expected = SENTINEL_ENDPOINT if scenario.expect == "sentinel" else plane.grpc_authority
+    ready_ms = timings["time_to_first_response_ms"]
+    requests = plane.request_count()
+    problems: list[str] = []
+    if endpoint != expected:
+        problems.append(f"endpoint {endpoint or '(unset)'}, expected {expected}")
+    if ready_ms > budget * 1000:
+        problems.append(f"ready after {ready_ms:.0f}ms, budget {budget * 1000:.0f}ms")
+    if scenario.max_requests is not None and requests > scenario.max_requests:
+        problems.append(f"{requests} discovery request(s), expected at most {scenario.max_requests}")
+    return Outcome(scenario.name, not problems, ready_ms, budget * 1000, endpoint, requests, "; ".join(problems))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run discovery fault-injection scenarios against the launcher.")
+    parser.add_argument("--only", action="append", default=[], help="Run scenarios whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scenario; the slowest one is reported")
+    parser.add_argument(
+        "--base-budget",
+        type=float,
+        default=DEFAULT_BASE_BUDGET,
+        help=f"Seconds of launch overhead allowed on top of injected delays (default: {DEFAULT_BASE_BUDGET:g})",
+    )
+    parser.add_argument("--json", action="store_true", help="Print outcomes as JSON")
+    args = parser.parse_args()
+
+    scenarios = [s for s in SCENARIOS if not args.only or any(text in s.name for text in args.only)]
+    if not scenarios:
+        print(f"No scenario matches {', '.join(args.only)}.", file=sys.stderr)
+        return 2
+    launcher = Path(bootstrap.__file__).resolve()
+
+    # A listening socket so endpoint probes against the mock region succeed.
+    grpc_listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    grpc_listener.bind(("127.0.0.1", 0))
+    grpc_listener.listen(64)
+    authority = f"127.0.0.1:{grpc_listener.getsockname()[1]}"
+
+    outcomes: list[Outcome] = []
+    with tempfile.TemporaryDirectory(prefix="kumiho-faults-") as tmp, MockControlPlane(authority) as plane:
+        sandbox = bench._Sandbox(Path(tmp), plane.url, 0.0, {})
+        sandbox.provision()
+        for scenario in scenarios:
+            runs = [
+                _run_scenario(scenario, sandbox, plane, launcher, args.base_budget)
+                for _ in range(max(1, args.repeat))
+            ]
+            failed = [run for run in runs if not run.passed]
+            outcomes.append(failed[0] if failed else max(runs, key=lambda run: run.ready_ms))
+    grpc_listener.close()
+
+    if args.json:
+        print(json.dumps([outcome._asdict() for outcome in outcomes], indent=2))
+    else:
+        print(f"{'scenario':<26} {'result':<6} {'ready ms':>9} {'budget ms':>10} {'requests':>9}  endpoint")
+        for outcome in outcomes:
+            print(
+                f"{outcome.scenario:<26} {'PASS' if outcome.passed else 'FAIL':<6} {outcome.ready_ms:>9.0f} "
+                f"{outcome.budget_ms:>10.0f} {outcome.requests:>9}  {outcome.endpoint}"
+            )
+            if outcome.detail:
+                print(f"  {outcome.detail}")
+        worst = max(outcomes, key=lambda outcome: outcome.ready_ms)
+        print(f"worst-case time-to-ready: {worst.ready_ms:.0f}ms ({worst.scenario})")
+
+    failures = [outcome for outcome in outcomes if not outcome.passed]
+    if failures:
+        print(f"FAIL: {len(failures)} of {len(outcomes)} scenario(s) failed", file=sys.stderr)
+        return 1
+    print(f"PASS: {len(outcomes)} scenario(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
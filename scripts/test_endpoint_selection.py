@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Scenario checks for choosing among known endpoints (``_select_endpoint``).
+
+Connect latency cannot be shaped on a loopback socket, so each scenario
+replaces ``_probe_endpoint`` with a stand-in that sleeps for a scripted
+latency and then answers (or fails).  Everything else, including the
+endpoint book in a throwaway runtime home, is the launcher's own code.
+
+Usage (from kumiho-claude/ or repo root):
+    python kumiho-claude/scripts/test_endpoint_selection.py
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import time
+from typing import NamedTuple
+
+import run_kumiho_mcp as bootstrap
+
+PROBE_TIMEOUT = 0.75
+BOOK_KEY = "endpoint-selection-test"
+
+
+class Probe(NamedTuple):
+    delay: float  # seconds before the probe returns
+    healthy: bool = True
+
+
+class Scenario(NamedTuple):
+    name: str
+    preferred: str
+    probes: dict[str, Probe]
+    expect: str
+    # Upper bound on how long selection may take, in seconds.
+    budget: float = 0.5
+    repeat: int = 1
+    # Endpoints that must no longer be in the book afterwards.
+    forgotten: tuple[str, ...] = ()
+
+
+SCENARIOS = (
+    Scenario(
+        "slow-preferred-loses",
+        "preferred:443",
+        {"preferred:443": Probe(0.06), "fast:443": Probe(0.01)},
+        expect="fast:443",
+    ),
+    Scenario(
+        "near-tie-keeps-preferred",
+        "preferred:443",
+        {"preferred:443": Probe(0.012), "fast:443": Probe(0.01)},
+        expect="preferred:443",
+    ),
+    Scenario(
+        "refused-preferred",
+        "preferred:443",
+        {"preferred:443": Probe(0.0, healthy=False), "alt:443": Probe(0.02)},
+        expect="alt:443",
+    ),
+    Scenario(
+        "silent-preferred",
+        "preferred:443",
+        {"preferred:443": Probe(PROBE_TIMEOUT, healthy=False), "alt:443": Probe(0.01)},
+        expect="alt:443",
+        budget=0.3,
+    ),
+    Scenario(
+        "dead-alternative-does-not-block",
+        "preferred:443",
+        {"preferred:443": Probe(0.005), "dead:443": Probe(PROBE_TIMEOUT, healthy=False)},
+        expect="preferred:443",
+        budget=0.25,
+    ),
+    Scenario(
+        "nothing-answers",
+        "preferred:443",
+        {"preferred:443": Probe(0.0, healthy=False), "alt:443": Probe(0.0, healthy=False)},
+        expect="preferred:443",
+    ),
+    Scenario(
+        "repeat-failures-forgotten",
+        "preferred:443",
+        {"preferred:443": Probe(0.005), "gone:443": Probe(0.0, healthy=False)},
+        expect="preferred:443",
+        repeat=bootstrap.ENDPOINT_BOOK_MAX_FAILURES,
+        forgotten=("gone:443",),
+    ),
+)
+
+
+def _run_scenario(scenario: Scenario) -> str:
+    """Return an empty string on success, else what went wrong."""
+
+    def probe(endpoint: str, timeout: float, tls: bool) -> float | None:
+        scripted = scenario.probes.get(endpoint, Probe(0.0, healthy=False))
+        time.sleep(min(scripted.delay, timeout))
+        return round(scripted.delay * 1000, 1) if scripted.healthy else None
+
+    # Fresh book per scenario; the preferred endpoint is remembered last so
+    # it is also the most recent entry, as after a real discovery.
+    book = bootstrap._state_dir() / bootstrap.ENDPOINT_BOOK_FILE
+    book.unlink(missing_ok=True)
+    for endpoint in scenario.probes:
+        if endpoint != scenario.preferred:
+            bootstrap._remember_endpoint(BOOK_KEY, endpoint)
+    bootstrap._remember_endpoint(BOOK_KEY, scenario.preferred)
+
+    original = bootstrap._probe_endpoint
+    bootstrap._probe_endpoint = probe
+    try:
+        problems: list[str] = []
+        for _ in range(scenario.repeat):
+            started = time.monotonic()
+            chosen = bootstrap._select_endpoint(scenario.preferred, BOOK_KEY)
+            elapsed = time.monotonic() - started
+            if chosen != scenario.expect:
+                problems.append(f"chose {chosen}, expected {scenario.expect}")
+            if elapsed > scenario.budget:
+                problems.append(f"took {elapsed * 1000:.0f}ms, budget {scenario.budget * 1000:.0f}ms")
+    finally:
+        bootstrap._probe_endpoint = original
+    known = bootstrap._known_endpoints(BOOK_KEY)
+    problems += [f"{endpoint} still in the endpoint book" for endpoint in scenario.forgotten if endpoint in known]
+    return "; ".join(dict.fromkeys(problems))
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory(prefix="kumiho-endpoints-") as tmp:
+        os.environ["KUMIHO_CLAUDE_HOME"] = tmp
+        os.environ["KUMIHO_CLAUDE_ENDPOINT_PROBE"] = "tcp"
+        os.environ["KUMIHO_CLAUDE_ENDPOINT_PROBE_TIMEOUT"] = str(PROBE_TIMEOUT)
+        failures = 0
+        for scenario in SCENARIOS:
+            detail = _run_scenario(scenario)
+            print(f"{scenario.name:<34} {'FAIL' if detail else 'PASS'}")
+            if detail:
+                failures += 1
+                print(f"  {detail}")
+    if failures:
+        print(f"FAIL: {failures} of {len(SCENARIOS)} scenario(s) failed", file=sys.stderr)
+        return 1
+    print(f"PASS: {len(SCENARIOS)} scenario(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())